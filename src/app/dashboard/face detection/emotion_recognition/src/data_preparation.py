@@ -3,29 +3,70 @@ Data Preparation Script for Facial Emotion Recognition
 
 This script:
 1. Downloads the FER2013 dataset (if not already downloaded)
-2. Preprocesses the images (face detection, cropping, resizing, normalization)
-3. Splits the data into training, validation, and testing sets
-4. Saves the preprocessed data for later use
+2. Drops duplicate images found with a perceptual hash index
+3. Preprocesses the images (face detection, cropping, resizing)
+4. Splits the data into training, validation, and testing sets, keeping
+   near-duplicate images in the same set
+5. Saves the preprocessed data as uint8 arrays that are normalized when loaded
+
+Each step runs as a pipeline stage whose outputs are cached, so only the
+stages affected by a change run again (see --list-stages and --rebuild).
+
+Heavy libraries (pandas, scikit-learn, matplotlib, MediaPipe and the Kaggle
+API, which authenticates on import) are imported by the functions that use
+them, so --help and the lighter modes start quickly.
 """
 
+from startup_timer import report_startup
 import os
 import numpy as np
-import pandas as pd
 import cv2
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
 from tqdm import tqdm
-import urllib.request
-import zipfile
-import kaggle
-import mediapipe as mp
+import argparse
+import json
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+from multiprocessing import shared_memory
+from processed_store import (
+    save_store, save_splits, open_store, load_manifest, finalize_store, resume_store, run_fingerprint,
+    load_split_indices, save_clusters, load_clusters
+)
+from detection_cache import DetectionCache, image_keys, NO_FACE, KEY_SIZE
+from pipeline import Pipeline, Stage
+from perceptual_hash import dhash, HashIndex
 
 # Define constants
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
 FER_DATASET_PATH = os.path.join(DATA_DIR, 'fer2013.csv')
 PROCESSED_DATA_PATH = os.path.join(DATA_DIR, 'processed')
+DETECTION_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'detections')
+PIPELINE_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'stages')
 IMAGE_SIZE = 48  # FER2013 images are 48x48 pixels
+DEFAULT_SHARD_SIZE = 512  # Images handed to a preprocessing worker at a time
+DEFAULT_SPLIT_SEED = 42
+DEFAULT_CHUNK_SIZE = 4096  # CSV rows per chunk in streaming mode
+IMAGE_FOLDER_SPLITS = ('train', 'test')  # Folders of the Kaggle image layout
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+DEFAULT_HASH_RADIUS = 4  # Max dHash distance between near-duplicate images
+PIPELINE_STAGES = ('decode', 'dedupe', 'detect', 'crop', 'split', 'save')
+ALIGNMENT_MODES = ('auto', 'detect', 'prealigned')
+
+# Auto alignment (opt-in): 48x48 inputs are only treated as tight face crops
+# (and face detection is skipped) when the detector finds a face in most of
+# a sample of them and those faces fill nearly the whole frame. OpenCV's
+# minimum face size alone already covers 39% of a 48x48 frame, so the
+# coverage bar has to sit well above that.
+ALIGNMENT_PROBE_SIZE = 256
+ALIGNMENT_MIN_DETECTION_RATE = 0.8
+ALIGNMENT_MIN_COVERAGE = 0.7
+
+# Face detection parameters
+OPENCV_PARAMS = {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)}
+MEDIAPIPE_PARAMS = {'min_detection_confidence': 0.5}
+DETECTOR_PARAMS = {'opencv': OPENCV_PARAMS, 'mediapipe': MEDIAPIPE_PARAMS}
 
 # Ensure directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -54,6 +95,7 @@ def download_dataset():
     print("Downloading FER2013 dataset from Kaggle...")
     try:
         # Using Kaggle API (requires kaggle.json credentials)
+        import kaggle
         kaggle.api.authenticate()
         kaggle.api.dataset_download_files('msambare/fer2013', path=DATA_DIR, unzip=True)
         print("Dataset downloaded successfully!")
@@ -75,6 +117,7 @@ def load_data():
         download_dataset()
     
     print("Loading dataset...")
+    import pandas as pd
     try:
         data = pd.read_csv(FER_DATASET_PATH)
         print(f"Dataset loaded successfully! Shape: {data.shape}")
@@ -83,168 +126,546 @@ def load_data():
         print(f"Error loading dataset: {e}")
         return None
 
-def preprocess_with_opencv(data):
+def decode_pixels(pixels, block_size=4096):
     """
-    Preprocess the dataset using OpenCV's face detection
+    Decode the FER2013 'pixels' column into a single uint8 image array
+    
+    The space-separated pixel strings are parsed block by block with
+    numpy's C parser straight into a preallocated output array, instead of
+    splitting and converting every pixel in Python.
     
     Args:
-        data (pandas.DataFrame): The dataset to preprocess
+        pixels (pandas.Series or list): Space-separated pixel strings
+        block_size (int): Number of rows parsed per vectorized pass
         
     Returns:
-        tuple: (X_train, y_train, X_val, y_val, X_test, y_test)
+        numpy.ndarray: Images of shape (N, 48, 48) with dtype uint8
     """
-    print("Preprocessing data with OpenCV...")
+    pixels = list(pixels)
+    images = np.empty((len(pixels), IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8)
+    flat = images.reshape(len(pixels), IMAGE_SIZE * IMAGE_SIZE)
     
-    # Load face cascade classifier
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
-    # Initialize arrays for processed images and labels
-    X = []
-    y = []
-    
-    # Process each image in the dataset
-    for i, row in tqdm(data.iterrows(), total=data.shape[0], desc="Processing images"):
-        emotion = row['emotion']
-        pixels = row['pixels'].split()
-        pixels = np.array([int(pixel) for pixel in pixels], dtype=np.uint8)
-        img = pixels.reshape((IMAGE_SIZE, IMAGE_SIZE))
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(
-            img,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+    for start in range(0, len(pixels), block_size):
+        block = pixels[start:start + block_size]
+        values = np.fromstring(' '.join(block), dtype=np.uint8, sep=' ')
+        if values.size != len(block) * IMAGE_SIZE * IMAGE_SIZE:
+            raise ValueError(
+                f"Rows {start}-{start + len(block) - 1} do not contain "
+                f"{IMAGE_SIZE * IMAGE_SIZE} pixels each"
+            )
+        flat[start:start + len(block)] = values.reshape(len(block), -1)
+    
+    return images
+
+def create_detector(method):
+    """
+    Create a face detector for the given preprocessing method
+    
+    Args:
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        
+    Returns:
+        The OpenCV CascadeClassifier or MediaPipe FaceDetection instance
+    """
+    if method == 'mediapipe':
+        import mediapipe as mp
+        mp_face_detection = mp.solutions.face_detection
+        return mp_face_detection.FaceDetection(**MEDIAPIPE_PARAMS)
+    
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+def detect_face(img, detector, method):
+    """
+    Detect the first face in a grayscale image
+    
+    Args:
+        img (numpy.ndarray): Grayscale uint8 image
+        detector: Detector returned by create_detector
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        
+    Returns:
+        tuple: (x, y, w, h) of the first detected face, or None
+    """
+    if method == 'mediapipe':
+        # Convert to RGB for MediaPipe (it expects RGB images)
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        results = detector.process(img_rgb)
+        if not results.detections:
+            return None
         
-        # If a face is detected, crop to the face region
-        if len(faces) > 0:
-            x, y_coord, w, h = faces[0]
-            face_img = img[y_coord:y_coord+h, x:x+w]
-            # Resize to standard size
-            face_img = cv2.resize(face_img, (IMAGE_SIZE, IMAGE_SIZE))
-        else:
-            # If no face is detected, use the original image
-            face_img = img
+        bboxC = results.detections[0].location_data.relative_bounding_box
         
-        # Normalize pixel values to [0, 1]
-        face_img = face_img / 255.0
+        # Convert relative coordinates to absolute
+        h, w, _ = img_rgb.shape
+        x = int(bboxC.xmin * w)
+        y = int(bboxC.ymin * h)
+        width = int(bboxC.width * w)
+        height = int(bboxC.height * h)
         
-        X.append(face_img)
-        y.append(emotion)
+        # Ensure coordinates are within image boundaries
+        x = max(0, x)
+        y = max(0, y)
+        width = min(width, w - x)
+        height = min(height, h - y)
+        return x, y, width, height
     
-    # Convert lists to numpy arrays
-    X = np.array(X)
-    y = np.array(y)
+    faces = detector.detectMultiScale(img, **OPENCV_PARAMS)
+    if len(faces) == 0:
+        return None
+    x, y, w, h = faces[0]
+    return int(x), int(y), int(w), int(h)
+
+def crop_face(img, box):
+    """
+    Crop a detected face and resize it back to the standard size
     
-    # Reshape images to include channel dimension (grayscale = 1 channel)
-    X = X.reshape(X.shape[0], IMAGE_SIZE, IMAGE_SIZE, 1)
+    Args:
+        img (numpy.ndarray): Grayscale uint8 image
+        box (tuple): (x, y, w, h) face box, or None to keep the whole image
+        
+    Returns:
+        numpy.ndarray: uint8 image of shape (48, 48)
+    """
+    if box is None or box[0] < 0:
+        # If no face is detected, use the original image
+        return img
     
-    # Split data into training, validation, and testing sets (70%, 15%, 15%)
-    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=42)
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=42)
+    x, y, w, h = box
+    return cv2.resize(img[y:y+h, x:x+w], (IMAGE_SIZE, IMAGE_SIZE))
+
+def crop_faces(images, boxes):
+    """
+    Crop and resize the face of every image given its detected box
     
-    print(f"Training set: {X_train.shape[0]} samples")
-    print(f"Validation set: {X_val.shape[0]} samples")
-    print(f"Testing set: {X_test.shape[0]} samples")
+    Args:
+        images (numpy.ndarray): uint8 images of shape (N, 48, 48)
+        boxes (numpy.ndarray): Face boxes of shape (N, 4), NO_FACE for misses
+        
+    Returns:
+        numpy.ndarray: Cropped uint8 faces of shape (N, 48, 48)
+    """
+    faces = np.empty(images.shape, dtype=np.uint8)
+    for i in range(len(images)):
+        faces[i] = crop_face(images[i], boxes[i])
+    return faces
+
+def _detect_range(images, boxes, detector, method):
+    """Run face detection over images, writing the boxes into boxes"""
+    for i in range(len(images)):
+        box = detect_face(images[i], detector, method)
+        boxes[i] = NO_FACE if box is None else box
+
+# Per-process state for the preprocessing pool, set by _init_worker
+_worker_state = {}
+
+def _init_worker(method):
+    """
+    Load the detector of a preprocessing pool worker
+    """
+    # Single-threaded OpenCV per process avoids oversubscribing the cores
+    cv2.setNumThreads(1)
+    _worker_state.update(method=method, detector=create_detector(method))
+
+def _process_shard(images_name, boxes_name, num_images, start, stop):
+    """
+    Detect the faces of one shard of a shared image buffer in a pool worker
+    """
+    images_shm = shared_memory.SharedMemory(name=images_name)
+    boxes_shm = shared_memory.SharedMemory(name=boxes_name)
+    try:
+        images = np.ndarray((num_images, IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8, buffer=images_shm.buf)
+        boxes = np.ndarray((num_images, 4), dtype=np.int32, buffer=boxes_shm.buf)
+        _detect_range(images[start:stop], boxes[start:stop], _worker_state['detector'], _worker_state['method'])
+        del images, boxes
+    finally:
+        images_shm.close()
+        boxes_shm.close()
+    return stop - start
+
+def create_detection_pool(method, workers):
+    """
+    Start a pool of detection worker processes
     
-    return X_train, y_train, X_val, y_val, X_test, y_test
+    Args:
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        workers (int): Number of worker processes
+        
+    Returns:
+        ProcessPoolExecutor: Pool whose workers each hold their own detector
+    """
+    # Spawned workers: MediaPipe and TensorFlow state is not fork-safe
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(method,)
+    )
 
-def preprocess_with_mediapipe(data):
+def detect_faces(images, method="opencv", workers=1, shard_size=DEFAULT_SHARD_SIZE, executor=None):
     """
-    Preprocess the dataset using MediaPipe's face detection
+    Detect the face box in every image
+    
+    With more than one worker the image array is copied into shared memory
+    and split into shards that are processed by a ProcessPoolExecutor. Every
+    worker loads its own detector and writes its boxes straight into a shared
+    output buffer, so the result is identical to the serial path.
     
     Args:
-        data (pandas.DataFrame): The dataset to preprocess
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        workers (int): Number of worker processes (1 runs serially)
+        shard_size (int): Number of images handed to a worker at a time
+        executor (ProcessPoolExecutor): Pool from create_detection_pool to
+            reuse across calls; a pool is started for this call if not given
         
     Returns:
-        tuple: (X_train, y_train, X_val, y_val, X_test, y_test)
+        numpy.ndarray: int32 face boxes (x, y, w, h) of shape (N, 4), NO_FACE for misses
     """
-    print("Preprocessing data with MediaPipe...")
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    num_images = len(images)
     
-    # Initialize MediaPipe face detection
-    mp_face_detection = mp.solutions.face_detection
-    face_detection = mp_face_detection.FaceDetection(min_detection_confidence=0.5)
+    if executor is None and (workers <= 1 or num_images <= shard_size):
+        boxes = np.empty((num_images, 4), dtype=np.int32)
+        detector = create_detector(method)
+        # Match the thread setting of the pool workers
+        num_threads = cv2.getNumThreads()
+        cv2.setNumThreads(1)
+        try:
+            for start in tqdm(range(0, num_images, shard_size), desc="Processing shards"):
+                stop = min(start + shard_size, num_images)
+                _detect_range(images[start:stop], boxes[start:stop], detector, method)
+        finally:
+            cv2.setNumThreads(num_threads)
+        return boxes
     
-    # Initialize arrays for processed images and labels
-    X = []
-    y = []
+    if num_images == 0:
+        return np.empty((0, 4), dtype=np.int32)
     
-    # Process each image in the dataset
-    for i, row in tqdm(data.iterrows(), total=data.shape[0], desc="Processing images"):
-        emotion = row['emotion']
-        pixels = row['pixels'].split()
-        pixels = np.array([int(pixel) for pixel in pixels], dtype=np.uint8)
-        img = pixels.reshape((IMAGE_SIZE, IMAGE_SIZE))
+    images_shm = shared_memory.SharedMemory(create=True, size=images.nbytes)
+    boxes_shm = shared_memory.SharedMemory(create=True, size=num_images * 4 * 4)
+    owns_executor = executor is None
+    try:
+        shared_images = np.ndarray(images.shape, dtype=np.uint8, buffer=images_shm.buf)
+        shared_images[:] = images
+        del shared_images
         
-        # Convert to RGB for MediaPipe (it expects RGB images)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        if owns_executor:
+            executor = create_detection_pool(method, workers)
+        futures = [
+            executor.submit(
+                _process_shard,
+                images_shm.name, boxes_shm.name, num_images,
+                start, min(start + shard_size, num_images)
+            )
+            for start in range(0, num_images, shard_size)
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing shards (pool)"):
+            future.result()
         
-        # Detect faces
-        results = face_detection.process(img_rgb)
+        boxes = np.ndarray((num_images, 4), dtype=np.int32, buffer=boxes_shm.buf).copy()
+    finally:
+        if owns_executor and executor is not None:
+            executor.shutdown()
+        images_shm.close()
+        images_shm.unlink()
+        boxes_shm.close()
+        boxes_shm.unlink()
+    
+    return boxes
+
+def detect_boxes(images, method="opencv", workers=1, shard_size=DEFAULT_SHARD_SIZE, use_cache=True,
+                 cache=None, executor=None):
+    """
+    Detect the face box in every image, reusing cached results
+    
+    Face boxes are cached on disk under a hash of each image's pixels and the
+    detector parameters, so detection only runs on images that have not been
+    seen with the same detector configuration before.
+    
+    Args:
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        workers (int): Number of worker processes (1 runs serially)
+        shard_size (int): Number of images handed to a worker at a time
+        use_cache (bool): Whether to use the detection cache
+        cache (DetectionCache): Open cache to use; the caller saves it.
+            If not given, the cache is opened and saved by this call
+        executor (ProcessPoolExecutor): Optional pool reused across calls
         
-        # If a face is detected, crop to the face region
-        if results.detections:
-            detection = results.detections[0]  # Get the first detected face
-            bboxC = detection.location_data.relative_bounding_box
-            
-            # Convert relative coordinates to absolute
-            h, w, _ = img_rgb.shape
-            x = int(bboxC.xmin * w)
-            y_coord = int(bboxC.ymin * h)
-            width = int(bboxC.width * w)
-            height = int(bboxC.height * h)
-            
-            # Ensure coordinates are within image boundaries
-            x = max(0, x)
-            y_coord = max(0, y_coord)
-            width = min(width, w - x)
-            height = min(height, h - y_coord)
-            
-            # Crop the face
-            face_img = img[y_coord:y_coord+height, x:x+width]
-            
-            # Resize to standard size
-            face_img = cv2.resize(face_img, (IMAGE_SIZE, IMAGE_SIZE))
-        else:
-            # If no face is detected, use the original image
-            face_img = img
+    Returns:
+        numpy.ndarray: int32 face boxes (x, y, w, h) of shape (N, 4), NO_FACE for misses
+    """
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    
+    if not use_cache:
+        return detect_faces(images, method, workers, shard_size, executor)
+    
+    owns_cache = cache is None
+    if owns_cache:
+        cache = DetectionCache(DETECTION_CACHE_DIR, method, DETECTOR_PARAMS[method])
+    keys = image_keys(images, cache.fingerprint)
+    boxes, hits = cache.lookup(keys)
+    
+    misses = np.flatnonzero(~hits)
+    print(f"Detection cache: {len(images) - len(misses)} hits, {len(misses)} misses")
+    if len(misses) > 0:
+        boxes[misses] = detect_faces(images[misses], method, workers, shard_size, executor)
+        cache.update(keys[misses], boxes[misses])
+        if owns_cache:
+            cache.save()
+    
+    return boxes
+
+def detect_and_crop(images, method="opencv", workers=1, shard_size=DEFAULT_SHARD_SIZE, use_cache=True):
+    """
+    Detect, crop and resize the face in every image
+    
+    Args:
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        method (str): Preprocessing method ('opencv' or 'mediapipe')
+        workers (int): Number of worker processes (1 runs serially)
+        shard_size (int): Number of images handed to a worker at a time
+        use_cache (bool): Whether to use the detection cache
         
-        # Normalize pixel values to [0, 1]
-        face_img = face_img / 255.0
+    Returns:
+        numpy.ndarray: Cropped uint8 faces of shape (N, 48, 48)
+    """
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    boxes = detect_boxes(images, method, workers, shard_size, use_cache)
+    return crop_faces(images, boxes)
+
+def probe_alignment(images, method="opencv", sample_size=ALIGNMENT_PROBE_SIZE, seed=DEFAULT_SPLIT_SEED):
+    """
+    Run face detection on a sample of images to see if they are face crops
+    
+    Args:
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        method (str): Face detection method ('opencv' or 'mediapipe')
+        sample_size (int): Number of images probed
+        seed (int): Random seed for choosing the sample
+        
+    Returns:
+        dict: Sample size, detection rate and median fraction of the frame
+            covered by the detected faces
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(images), min(sample_size, len(images)), replace=False))
+    boxes = detect_faces(np.ascontiguousarray(images[sample], dtype=np.uint8), method)
+    
+    found = boxes[:, 0] >= 0
+    coverage = boxes[found, 2] * boxes[found, 3] / float(IMAGE_SIZE * IMAGE_SIZE)
+    return {
+        'sample_size': int(len(sample)),
+        'detection_rate': float(found.mean()) if len(sample) else 0.0,
+        'coverage': float(np.median(coverage)) if found.any() else 0.0,
+    }
+
+def resolve_alignment(images, method="opencv", mode="detect", native_size=True):
+    """
+    Decide whether face detection runs or the images are used as they are
+    
+    Args:
+        images (numpy.ndarray): Decoded uint8 images (or a sample of them)
+        method (str): Face detection method ('opencv' or 'mediapipe')
+        mode (str): 'detect' always runs detection, 'prealigned' always
+            skips it and 'auto' probes the images
+        native_size (bool): Whether the images were already 48x48 before decoding
+        
+    Returns:
+        dict: Alignment record for the manifest with the mode, the chosen
+            path ('detect' or 'prealigned') and the probe results
+    """
+    if mode not in ALIGNMENT_MODES:
+        raise ValueError(f"Unknown alignment mode: {mode}")
+    
+    probe = None
+    if mode == 'auto':
+        probe = probe_alignment(images, method)
+        probe['native_size'] = bool(native_size)
+        prealigned = native_size and (
+            probe['detection_rate'] >= ALIGNMENT_MIN_DETECTION_RATE and
+            probe['coverage'] >= ALIGNMENT_MIN_COVERAGE
+        )
+        print(f"Alignment probe: {probe['detection_rate']:.1%} detected, "
+              f"median face coverage {probe['coverage']:.1%} over {probe['sample_size']} images")
+    else:
+        prealigned = mode == 'prealigned'
+    
+    path = 'prealigned' if prealigned else 'detect'
+    print(f"Face alignment: {path}" + (" (skipping face detection)" if prealigned else ""))
+    return {'mode': mode, 'path': path, 'probe': probe}
+
+def find_duplicates(images, radius=DEFAULT_HASH_RADIUS):
+    """
+    Find duplicate and near-duplicate images
+    
+    Images with identical pixels (same BLAKE2b content digest) are
+    duplicates and only the first of them is kept. A shared dHash alone does
+    not make a duplicate, since distinct faces can have the same perceptual
+    hash; the kept images are grouped into clusters of near-duplicates
+    (dHashes at most radius bits apart, identical ones included) so that
+    every cluster can be put in a single split.
+    
+    Args:
+        images (numpy.ndarray): uint8 images of shape (N, 48, 48) or (N, 48, 48, 1)
+        radius (int): Max Hamming distance between near-duplicate hashes
+        
+    Returns:
+        tuple: (keep, groups) indices of the kept images and the cluster id
+            of every kept image
+    """
+    return group_duplicates(*image_hashes(images), radius)
+
+def image_hashes(images):
+    """
+    Compute the content digest and dHash of every image
+    
+    Args:
+        images (numpy.ndarray): uint8 images of shape (N, 48, 48) or (N, 48, 48, 1)
+        
+    Returns:
+        tuple: (digests, hashes) BLAKE2b digests as void scalars of KEY_SIZE
+            bytes and uint64 dHashes, both of shape (N,)
+    """
+    # An empty detector fingerprint makes the cache key a plain content digest
+    digests = image_keys(images, '').view(f'V{KEY_SIZE}').ravel()
+    return digests, dhash(images)
+
+def group_duplicates(digests, hashes, radius=DEFAULT_HASH_RADIUS):
+    """
+    Drop duplicates and cluster near-duplicates from precomputed hashes
+    
+    Args:
+        digests (numpy.ndarray): Content digest of every image (from image_hashes)
+        hashes (numpy.ndarray): dHash of every image
+        radius (int): Max Hamming distance between near-duplicate hashes
+        
+    Returns:
+        tuple: (keep, groups) as returned by find_duplicates
+    """
+    _, first = np.unique(digests, return_index=True)
+    keep = np.sort(first)
+    groups = HashIndex(hashes[keep], radius).clusters()
+    
+    print(f"Dedupe: dropped {len(digests) - len(keep)} duplicate images, "
+          f"{len(keep)} left in {dedupe_info(len(digests), groups, radius)['clusters']} near-duplicate clusters")
+    return keep, groups
+
+def dedupe_info(num_inputs, groups, radius=DEFAULT_HASH_RADIUS):
+    """
+    Describe a deduplication for the manifest
+    
+    Args:
+        num_inputs (int): Number of images before deduplication
+        groups (numpy.ndarray): Cluster id of every kept image
+        radius (int): Max Hamming distance between near-duplicate hashes
+        
+    Returns:
+        dict: Hash type, radius and duplicate and cluster counts
+    """
+    return {
+        'exact_hash': 'blake2b',
+        'hash': 'dhash',
+        'radius': int(radius),
+        'input_samples': int(num_inputs),
+        'duplicates_dropped': int(num_inputs - len(groups)),
+        'clusters': int(groups.max()) + 1 if len(groups) else 0,
+    }
+
+def _stratified_split(items, labels, test_size, seed):
+    """Split items in two, stratified by label when every class is large enough"""
+    from sklearn.model_selection import train_test_split
+    try:
+        return train_test_split(items, test_size=test_size, random_state=seed, stratify=labels)
+    except ValueError:
+        # Some classes are too small to stratify (e.g. tiny samples)
+        return train_test_split(items, test_size=test_size, random_state=seed)
+
+def split_indices(labels, seed=DEFAULT_SPLIT_SEED, groups=None):
+    """
+    Build stratified train/val/test index arrays (70%, 15%, 15%)
+    
+    Only indices are produced, so the image array itself is never copied;
+    consumers index into the single stored image array instead.
+    
+    Args:
+        labels (numpy.ndarray): Emotion labels of shape (N,)
+        seed (int): Random seed for the split
+        groups (numpy.ndarray): Optional near-duplicate cluster id of every
+            sample; whole clusters are then assigned to a single split
         
-        X.append(face_img)
-        y.append(emotion)
+    Returns:
+        dict: Maps 'train', 'val' and 'test' to index arrays
+    """
+    labels = np.asarray(labels)
+    if groups is None:
+        items, item_labels = np.arange(len(labels)), labels
+    else:
+        # Split the clusters, stratified by the label of their first member
+        _, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+        items, item_labels = np.arange(len(first)), labels[first]
+    
+    train_idx, temp_idx = _stratified_split(items, item_labels, 0.3, seed)
+    val_idx, test_idx = _stratified_split(temp_idx, item_labels[temp_idx], 0.5, seed)
     
-    # Convert lists to numpy arrays
-    X = np.array(X)
-    y = np.array(y)
+    if groups is not None:
+        train_idx, val_idx, test_idx = (np.flatnonzero(np.isin(inverse, part)) for part in (train_idx, val_idx, test_idx))
     
-    # Reshape images to include channel dimension (grayscale = 1 channel)
-    X = X.reshape(X.shape[0], IMAGE_SIZE, IMAGE_SIZE, 1)
+    splits = {'train': train_idx, 'val': val_idx, 'test': test_idx}
     
-    # Split data into training, validation, and testing sets (70%, 15%, 15%)
-    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=42)
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=42)
+    print(f"Training set: {len(train_idx)} samples")
+    print(f"Validation set: {len(val_idx)} samples")
+    print(f"Testing set: {len(test_idx)} samples")
     
-    print(f"Training set: {X_train.shape[0]} samples")
-    print(f"Validation set: {X_val.shape[0]} samples")
-    print(f"Testing set: {X_test.shape[0]} samples")
+    return splits
+
+def preprocess_with_opencv(images, labels, workers=1, seed=DEFAULT_SPLIT_SEED, use_cache=True):
+    """
+    Preprocess the dataset using OpenCV's face detection
+    
+    Args:
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        labels (numpy.ndarray): Emotion labels of shape (N,)
+        workers (int): Number of worker processes (1 runs serially)
+        seed (int): Random seed for the train/val/test split
+        use_cache (bool): Whether to reuse cached face detection results
+        
+    Returns:
+        tuple: (faces, labels, splits)
+    """
+    print("Preprocessing data with OpenCV...")
+    faces = detect_and_crop(images, method="opencv", workers=workers, use_cache=use_cache)
+    return faces, np.asarray(labels), split_indices(labels, seed)
+
+def preprocess_with_mediapipe(images, labels, workers=1, seed=DEFAULT_SPLIT_SEED, use_cache=True):
+    """
+    Preprocess the dataset using MediaPipe's face detection
     
-    return X_train, y_train, X_val, y_val, X_test, y_test
+    Args:
+        images (numpy.ndarray): Decoded uint8 images of shape (N, 48, 48)
+        labels (numpy.ndarray): Emotion labels of shape (N,)
+        workers (int): Number of worker processes (1 runs serially)
+        seed (int): Random seed for the train/val/test split
+        use_cache (bool): Whether to reuse cached face detection results
+        
+    Returns:
+        tuple: (faces, labels, splits)
+    """
+    print("Preprocessing data with MediaPipe...")
+    faces = detect_and_crop(images, method="mediapipe", workers=workers, use_cache=use_cache)
+    return faces, np.asarray(labels), split_indices(labels, seed)
 
-def save_processed_data(X_train, y_train, X_val, y_val, X_test, y_test, method="opencv"):
+def save_processed_data(faces, labels, splits, method="opencv", seed=DEFAULT_SPLIT_SEED):
     """
-    Save the preprocessed data to disk
+    Save the preprocessed data to disk as uint8 pixels, int8 labels and
+    train/val/test index arrays
     
     Args:
-        X_train (numpy.ndarray): Training images
-        y_train (numpy.ndarray): Training labels
-        X_val (numpy.ndarray): Validation images
-        y_val (numpy.ndarray): Validation labels
-        X_test (numpy.ndarray): Testing images
-        y_test (numpy.ndarray): Testing labels
+        faces (numpy.ndarray): Cropped uint8 faces of shape (N, 48, 48)
+        labels (numpy.ndarray): Emotion labels of shape (N,)
+        splits (dict): Maps split name to an array of indices into faces
         method (str): Preprocessing method used ('opencv' or 'mediapipe')
+        seed (int): Random seed the splits were built with
     """
     print(f"Saving preprocessed data ({method})...")
     
@@ -252,16 +673,417 @@ def save_processed_data(X_train, y_train, X_val, y_val, X_test, y_test, method="
     method_dir = os.path.join(PROCESSED_DATA_PATH, method)
     os.makedirs(method_dir, exist_ok=True)
     
-    # Save arrays
-    np.save(os.path.join(method_dir, 'X_train.npy'), X_train)
-    np.save(os.path.join(method_dir, 'y_train.npy'), y_train)
-    np.save(os.path.join(method_dir, 'X_val.npy'), X_val)
-    np.save(os.path.join(method_dir, 'y_val.npy'), y_val)
-    np.save(os.path.join(method_dir, 'X_test.npy'), X_test)
-    np.save(os.path.join(method_dir, 'y_test.npy'), y_test)
+    # Save arrays and the manifest describing them
+    save_store(method_dir, faces, labels, splits, method=method, split_info={'seed': seed})
+    
+    print(f"Data saved to {method_dir}")
+
+def resplit_processed_data(method="opencv", seed=DEFAULT_SPLIT_SEED):
+    """
+    Rebuild the train/val/test splits of already preprocessed data
+    
+    Only the labels (and near-duplicate clusters) are read, so a new split
+    seed does not require running face detection again.
+    
+    Args:
+        method (str): Preprocessing method used ('opencv' or 'mediapipe')
+        seed (int): Random seed for the new split
+    """
+    method_dir = os.path.join(PROCESSED_DATA_PATH, method)
+    _, labels, manifest = open_store(method_dir)
+    clusters = load_clusters(method_dir, manifest)
+    
+    print(f"Re-splitting {method_dir} with seed {seed}...")
+    if clusters is None:
+        splits = split_indices(labels, seed)
+    else:
+        # Dropped duplicates stay out of every split
+        keep = np.flatnonzero(clusters >= 0)
+        splits = {name: keep[idx] for name, idx in split_indices(labels[keep], seed, clusters[keep]).items()}
+    # The splits no longer match the pipeline's split stage, so the next
+    # pipeline run has to save the store again
+    manifest.pop('pipeline_fingerprint', None)
+    save_splits(method_dir, splits, manifest, seed=seed)
+    print(f"Splits saved to {method_dir}")
+
+def count_csv_rows(path, block_size=1 << 24):
+    """
+    Count the data rows of a CSV file without parsing it
+    
+    Args:
+        path (str): Path of the CSV file (with a header line)
+        block_size (int): Bytes read at a time
+        
+    Returns:
+        int: Number of data rows
+    """
+    lines = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            lines += block.count(b'\n')
+            last_byte = block[-1:]
+    
+    # Count a final line without a trailing newline, then drop the header
+    if last_byte != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+def stream_preprocess(method="opencv", chunk_size=DEFAULT_CHUNK_SIZE, workers=1, use_cache=True,
+                      seed=DEFAULT_SPLIT_SEED, csv_path=FER_DATASET_PATH, alignment="detect",
+                      dedupe=True, hash_radius=DEFAULT_HASH_RADIUS):
+    """
+    Preprocess the dataset in fixed-size chunks straight into the store
+    
+    The CSV is read chunk by chunk; every chunk is decoded, run through face
+    detection and written into the memory-mapped output store before the
+    next one is read. Peak memory therefore depends on the chunk size, not
+    on the size of the dataset.
+    
+    Each finished chunk is committed as a shard in a progress file, so an
+    interrupted run started again with the same settings skips the shards
+    that are already on disk.
+    
+    Every decoded chunk is hashed before face detection, exactly like the
+    dedupe stage of the pipeline hashes the decoded images, so both modes
+    find the same duplicates and clusters. Rows repeating an earlier row are
+    not run through detection and are left out of the splits. Only the
+    hashes of every row are kept in memory.
+    
+    Args:
+        method (str): Face detection method ('opencv' or 'mediapipe')
+        chunk_size (int): Number of CSV rows processed at a time
+        workers (int): Number of detection worker processes
+        use_cache (bool): Whether to reuse cached face detection results
+        seed (int): Random seed for the train/val/test split
+        csv_path (str): Path of the dataset CSV
+        alignment (str): Alignment mode ('auto', 'detect' or 'prealigned')
+        dedupe (bool): Whether to leave duplicates out and keep near-duplicate
+            clusters within one split
+        hash_radius (int): Max Hamming distance between near-duplicate hashes
+    """
+    import pandas as pd
+    if not os.path.exists(csv_path):
+        download_dataset()
+    
+    num_samples = count_csv_rows(csv_path)
+    method_dir = os.path.join(PROCESSED_DATA_PATH, method)
+    print(f"Streaming {num_samples} rows from {csv_path} in chunks of {chunk_size}...")
+    
+    # Decide from the first chunk whether face detection is needed at all
+    first_chunk = pd.read_csv(csv_path, usecols=['pixels'], nrows=chunk_size)
+    align = resolve_alignment(decode_pixels(first_chunk['pixels']), method, alignment)
+    prealigned = align['path'] == 'prealigned'
+    
+    fingerprint = run_fingerprint({
+        'source': dataset_source_params(csv_path),
+        'method': method,
+        'detector': DETECTOR_PARAMS[method],
+        'alignment': align['path'],
+        'chunk_size': chunk_size,
+        'dedupe': dedupe,
+    })
+    images, labels, progress = resume_store(method_dir, num_samples, fingerprint)
+    if len(progress) > 0:
+        print(f"Resuming: {len(progress)} shard(s) already completed")
+    
+    cache = DetectionCache(DETECTION_CACHE_DIR, method, DETECTOR_PARAMS[method]) if use_cache and not prealigned else None
+    executor = create_detection_pool(method, workers) if workers > 1 and not prealigned else None
+    
+    if dedupe:
+        digests = np.empty(num_samples, dtype=f'V{KEY_SIZE}')
+        hashes = np.empty(num_samples, dtype=np.uint64)
+        seen = set()
+    
+    position = 0
+    try:
+        chunks = pd.read_csv(csv_path, usecols=['emotion', 'pixels'], chunksize=chunk_size)
+        for chunk in tqdm(chunks, total=int(np.ceil(num_samples / chunk_size)), desc="Processing chunks"):
+            end = position + len(chunk)
+            if end > num_samples:
+                raise ValueError(f"{csv_path} has more rows than the {num_samples} counted")
+            
+            done = progress.is_done(position, end)
+            if dedupe or not done:
+                chunk_images = decode_pixels(chunk['pixels'])
+            
+            # Hash the decoded rows (also of finished shards) to know which are new
+            new = np.ones(len(chunk), dtype=bool)
+            if dedupe:
+                digests[position:end], hashes[position:end] = image_hashes(chunk_images)
+                for i, digest in enumerate(digests[position:end]):
+                    key = digest.tobytes()
+                    new[i] = key not in seen
+                    seen.add(key)
+            
+            if not done:
+                if prealigned:
+                    images[position:end, :, :, 0] = chunk_images
+                else:
+                    # Duplicates keep their uncropped pixels; they are in no split
+                    boxes = np.full((len(chunk), 4), NO_FACE, dtype=np.int32)
+                    if new.any():
+                        boxes[new] = detect_boxes(chunk_images[new], method, workers, use_cache=use_cache,
+                                                  cache=cache, executor=executor)
+                    images[position:end, :, :, 0] = crop_faces(chunk_images, boxes)
+                labels[position:end] = chunk['emotion'].to_numpy()
+                progress.commit(position, end, images, labels)
+            position = end
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.save()
+    
+    if position != num_samples:
+        raise ValueError(f"Expected {num_samples} rows in {csv_path}, read {position}")
+    
+    images.flush()
+    labels.flush()
+    
+    dedupe_record = None
+    if dedupe:
+        keep, groups = group_duplicates(digests, hashes, hash_radius)
+        clusters = np.full(num_samples, -1, dtype=np.int64)
+        clusters[keep] = groups
+        dedupe_record = dict(dedupe_info(num_samples, groups, hash_radius), file=save_clusters(method_dir, clusters))
+        splits = {name: keep[idx] for name, idx in split_indices(np.asarray(labels)[keep], seed, groups).items()}
+    else:
+        splits = split_indices(np.asarray(labels), seed)
+    del images
+    
+    finalize_store(method_dir, num_samples, splits, method=method, split_info={'seed': seed},
+                   ingestion='stream', alignment=align, dedupe=dedupe_record)
+    print(f"Data saved to {method_dir}")
+
+def find_image_folders(root=DATA_DIR):
+    """
+    List the images of the folder-of-PNG FER2013 layout
+    
+    The Kaggle download unzips to <root>/train/<emotion>/*.png and
+    <root>/test/<emotion>/*.png; labels are taken from the emotion folders.
+    
+    Args:
+        root (str): Directory holding the train and test folders
+        
+    Returns:
+        tuple: (paths, labels, folders) where folders gives the top-level
+            folder ('train' or 'test') of every image
+    """
+    label_ids = {name.lower(): label for label, name in EMOTIONS.items()}
+    paths, labels, folders = [], [], []
+    
+    for folder in IMAGE_FOLDER_SPLITS:
+        folder_dir = os.path.join(root, folder)
+        if not os.path.isdir(folder_dir):
+            continue
+        for emotion in sorted(os.listdir(folder_dir)):
+            emotion_dir = os.path.join(folder_dir, emotion)
+            if not os.path.isdir(emotion_dir):
+                continue
+            if emotion.lower() not in label_ids:
+                print(f"Skipping unknown emotion folder: {emotion_dir}")
+                continue
+            for name in sorted(os.listdir(emotion_dir)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(emotion_dir, name))
+                    labels.append(label_ids[emotion.lower()])
+                    folders.append(folder)
+    
+    return paths, np.array(labels, dtype=np.int8), np.array(folders)
+
+def has_image_folders(root=DATA_DIR):
+    """
+    Check whether the folder-of-PNG FER2013 layout is present
+    
+    Args:
+        root (str): Directory holding the train and test folders
+        
+    Returns:
+        bool: True if a train folder exists
+    """
+    return os.path.isdir(os.path.join(root, IMAGE_FOLDER_SPLITS[0]))
+
+def _decode_image_files(paths, out):
+    """Decode grayscale image files into out, resizing them if needed"""
+    resized = 0
+    for i, path in enumerate(paths):
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Could not decode image: {path}")
+        if img.shape != (IMAGE_SIZE, IMAGE_SIZE):
+            img = cv2.resize(img, (IMAGE_SIZE, IMAGE_SIZE))
+            resized += 1
+        out[i] = img
+    return resized
+
+def decode_image_files(paths, out, threads=None, batch_size=256):
+    """
+    Decode image files into a preallocated array with a thread pool
+    
+    cv2.imdecode and file reads release the GIL, so threads decode in
+    parallel without the copies a process pool would need.
+    
+    Args:
+        paths (list): Image file paths
+        out (numpy.ndarray): uint8 array of shape (N, 48, 48) to fill (may be a memory map view)
+        threads (int): Number of decoding threads (defaults to the CPU count)
+        batch_size (int): Number of files decoded per task
+        
+    Returns:
+        int: Number of images that were not 48x48 and had to be resized
+    """
+    threads = threads or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(_decode_image_files, paths[start:start + batch_size], out[start:start + batch_size])
+            for start in range(0, len(paths), batch_size)
+        ]
+        return sum(future.result() for future in tqdm(as_completed(futures), total=len(futures), desc="Decoding images"))
+
+def ingest_image_folders(method="opencv", root=DATA_DIR, workers=1, threads=None, use_cache=True,
+                         seed=DEFAULT_SPLIT_SEED, chunk_size=DEFAULT_CHUNK_SIZE, alignment="detect",
+                         dedupe=True, hash_radius=DEFAULT_HASH_RADIUS):
+    """
+    Preprocess the folder-of-PNG FER2013 layout straight into the store
+    
+    The images are decoded by a thread pool directly into the memory-mapped
+    output store; face detection then crops them in place chunk by chunk.
+    Each finished chunk is committed as a shard, so an interrupted run
+    resumes from the first incomplete one. The dataset's own test folder
+    becomes the test split and the train folder is split into training and
+    validation sets. Duplicates are left out of the splits, and train-folder
+    images with a near-duplicate in the test folder are dropped.
+    
+    Args:
+        method (str): Face detection method ('opencv' or 'mediapipe')
+        root (str): Directory holding the train and test folders
+        workers (int): Number of detection worker processes
+        threads (int): Number of image decoding threads
+        use_cache (bool): Whether to reuse cached face detection results
+        seed (int): Random seed for the train/validation split
+        chunk_size (int): Number of images passed to face detection at a time
+        alignment (str): Alignment mode ('auto', 'detect' or 'prealigned')
+        dedupe (bool): Whether to leave duplicates out and keep near-duplicate
+            clusters within one split
+        hash_radius (int): Max Hamming distance between near-duplicate hashes
+    """
+    paths, labels, folders = find_image_folders(root)
+    if not paths:
+        raise FileNotFoundError(f"No images found under {os.path.join(root, '{train,test}', '<emotion>')}")
+    
+    # Probe a sample of the files to decide whether face detection is needed
+    sample_images, native_size = None, True
+    if alignment == 'auto':
+        sample = np.sort(np.random.default_rng(seed).choice(len(paths), min(ALIGNMENT_PROBE_SIZE, len(paths)), replace=False))
+        sample_images = np.empty((len(sample), IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8)
+        native_size = decode_image_files([paths[i] for i in sample], sample_images, threads) == 0
+    align = resolve_alignment(sample_images, method, alignment, native_size=native_size)
+    prealigned = align['path'] == 'prealigned'
+    
+    method_dir = os.path.join(PROCESSED_DATA_PATH, method)
+    fingerprint = run_fingerprint({
+        'files': hashlib.sha256('\n'.join(paths).encode()).hexdigest(),
+        'method': method,
+        'detector': DETECTOR_PARAMS[method],
+        'alignment': align['path'],
+        'chunk_size': chunk_size,
+    })
+    images, store_labels, progress = resume_store(method_dir, len(paths), fingerprint)
+    if len(progress) > 0:
+        print(f"Resuming: {len(progress)} shard(s) already completed")
+    
+    print(f"Processing {len(paths)} images from {root}...")
+    decoded = 0
+    decode_time = 0.0
+    cache = DetectionCache(DETECTION_CACHE_DIR, method, DETECTOR_PARAMS[method]) if use_cache and not prealigned else None
+    executor = create_detection_pool(method, workers) if workers > 1 and not prealigned else None
+    try:
+        for start in range(0, len(paths), chunk_size):
+            stop = min(start + chunk_size, len(paths))
+            if progress.is_done(start, stop):
+                continue
+            
+            start_time = time.perf_counter()
+            decode_image_files(paths[start:stop], images[start:stop, :, :, 0], threads)
+            decode_time += time.perf_counter() - start_time
+            decoded += stop - start
+            
+            if not prealigned:
+                chunk = np.array(images[start:stop, :, :, 0])
+                boxes = detect_boxes(chunk, method, workers, use_cache=use_cache, cache=cache, executor=executor)
+                images[start:stop, :, :, 0] = crop_faces(chunk, boxes)
+            store_labels[start:stop] = labels[start:stop]
+            progress.commit(start, stop, images, store_labels)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.save()
+    
+    if decoded > 0:
+        print(f"Decoded {decoded} images in {decode_time:.2f} seconds ({decoded / max(decode_time, 1e-9):.0f} images/sec)")
+    
+    dedupe_record = None
+    clusters = np.arange(len(paths))
+    if dedupe:
+        # Hash the test folder first so its copy of a duplicate is the one kept
+        order = np.argsort(folders != 'test', kind='stable')
+        keep, groups = find_duplicates(images[:, :, :, 0][order], hash_radius)
+        clusters = np.full(len(paths), -1, dtype=np.int64)
+        clusters[order[keep]] = groups
+        dedupe_record = dict(dedupe_info(len(paths), groups, hash_radius), file=save_clusters(method_dir, clusters))
+    del images, store_labels
+    
+    # Keep the dataset's own test folder as the test split, and drop training
+    # images whose near-duplicate cluster reaches into it
+    test_idx = np.flatnonzero((folders == 'test') & (clusters >= 0))
+    in_test = np.isin(clusters, clusters[test_idx])
+    train_pool = np.flatnonzero((folders != 'test') & (clusters >= 0) & ~in_test)
+    if dedupe:
+        print(f"Dropped {np.count_nonzero((folders != 'test') & (clusters >= 0) & in_test)} training images "
+              f"with a near-duplicate in the test folder")
+    
+    _, first, inverse = np.unique(clusters[train_pool], return_index=True, return_inverse=True)
+    train_groups, val_groups = _stratified_split(np.arange(len(first)), labels[train_pool][first], 0.15, seed)
+    train_idx = train_pool[np.isin(inverse, train_groups)]
+    val_idx = train_pool[np.isin(inverse, val_groups)]
+    splits = {'train': train_idx, 'val': val_idx, 'test': test_idx}
+    
+    print(f"Training set: {len(train_idx)} samples")
+    print(f"Validation set: {len(val_idx)} samples")
+    print(f"Testing set: {len(test_idx)} samples")
     
+    finalize_store(method_dir, len(paths), splits, method=method, split_info={'seed': seed},
+                   ingestion='image_folders', alignment=align, dedupe=dedupe_record)
     print(f"Data saved to {method_dir}")
 
+def check_split_leakage(method="opencv", radius=DEFAULT_HASH_RADIUS):
+    """
+    Count validation and test images with a near-duplicate in the training set
+    
+    Args:
+        method (str): Preprocessing method used ('opencv' or 'mediapipe')
+        radius (int): Max Hamming distance between near-duplicate hashes
+        
+    Returns:
+        dict: Maps 'val' and 'test' to the number of leaked images
+    """
+    method_dir = os.path.join(PROCESSED_DATA_PATH, method)
+    images, _, manifest = open_store(method_dir)
+    splits = load_split_indices(method_dir, manifest)
+    
+    print(f"Hashing {len(images)} stored images...")
+    hashes = dhash(images)
+    index = HashIndex(hashes[splits['train']], radius)
+    
+    leaks = {}
+    for name in ('val', 'test'):
+        leaks[name] = sum(len(index.query(h)) > 0 for h in hashes[splits[name]])
+        print(f"{name}: {leaks[name]} of {len(splits[name])} images have a near-duplicate "
+              f"(radius {radius}) in the training set")
+    return leaks
+
 def visualize_samples(X, y, method, num_samples=5):
     """
     Visualize sample images from the preprocessed dataset
@@ -272,6 +1094,7 @@ def visualize_samples(X, y, method, num_samples=5):
         method (str): Preprocessing method used
         num_samples (int): Number of samples to visualize
     """
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(15, 3))
     plt.suptitle(f"Sample Images ({method} preprocessing)")
     
@@ -285,51 +1108,401 @@ def visualize_samples(X, y, method, num_samples=5):
     plt.savefig(os.path.join(PROCESSED_DATA_PATH, f'samples_{method}.png'))
     plt.close()
 
-def compare_methods(data):
+def box_iou(boxes_a, boxes_b):
     """
-    Compare OpenCV and MediaPipe face detection methods
+    Compute the intersection over union of paired face boxes
     
     Args:
-        data (pandas.DataFrame): The dataset to preprocess
+        boxes_a (numpy.ndarray): Boxes (x, y, w, h) of shape (N, 4)
+        boxes_b (numpy.ndarray): Boxes (x, y, w, h) of shape (N, 4)
+        
+    Returns:
+        numpy.ndarray: IoU of each pair of shape (N,)
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64)
+    
+    x1 = np.maximum(boxes_a[:, 0], boxes_b[:, 0])
+    y1 = np.maximum(boxes_a[:, 1], boxes_b[:, 1])
+    x2 = np.minimum(boxes_a[:, 0] + boxes_a[:, 2], boxes_b[:, 0] + boxes_b[:, 2])
+    y2 = np.minimum(boxes_a[:, 1] + boxes_a[:, 3], boxes_b[:, 1] + boxes_b[:, 3])
+    
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = boxes_a[:, 2] * boxes_a[:, 3] + boxes_b[:, 2] * boxes_b[:, 3] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def compare_methods(data, sample_size=1000):
     """
-    # Process a small subset of the data for comparison
-    sample_data = data.sample(n=min(1000, len(data)), random_state=42)
+    Compare every registered face detection method on the same sample
+    
+    The sample is decoded once and each detector runs over the same
+    in-memory batch. For every detector the detection rate and throughput
+    are reported, and for every pair of detectors the mean IoU of their
+    boxes on the images where both found a face.
     
-    # Process with OpenCV
-    X_train_cv, y_train_cv, X_val_cv, y_val_cv, X_test_cv, y_test_cv = preprocess_with_opencv(sample_data)
+    Args:
+        data (pandas.DataFrame): The dataset to sample from
+        sample_size (int): Number of images to compare on
+        
+    Returns:
+        dict: Per-detector 'detection_rate', 'images_per_sec' and 'iou' (mean IoU against each other detector)
+    """
+    sample_data = data.sample(n=min(sample_size, len(data)), random_state=42)
+    images = decode_pixels(sample_data['pixels'])
+    labels = sample_data['emotion'].to_numpy()
     
-    # Process with MediaPipe
-    X_train_mp, y_train_mp, X_val_mp, y_val_mp, X_test_mp, y_test_mp = preprocess_with_mediapipe(sample_data)
+    boxes = {}
+    results = {}
+    for method in DETECTOR_PARAMS:
+        print(f"Running {method} detection on {len(images)} images...")
+        detector = create_detector(method)
+        method_boxes = np.empty((len(images), 4), dtype=np.int32)
+        
+        # Time detection only, not detector start-up
+        start_time = time.perf_counter()
+        _detect_range(images, method_boxes, detector, method)
+        elapsed = time.perf_counter() - start_time
+        
+        boxes[method] = method_boxes
+        results[method] = {
+            'detection_rate': float(np.mean(method_boxes[:, 0] >= 0)),
+            'images_per_sec': len(images) / elapsed if elapsed > 0 else float('inf'),
+            'iou': {},
+        }
+        visualize_samples(crop_faces(images, method_boxes), labels, method)
     
-    # Visualize samples from both methods
-    visualize_samples(X_train_cv, y_train_cv, "OpenCV")
-    visualize_samples(X_train_mp, y_train_mp, "MediaPipe")
+    # Agreement between every pair of detectors
+    for method_a in boxes:
+        for method_b in boxes:
+            if method_a == method_b:
+                continue
+            both = (boxes[method_a][:, 0] >= 0) & (boxes[method_b][:, 0] >= 0)
+            iou = box_iou(boxes[method_a][both], boxes[method_b][both])
+            results[method_a]['iou'][method_b] = float(iou.mean()) if both.any() else float('nan')
     
     print("\nComparison of face detection methods:")
-    print(f"OpenCV detected faces: {len(X_train_cv) + len(X_val_cv) + len(X_test_cv)}")
-    print(f"MediaPipe detected faces: {len(X_train_mp) + len(X_val_mp) + len(X_test_mp)}")
+    print(f"{'Method':<10} {'Detected':>9} {'Images/sec':>11}  Mean IoU vs others")
+    for method, stats in results.items():
+        # Pairs without a face found by both detectors have no IoU
+        agreement = ', '.join(
+            f"{other}: {'n/a' if np.isnan(iou) else f'{iou:.3f}'}" for other, iou in stats['iou'].items()
+        )
+        print(f"{method:<10} {stats['detection_rate']:>8.1%} {stats['images_per_sec']:>11.1f}  {agreement or '-'}")
+    
+    return results
+
+def dataset_source_params(path=FER_DATASET_PATH):
+    """
+    Describe the source dataset file for the pipeline fingerprint
+    
+    Args:
+        path (str): Path of the dataset file
+        
+    Returns:
+        dict: Path, size and modification time of the file
+    """
+    if not os.path.exists(path):
+        return {'path': path, 'size': None, 'mtime_ns': None}
+    stat = os.stat(path)
+    return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def build_pipeline(method="opencv", seed=DEFAULT_SPLIT_SEED, workers=1, use_cache=True, alignment="detect",
+                   dedupe=True, hash_radius=DEFAULT_HASH_RADIUS):
+    """
+    Build the staged data preparation pipeline
+    
+    Stages: decode -> dedupe -> detect -> crop -> split -> save. Each stage's outputs
+    are cached under a fingerprint of its parameters and its inputs, so only
+    the stages affected by a change are run again. Normalization is not a
+    stage: pixels are stored as uint8 and normalized when they are loaded.
+    
+    Args:
+        method (str): Face detection method ('opencv' or 'mediapipe')
+        seed (int): Random seed for the train/val/test split
+        workers (int): Number of detection worker processes
+        use_cache (bool): Whether to reuse cached face detection results
+        alignment (str): Alignment mode ('auto', 'detect' or 'prealigned')
+        dedupe (bool): Whether to drop duplicates before face detection and
+            keep near-duplicate clusters within one split
+        hash_radius (int): Max Hamming distance between near-duplicate hashes
+        
+    Returns:
+        Pipeline: The data preparation pipeline
+    """
+    method_dir = os.path.join(PROCESSED_DATA_PATH, method)
+    
+    def run_decode(inputs, params):
+        data = load_data()
+        if data is None:
+            raise FileNotFoundError(f"Dataset not found at {FER_DATASET_PATH}")
+        print("Decoding pixels...")
+        return {
+            'images': decode_pixels(data['pixels']),
+            'labels': data['emotion'].to_numpy().astype(np.int8),
+        }
+    
+    def run_dedupe(inputs, params):
+        images = inputs['decode']['images']
+        if not params['enabled']:
+            return {'keep': np.arange(len(images)), 'groups': np.arange(len(images))}
+        keep, groups = find_duplicates(images, params['radius'])
+        return {'keep': keep, 'groups': groups}
+    
+    def run_detect(inputs, params):
+        images = inputs['decode']['images'][inputs['dedupe']['keep']]
+        align = resolve_alignment(images, method, params['alignment'])
+        record = np.frombuffer(json.dumps(align).encode(), dtype=np.uint8)
+        if align['path'] == 'prealigned':
+            return {'boxes': np.full((len(images), 4), -1, dtype=np.int32), 'alignment': record}
+        if not use_cache:
+            return {'boxes': detect_boxes(images, method, workers, use_cache=False), 'alignment': record}
+        
+        # Save the cache after every chunk so an interrupted run keeps its detections
+        boxes = np.empty((len(images), 4), dtype=np.int32)
+        cache = DetectionCache(DETECTION_CACHE_DIR, method, DETECTOR_PARAMS[method])
+        executor = create_detection_pool(method, workers) if workers > 1 else None
+        try:
+            for start in range(0, len(images), DEFAULT_CHUNK_SIZE):
+                stop = start + DEFAULT_CHUNK_SIZE
+                boxes[start:stop] = detect_boxes(images[start:stop], method, workers, cache=cache, executor=executor)
+                cache.save()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return {'boxes': boxes, 'alignment': record}
+    
+    def run_crop(inputs, params):
+        images = inputs['decode']['images'][inputs['dedupe']['keep']]
+        return {'faces': crop_faces(images, inputs['detect']['boxes'])}
+    
+    def run_split(inputs, params):
+        labels = inputs['decode']['labels'][inputs['dedupe']['keep']]
+        return split_indices(labels, params['seed'], inputs['dedupe']['groups'] if params['grouped'] else None)
+    
+    def run_save(inputs, params):
+        print(f"Saving preprocessed data ({method})...")
+        dedupe_record = None
+        if dedupe:
+            groups = inputs['dedupe']['groups']
+            os.makedirs(method_dir, exist_ok=True)
+            dedupe_record = dict(
+                dedupe_info(len(inputs['decode']['labels']), groups, hash_radius),
+                file=save_clusters(method_dir, groups)
+            )
+        save_store(
+            method_dir,
+            inputs['crop']['faces'],
+            inputs['decode']['labels'][inputs['dedupe']['keep']],
+            inputs['split'],
+            method=method,
+            split_info={'seed': seed},
+            alignment=json.loads(inputs['detect']['alignment'].tobytes()),
+            dedupe=dedupe_record,
+            pipeline_fingerprint=pipeline.fingerprint('save')
+        )
+        print(f"Data saved to {method_dir}")
+    
+    def is_saved(fingerprint):
+        try:
+            manifest = load_manifest(method_dir)
+        except ValueError:
+            return False
+        if manifest is None or manifest.get('pipeline_fingerprint') != fingerprint:
+            return False
+        # --resplit rewrites the splits of a saved store with another seed
+        return manifest.get('splits', {}).get('seed') == seed
+    
+    pipeline = Pipeline([
+        Stage('decode', run_decode, params={'source': dataset_source_params(), 'image_size': IMAGE_SIZE}),
+        Stage('dedupe', run_dedupe, deps=('decode',), params={'enabled': dedupe, 'exact_hash': 'blake2b', 'hash': 'dhash', 'radius': hash_radius}),
+        Stage('detect', run_detect, deps=('decode', 'dedupe'), version=3,
+              params={'method': method, 'detector': DETECTOR_PARAMS[method], 'alignment': alignment}),
+        Stage('crop', run_crop, deps=('decode', 'dedupe', 'detect'), version=2, params={'image_size': IMAGE_SIZE}),
+        Stage('split', run_split, deps=('decode', 'dedupe'), version=2,
+              params={'seed': seed, 'fractions': [0.7, 0.15, 0.15], 'grouped': dedupe}),
+        Stage('save', run_save, deps=('decode', 'dedupe', 'detect', 'crop', 'split'), params={'method': method},
+              is_complete=is_saved),
+    ], PIPELINE_CACHE_DIR)
+    return pipeline
+
+def print_stage_status(pipeline):
+    """
+    Print every pipeline stage with its dependencies and cache status
+    
+    Args:
+        pipeline (Pipeline): The data preparation pipeline
+    """
+    print(f"{'Stage':<8} {'Depends on':<38} {'Fingerprint':<18} Status")
+    for name, deps, fingerprint, cached in pipeline.status():
+        print(f"{name:<8} {', '.join(deps) or '-':<38} {fingerprint:<18} {'cached' if cached else 'needs run'}")
+
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Prepare the FER2013 dataset for training")
+    parser.add_argument(
+        '--method',
+        choices=['opencv', 'mediapipe'],
+        default='opencv',
+        help="Face detection method used for the full dataset (default: opencv)"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of preprocessing processes; 0 uses every CPU core (default: 1)"
+    )
+    parser.add_argument(
+        '--split-seed',
+        type=int,
+        default=DEFAULT_SPLIT_SEED,
+        help=f"Random seed for the train/val/test split (default: {DEFAULT_SPLIT_SEED})"
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="Run face detection on every image instead of reusing cached results"
+    )
+    parser.add_argument(
+        '--resplit',
+        action='store_true',
+        help="Only rebuild the splits of already processed data with --split-seed"
+    )
+    parser.add_argument(
+        '--source',
+        choices=['auto', 'csv', 'folders'],
+        default='auto',
+        help="Dataset layout: fer2013.csv or train/<emotion>/*.png folders (default: auto)"
+    )
+    parser.add_argument(
+        '--decode-threads',
+        type=int,
+        default=0,
+        help="Threads decoding image files in folder mode; 0 uses every CPU core (default: 0)"
+    )
+    parser.add_argument(
+        '--alignment',
+        choices=ALIGNMENT_MODES,
+        default='detect',
+        help="Run face detection ('detect', default), use the images as face crops "
+             "('prealigned') or decide from a sampled detection probe ('auto')"
+    )
+    parser.add_argument(
+        '--no-dedupe',
+        action='store_true',
+        help="Keep duplicate images and split without near-duplicate clusters"
+    )
+    parser.add_argument(
+        '--hash-radius',
+        type=int,
+        default=DEFAULT_HASH_RADIUS,
+        help=f"Max dHash bit distance between near-duplicate images (default: {DEFAULT_HASH_RADIUS})"
+    )
+    parser.add_argument(
+        '--check-leakage',
+        action='store_true',
+        help="Only report val/test images with a near-duplicate in the training split of processed data"
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Read the CSV in chunks and write each one straight into the processed store"
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"CSV rows per chunk in --stream mode (default: {DEFAULT_CHUNK_SIZE})"
+    )
+    parser.add_argument(
+        '--compare',
+        action='store_true',
+        help="Compare the face detection methods on a sample before processing"
+    )
+    parser.add_argument(
+        '--list-stages',
+        action='store_true',
+        help="List the pipeline stages and their cache status, then exit"
+    )
+    parser.add_argument(
+        '--rebuild',
+        action='append',
+        choices=PIPELINE_STAGES,
+        default=[],
+        metavar='STAGE',
+        help=f"Force a stage to run even if cached; may be repeated ({', '.join(PIPELINE_STAGES)})"
+    )
+    return parser.parse_args()
 
 def main():
     """
     Main function to execute the data preparation pipeline
     """
-    # Load the dataset
-    data = load_data()
-    if data is None:
+    args = parse_args()
+    report_startup("data_preparation")
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+    
+    if args.resplit:
+        resplit_processed_data(args.method, args.split_seed)
+        return
+    
+    if args.check_leakage:
+        check_split_leakage(args.method, args.hash_radius)
         return
     
-    # Compare face detection methods on a small subset
-    print("\nComparing face detection methods...")
-    compare_methods(data.sample(n=min(1000, len(data)), random_state=42))
+    if args.list_stages:
+        print_stage_status(build_pipeline(
+            args.method, args.split_seed, alignment=args.alignment,
+            dedupe=not args.no_dedupe, hash_radius=args.hash_radius
+        ))
+        return
+    
+    # Make sure the dataset exists so its fingerprint is stable
+    if not os.path.exists(FER_DATASET_PATH) and not has_image_folders():
+        download_dataset()
+    
+    source = args.source
+    if source == 'auto':
+        source = 'csv' if os.path.exists(FER_DATASET_PATH) or not has_image_folders() else 'folders'
+    
+    if source == 'folders':
+        print(f"\nProcessing image folders with {args.method} ({workers} worker(s))...")
+        ingest_image_folders(
+            args.method, workers=workers, threads=args.decode_threads or None,
+            use_cache=not args.no_cache, seed=args.split_seed, alignment=args.alignment,
+            dedupe=not args.no_dedupe, hash_radius=args.hash_radius
+        )
+        print("\nData preparation completed!")
+        return
+    
+    if args.compare:
+        # Compare face detection methods on a small subset
+        data = load_data()
+        if data is None:
+            return
+        print("\nComparing face detection methods...")
+        compare_methods(data)
     
-    # Process the full dataset with the chosen method (OpenCV in this case)
-    print("\nProcessing full dataset with OpenCV...")
-    X_train, y_train, X_val, y_val, X_test, y_test = preprocess_with_opencv(data)
+    if args.stream:
+        print(f"\nStreaming full dataset with {args.method} ({workers} worker(s))...")
+        stream_preprocess(
+            args.method, args.chunk_size, workers, use_cache=not args.no_cache, seed=args.split_seed,
+            alignment=args.alignment, dedupe=not args.no_dedupe, hash_radius=args.hash_radius
+        )
+        print("\nData preparation completed!")
+        return
     
-    # Save the processed data
-    save_processed_data(X_train, y_train, X_val, y_val, X_test, y_test, method="opencv")
+    # Process the full dataset with the chosen method, reusing cached stages
+    print(f"\nProcessing full dataset with {args.method} ({workers} worker(s))...")
+    pipeline = build_pipeline(args.method, args.split_seed, workers, use_cache=not args.no_cache,
+                              alignment=args.alignment, dedupe=not args.no_dedupe, hash_radius=args.hash_radius)
+    pipeline.run('save', force=args.rebuild)
     
     print("\nData preparation completed!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
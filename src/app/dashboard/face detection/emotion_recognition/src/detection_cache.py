@@ -0,0 +1,127 @@
+"""
+Face Detection Cache for Facial Emotion Recognition
+
+This module:
+1. Fingerprints a face detector by its method and parameters
+2. Keys every image by a hash of its pixels plus the detector fingerprint
+3. Stores the chosen face box per image on disk
+4. Lets preprocessing re-run detection only on new or changed images
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+# Box stored for images in which no face was found
+NO_FACE = (-1, -1, -1, -1)
+KEY_SIZE = 16  # Bytes per image key (128-bit BLAKE2b digest)
+
+def detector_fingerprint(method, params):
+    """
+    Fingerprint a detector configuration
+    
+    Args:
+        method (str): Detection method ('opencv' or 'mediapipe')
+        params (dict): Detector parameters (e.g. scaleFactor, minNeighbors, minSize)
+        
+    Returns:
+        str: Hex digest identifying the configuration
+    """
+    config = json.dumps({'method': method, 'params': params}, sort_keys=True)
+    return hashlib.blake2b(config.encode(), digest_size=KEY_SIZE).hexdigest()
+
+def image_keys(images, fingerprint):
+    """
+    Compute the cache key of every image
+    
+    Args:
+        images (numpy.ndarray): uint8 images of shape (N, H, W)
+        fingerprint (str): Detector fingerprint from detector_fingerprint
+        
+    Returns:
+        numpy.ndarray: Keys of shape (N, KEY_SIZE) with dtype uint8
+    """
+    prefix = bytes.fromhex(fingerprint)
+    keys = np.empty((len(images), KEY_SIZE), dtype=np.uint8)
+    for i in range(len(images)):
+        digest = hashlib.blake2b(prefix, digest_size=KEY_SIZE)
+        digest.update(np.ascontiguousarray(images[i]).tobytes())
+        keys[i] = np.frombuffer(digest.digest(), dtype=np.uint8)
+    return keys
+
+class DetectionCache:
+    """
+    On-disk map from image key to detected face box for one detector config
+    """
+    
+    def __init__(self, cache_dir, method, params):
+        """
+        Open (or create) the cache for a detector configuration
+        
+        Args:
+            cache_dir (str): Directory holding the cache files
+            method (str): Detection method ('opencv' or 'mediapipe')
+            params (dict): Detector parameters
+        """
+        self.fingerprint = detector_fingerprint(method, params)
+        self.path = os.path.join(cache_dir, f'{method}_{self.fingerprint}.npz')
+        self.boxes = {}
+        self.dirty = False
+        
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                for key, box in zip(data['keys'], data['boxes']):
+                    self.boxes[key.tobytes()] = tuple(int(v) for v in box)
+    
+    def __len__(self):
+        return len(self.boxes)
+    
+    def lookup(self, keys):
+        """
+        Look up the cached boxes of a batch of images
+        
+        Args:
+            keys (numpy.ndarray): Keys from image_keys
+            
+        Returns:
+            tuple: (boxes, hits) where boxes has shape (N, 4) and hits is a
+                boolean mask of the images found in the cache
+        """
+        boxes = np.full((len(keys), 4), -1, dtype=np.int32)
+        hits = np.zeros(len(keys), dtype=bool)
+        for i, key in enumerate(keys):
+            box = self.boxes.get(key.tobytes())
+            if box is not None:
+                boxes[i] = box
+                hits[i] = True
+        return boxes, hits
+    
+    def update(self, keys, boxes):
+        """
+        Add detection results to the cache
+        
+        Args:
+            keys (numpy.ndarray): Keys from image_keys
+            boxes (numpy.ndarray): Face boxes of shape (N, 4), NO_FACE for misses
+        """
+        for key, box in zip(keys, boxes):
+            self.boxes[key.tobytes()] = tuple(int(v) for v in box)
+        self.dirty = self.dirty or len(keys) > 0
+    
+    def save(self):
+        """
+        Write the cache to disk if it changed
+        """
+        if not self.dirty:
+            return
+        
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        keys = np.frombuffer(b''.join(self.boxes.keys()), dtype=np.uint8).reshape(-1, KEY_SIZE)
+        boxes = np.array(list(self.boxes.values()), dtype=np.int32).reshape(-1, 4)
+        
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=keys, boxes=boxes)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
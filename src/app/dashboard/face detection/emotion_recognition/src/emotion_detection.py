@@ -7,14 +7,20 @@ This script:
 3. Preprocesses the face region
 4. Uses the trained model to predict the emotion
 5. Displays the predicted emotion on the screen
+
+The model runs in the inference backend matching its file (Keras for .h5,
+the TensorFlow Lite interpreter for .tflite, onnxruntime for .onnx). Unless
+--model or --model-type is given, the detector runs in demo mode with a
+simple heuristic, as it always has.
 """
 
+from startup_timer import report_startup
 import os
 import numpy as np
 import cv2
-import tensorflow as tf
-from tensorflow.keras.models import load_model
 import time
+import argparse
+from inference_backend import BACKENDS, load_backend
 
 # Define constants
 MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
@@ -43,21 +49,35 @@ EMOTION_COLORS = {
 }
 
 class EmotionDetector:
-    def __init__(self, model_type='custom_cnn'):
+    def __init__(self, model_type=None, model_path=None, backend=None, num_threads=None):
         """
         Initialize the emotion detector
         
         Args:
-            model_type (str): Type of model to load ('custom_cnn', 'vgg16', 'resnet50')
+            model_type (str): Type of trained model to load ('custom_cnn', 'vgg16',
+                'resnet50', 'separable_cnn', 'separable_cnn_small'); None with no
+                model_path runs in demo mode
+            model_path (str): Model file to use instead of the trained model of model_type
+            backend (str): Inference backend ('keras', 'tflite', 'onnx'); None chooses
+                it from the model file extension
+            num_threads (int): Inference threads; None uses the backend's default
         """
         # Load face cascade
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         if self.face_cascade.empty():
             raise ValueError("Failed to load face cascade classifier")
         
-        # For demo purposes, we'll use a simple approach without loading a model
-        print("Note: Running in demo mode without a trained model")
-        self.model = None
+        # Load the requested model, or run in demo mode without one
+        if model_path is None and model_type is not None:
+            model_path = self.find_model(model_type)
+            if model_path is None:
+                print(f"No trained {model_type} model found in {MODELS_DIR}")
+        if model_path is None:
+            print("Note: Running in demo mode without a trained model")
+            self.backend = None
+        else:
+            self.backend = load_backend(model_path, backend, num_threads)
+            print(f"Model loaded from {model_path} ({self.backend.name} backend)")
         
         # Initialize webcam
         self.init_webcam()
@@ -66,6 +86,23 @@ class EmotionDetector:
         self.prev_frame_time = 0
         self.new_frame_time = 0
     
+    def find_model(self, model_type):
+        """
+        Find the trained model of a model type
+        
+        Args:
+            model_type (str): Type of model
+            
+        Returns:
+            str: Path of {model_type}_best.h5, else {model_type}_final.h5, or
+                None if the model has not been trained
+        """
+        for suffix in ('best', 'final'):
+            path = os.path.join(MODELS_DIR, f'{model_type}_{suffix}.h5')
+            if os.path.exists(path):
+                return path
+        return None
+    
     def init_webcam(self, max_retries=3):
         """
         Initialize webcam with retry logic
@@ -116,7 +153,7 @@ class EmotionDetector:
         normalized_face = resized_face / 255.0
         
         # Reshape to include batch and channel dimensions
-        processed_face = normalized_face.reshape(1, IMAGE_SIZE, IMAGE_SIZE, 1)
+        processed_face = normalized_face.reshape(1, IMAGE_SIZE, IMAGE_SIZE, 1).astype(np.float32)
         
         return processed_face
     
@@ -128,10 +165,15 @@ class EmotionDetector:
             face_img (numpy.ndarray): The face image
             
         Returns:
-            str: The predicted emotion
+            tuple: (emotion, confidence)
         """
-        # For demo purposes, we'll use a simple approach to determine emotions
-        # based on image properties rather than a trained model
+        if self.backend is not None:
+            probabilities = self.backend.predict(self.preprocess_face(face_img))[0]
+            index = int(np.argmax(probabilities))
+            return EMOTIONS[index], float(probabilities[index])
+        
+        # Without a trained model, use a simple approach to determine emotions
+        # based on image properties
         
         # Convert to grayscale
         gray_face = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
@@ -246,13 +288,48 @@ class EmotionDetector:
         cv2.destroyAllWindows()
         print("Webcam released. Program ended.")
 
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Detect emotions from the webcam in real time")
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default=None,
+        help="Trained model to use when --model is not given (default: demo mode without a model)"
+    )
+    parser.add_argument(
+        '--model',
+        default=None,
+        help="Model file: .h5/.keras (Keras), .tflite (TensorFlow Lite) or .onnx (onnxruntime)"
+    )
+    parser.add_argument(
+        '--backend',
+        choices=list(BACKENDS),
+        default=None,
+        help="Inference backend; by default chosen from the model file extension"
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=None,
+        help="Inference threads (default: 1 for TensorFlow Lite and onnxruntime, TensorFlow's choice for Keras)"
+    )
+    return parser.parse_args()
+
 def main():
     """
     Main function to run the emotion detection
     """
+    args = parse_args()
     try:
         # Create and run the emotion detector
-        detector = EmotionDetector()
+        detector = EmotionDetector(args.model_type, args.model, args.backend, args.threads)
+        report_startup("emotion_detection")
         detector.run()
     
     except Exception as e:
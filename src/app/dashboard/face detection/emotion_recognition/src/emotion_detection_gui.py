@@ -8,6 +8,7 @@ This script:
 4. Displays the results in the GUI
 """
 
+from startup_timer import report_startup
 import os
 import numpy as np
 import cv2
@@ -492,6 +493,10 @@ def main():
         # Create the application
         app = EmotionDetectionApp(root)
         
+        # Draw the window before reporting how long startup took
+        root.update()
+        report_startup("emotion_detection_gui", "window shown")
+        
         # Start the main loop
         root.mainloop()
     
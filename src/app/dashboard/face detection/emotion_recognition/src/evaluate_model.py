@@ -6,16 +6,15 @@ This script:
 2. Evaluates the model on the test set
 3. Calculates and displays performance metrics
 4. Visualizes the confusion matrix
+
+TensorFlow, scikit-learn, matplotlib and seaborn are imported by the
+functions that use them.
 """
 
+from startup_timer import report_startup
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from sklearn.metrics import confusion_matrix, classification_report
+from processed_store import load_split, iter_normalized_batches
 
 # Define constants
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
@@ -37,6 +36,9 @@ def load_test_data(method="opencv"):
     """
     Load the test data
     
+    The images are memory-mapped uint8 pixels that are normalized batch by
+    batch during prediction.
+    
     Args:
         method (str): Preprocessing method used ('opencv' or 'mediapipe')
         
@@ -47,8 +49,7 @@ def load_test_data(method="opencv"):
     
     print(f"Loading test data from {method_dir}...")
     
-    X_test = np.load(os.path.join(method_dir, 'X_test.npy'))
-    y_test = np.load(os.path.join(method_dir, 'y_test.npy'))
+    X_test, y_test = load_split(method_dir, 'test', mmap_mode='r')
     
     print(f"Test set: {X_test.shape[0]} samples")
     
@@ -75,6 +76,7 @@ def load_trained_model(model_type='custom_cnn'):
             return None
     
     print(f"Loading model from {model_path}...")
+    from tensorflow.keras.models import load_model
     model = load_model(model_path)
     
     return model
@@ -91,10 +93,14 @@ def evaluate_model(model, X_test, y_test):
     Returns:
         tuple: (accuracy, precision, recall, f1, y_pred)
     """
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
     print("Evaluating model on test set...")
     
-    # Get model predictions
-    y_pred_prob = model.predict(X_test)
+    # Get model predictions, normalizing one batch at a time
+    y_pred_prob = np.concatenate([
+        model.predict(batch, verbose=0)
+        for batch in iter_normalized_batches(X_test)
+    ])
     y_pred = np.argmax(y_pred_prob, axis=1)
     
     # Calculate metrics
@@ -124,6 +130,10 @@ def plot_confusion_matrix(y_test, y_pred, model_type='custom_cnn'):
         y_pred (numpy.ndarray): Predicted labels
         model_type (str): Type of model evaluated
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.metrics import confusion_matrix
+    
     # Calculate confusion matrix
     cm = confusion_matrix(y_test, y_pred)
     
@@ -177,6 +187,7 @@ def visualize_misclassifications(X_test, y_test, y_pred, model_type='custom_cnn'
     )
     
     # Plot misclassified samples
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(15, 3))
     plt.suptitle(f"Misclassified Samples ({model_type} model)")
     
@@ -196,6 +207,8 @@ def main():
     """
     Main function to execute the model evaluation pipeline
     """
+    report_startup("evaluate_model")
+    
     # Load test data
     X_test, y_test = load_test_data(method="opencv")
     
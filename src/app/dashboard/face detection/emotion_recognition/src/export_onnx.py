@@ -0,0 +1,228 @@
+"""
+ONNX Export Script for Facial Emotion Recognition
+
+This script:
+1. Loads a trained Keras model ({model_type}_best.h5, else _final.h5)
+2. Converts it to ONNX with tf2onnx
+3. Checks that onnxruntime reproduces the Keras probabilities on the test
+   split (exits with an error when they differ beyond the tolerance)
+4. Compares single-face latency and import time of onnxruntime and Keras
+
+With --check-only an existing .onnx model is checked against its Keras model
+without exporting it again. Needs tf2onnx and onnxruntime (see
+requirements.txt); the detectors only need onnxruntime to run the exported model.
+"""
+
+from startup_timer import report_startup
+import os
+import sys
+import json
+import subprocess
+import argparse
+import numpy as np
+import tensorflow as tf
+from processed_store import load_split, normalize_batch, iter_normalized_batches
+from inference_backend import KerasBackend, OnnxBackend
+from export_tflite import find_model_path, measure_latency
+
+# Define constants
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+PROCESSED_DATA_PATH = os.path.join(DATA_DIR, 'processed')
+DEFAULT_OPSET = 13
+PARITY_ATOL = 1e-4
+
+def export_onnx(model, output_path, opset=DEFAULT_OPSET):
+    """
+    Convert a Keras model to ONNX
+    
+    Args:
+        model (tensorflow.keras.models.Model): The trained model
+        output_path (str): .onnx file to write
+        opset (int): ONNX opset version
+        
+    Returns:
+        str: output_path
+    """
+    try:
+        import tf2onnx
+    except ImportError:
+        sys.exit("ONNX export needs tf2onnx (pip install -r requirements.txt)")
+    
+    # Any batch size, so the detectors and the parity check can share the model
+    input_signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='faces')]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=output_path)
+    return output_path
+
+def check_parity(reference, candidate, X_test, y_test, atol=PARITY_ATOL):
+    """
+    Compare the probabilities of two backends on the test split
+    
+    Args:
+        reference (InferenceBackend): Backend giving the expected outputs (Keras)
+        candidate (InferenceBackend): Backend under test
+        X_test (numpy.ndarray): Test images
+        y_test (numpy.ndarray): Test labels
+        atol (float): Largest allowed absolute difference of a probability
+        
+    Returns:
+        dict: Largest difference, argmax agreement, both accuracies and
+            whether the check passed
+    """
+    max_diff = 0.0
+    agree = reference_correct = candidate_correct = 0
+    start = 0
+    for batch in iter_normalized_batches(X_test):
+        expected = reference.predict(batch)
+        actual = candidate.predict(batch)
+        labels = y_test[start:start + len(batch)]
+        start += len(batch)
+        
+        max_diff = max(max_diff, float(np.max(np.abs(expected - actual))))
+        agree += int(np.sum(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+        reference_correct += int(np.sum(np.argmax(expected, axis=1) == labels))
+        candidate_correct += int(np.sum(np.argmax(actual, axis=1) == labels))
+    
+    return {
+        'max_abs_diff': max_diff,
+        'argmax_agreement': agree / len(X_test),
+        'reference_accuracy': reference_correct / len(X_test),
+        'candidate_accuracy': candidate_correct / len(X_test),
+        'atol': atol,
+        'passed': max_diff <= atol,
+    }
+
+def import_seconds(module):
+    """
+    Measure how long importing a module takes in a fresh interpreter
+    
+    Args:
+        module (str): Module name
+        
+    Returns:
+        float: Import time in seconds
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Export a trained model to ONNX and check it against Keras in onnxruntime"
+    )
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default='custom_cnn',
+        help="Model architecture to export (default: custom_cnn)"
+    )
+    parser.add_argument(
+        '--model-path',
+        default=None,
+        help="Keras model to export (default: models/<model type>_best.h5, else _final.h5)"
+    )
+    parser.add_argument(
+        '--method',
+        choices=['opencv', 'mediapipe'],
+        default='opencv',
+        help="Preprocessing method of the test data (default: opencv)"
+    )
+    parser.add_argument(
+        '--onnx-path',
+        default=None,
+        help="ONNX model to write or check (default: the Keras model path with .onnx)"
+    )
+    parser.add_argument(
+        '--check-only',
+        action='store_true',
+        help="Only run the parity check on an existing ONNX model; do not export"
+    )
+    parser.add_argument(
+        '--opset',
+        type=int,
+        default=DEFAULT_OPSET,
+        help=f"ONNX opset version (default: {DEFAULT_OPSET})"
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=1,
+        help="onnxruntime intra-op threads (default: 1)"
+    )
+    parser.add_argument(
+        '--atol',
+        type=float,
+        default=PARITY_ATOL,
+        help=f"Largest allowed difference of a probability from Keras (default: {PARITY_ATOL})"
+    )
+    return parser.parse_args()
+
+def main():
+    """
+    Main function to export the model and check it in onnxruntime
+    """
+    args = parse_args()
+    report_startup("export_onnx")
+    
+    model_path = args.model_path or find_model_path(args.model_type)
+    print(f"Loading model from {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+    
+    # The ONNX model and the report are saved next to the Keras model by default
+    base = os.path.splitext(model_path)[0]
+    onnx_path = args.onnx_path or f'{base}.onnx'
+    if args.check_only:
+        if not os.path.exists(onnx_path):
+            sys.exit(f"No ONNX model at {onnx_path}; export it first or pass --onnx-path")
+        print(f"Checking existing {onnx_path}")
+    else:
+        export_onnx(model, onnx_path, args.opset)
+        print(f"Saved {onnx_path} ({os.path.getsize(onnx_path) / 2 ** 20:.2f} MB)")
+    
+    keras_backend = KerasBackend(model_path, model=model)
+    onnx_backend = OnnxBackend(onnx_path, num_threads=args.threads)
+    
+    X_test, y_test = load_split(os.path.join(PROCESSED_DATA_PATH, args.method), 'test', mmap_mode='r')
+    print(f"\nChecking onnxruntime against Keras on {len(X_test)} test samples...")
+    parity = check_parity(keras_backend, onnx_backend, X_test, y_test, args.atol)
+    print(f"Largest probability difference: {parity['max_abs_diff']:.2e} (tolerance {args.atol:.0e})")
+    print(f"Argmax agreement: {parity['argmax_agreement']:.2%}")
+    print(f"Accuracy: Keras {parity['reference_accuracy']:.4f}, onnxruntime {parity['candidate_accuracy']:.4f}")
+    
+    face = normalize_batch(X_test[:1])
+    latency = {
+        'keras': measure_latency(keras_backend.predict, face),
+        'onnx': measure_latency(onnx_backend.predict, face),
+    }
+    imports = {
+        'tensorflow': import_seconds('tensorflow'),
+        'onnxruntime': import_seconds('onnxruntime'),
+    }
+    print(f"\nSingle-face latency p50: Keras {latency['keras']['p50_ms']:.3f} ms, "
+          f"onnxruntime {latency['onnx']['p50_ms']:.3f} ms "
+          f"({latency['keras']['p50_ms'] / latency['onnx']['p50_ms']:.2f}x)")
+    print(f"Import time: tensorflow {imports['tensorflow']:.2f} s, onnxruntime {imports['onnxruntime']:.2f} s")
+    
+    report_path = f'{base}_onnx_report.json'
+    with open(report_path, 'w') as f:
+        json.dump({
+            'onnx_path': onnx_path,
+            'opset': None if args.check_only else args.opset,
+            'threads': args.threads,
+            'parity': parity,
+            'latency': latency,
+            'import_seconds': imports,
+        }, f, indent=2)
+    print(f"\nONNX report saved to {report_path}")
+    
+    if not parity['passed']:
+        sys.exit(f"onnxruntime differs from Keras by {parity['max_abs_diff']:.2e} > {args.atol:.0e}")
+    print("Parity check passed")
+
+if __name__ == "__main__":
+    main()
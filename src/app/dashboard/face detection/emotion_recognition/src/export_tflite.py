@@ -0,0 +1,242 @@
+"""
+TensorFlow Lite Export Script for Facial Emotion Recognition
+
+This script:
+1. Loads a trained Keras model ({model_type}_best.h5, else _final.h5)
+2. Converts it to float16 and full-integer (int8) TensorFlow Lite models,
+   calibrating the int8 ranges on samples of the processed training store
+3. Compares the accuracy of every model on the test split with the Keras model
+4. Measures the single-face CPU latency of every model and the speedup
+   over Keras model.predict, which the detectors use
+"""
+
+from startup_timer import report_startup
+import os
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from processed_store import load_split, normalize_batch, iter_normalized_batches
+from inference_backend import TFLiteBackend
+
+# Define constants
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+PROCESSED_DATA_PATH = os.path.join(DATA_DIR, 'processed')
+CALIBRATION_SAMPLES = 500
+CALIBRATION_SEED = 42
+QUANTIZATIONS = ('float16', 'int8')
+LATENCY_WARMUP_RUNS = 10
+LATENCY_RUNS = 200
+
+def find_model_path(model_type):
+    """
+    Find the trained Keras model of a model type
+    
+    Args:
+        model_type (str): Type of model
+        
+    Returns:
+        str: Path of {model_type}_best.h5, else {model_type}_final.h5
+    """
+    for suffix in ('best', 'final'):
+        path = os.path.join(MODELS_DIR, f'{model_type}_{suffix}.h5')
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No trained {model_type} model in {MODELS_DIR}; train it first")
+
+def representative_dataset(X_train, num_samples=CALIBRATION_SAMPLES, seed=CALIBRATION_SEED):
+    """
+    Create the calibration input for full-integer quantization
+    
+    Args:
+        X_train (numpy.ndarray): Training images from the processed store
+        num_samples (int): Number of calibration samples
+        seed (int): Seed for drawing the samples
+        
+    Returns:
+        callable: Generator function yielding one normalized sample at a time
+    """
+    indices = np.sort(np.random.default_rng(seed).choice(len(X_train), min(num_samples, len(X_train)), replace=False))
+    
+    def generate():
+        for index in indices:
+            yield [normalize_batch(X_train[index:index + 1])]
+    
+    return generate
+
+def convert(model, quantization, X_train=None, calibration_samples=CALIBRATION_SAMPLES):
+    """
+    Convert a Keras model to TensorFlow Lite
+    
+    Args:
+        model (tensorflow.keras.models.Model): The trained model
+        quantization (str): 'float16' (float16 weights) or 'int8' (int8 weights,
+            activations, input and output)
+        X_train (numpy.ndarray): Training images for int8 calibration
+        calibration_samples (int): Number of calibration samples
+        
+    Returns:
+        bytes: The TensorFlow Lite flatbuffer
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        converter.representative_dataset = representative_dataset(X_train, calibration_samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+def accuracy(predict, X_test, y_test):
+    """
+    Compute the accuracy of a prediction function on the test split
+    
+    Args:
+        predict (callable): Maps a normalized batch to class probabilities
+        X_test (numpy.ndarray): Test images
+        y_test (numpy.ndarray): Test labels
+        
+    Returns:
+        float: Accuracy
+    """
+    y_pred = np.concatenate([np.argmax(predict(batch), axis=1) for batch in iter_normalized_batches(X_test)])
+    return float(np.mean(y_pred == y_test))
+
+def measure_latency(predict, face, runs=LATENCY_RUNS, warmup_runs=LATENCY_WARMUP_RUNS):
+    """
+    Measure the latency of predicting one face
+    
+    Args:
+        predict (callable): Maps a normalized batch to class probabilities
+        face (numpy.ndarray): One normalized face of shape (1, 48, 48, 1)
+        runs (int): Number of timed calls
+        warmup_runs (int): Untimed calls made first
+        
+    Returns:
+        dict: p50/p95 latency in milliseconds
+    """
+    for _ in range(warmup_runs):
+        predict(face)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict(face)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(times, 50)), 3),
+        'p95_ms': round(float(np.percentile(times, 95)), 3),
+    }
+
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Export a trained model to float16 and int8 TensorFlow Lite and compare them"
+    )
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default='custom_cnn',
+        help="Model architecture to export (default: custom_cnn)"
+    )
+    parser.add_argument(
+        '--model-path',
+        default=None,
+        help="Keras model to export (default: models/<model type>_best.h5, else _final.h5)"
+    )
+    parser.add_argument(
+        '--method',
+        choices=['opencv', 'mediapipe'],
+        default='opencv',
+        help="Preprocessing method of the calibration and test data (default: opencv)"
+    )
+    parser.add_argument(
+        '--quantization',
+        nargs='+',
+        choices=QUANTIZATIONS,
+        default=list(QUANTIZATIONS),
+        help="TensorFlow Lite models to export (default: float16 int8)"
+    )
+    parser.add_argument(
+        '--calibration-samples',
+        type=int,
+        default=CALIBRATION_SAMPLES,
+        help=f"Training samples used to calibrate the int8 ranges (default: {CALIBRATION_SAMPLES})"
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=1,
+        help="Threads of the TensorFlow Lite interpreter (default: 1)"
+    )
+    return parser.parse_args()
+
+def main():
+    """
+    Main function to export, evaluate and time the TensorFlow Lite models
+    """
+    args = parse_args()
+    report_startup("export_tflite")
+    
+    model_path = args.model_path or find_model_path(args.model_type)
+    print(f"Loading model from {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+    
+    method_dir = os.path.join(PROCESSED_DATA_PATH, args.method)
+    X_train, _ = load_split(method_dir, 'train', mmap_mode='r')
+    X_test, y_test = load_split(method_dir, 'test', mmap_mode='r')
+    face = normalize_batch(X_test[:1])
+    
+    # The detectors call model.predict on one face at a time
+    keras_predict = lambda batch: model.predict(batch, verbose=0)
+    results = {'keras': {
+        'path': model_path,
+        'size_bytes': os.path.getsize(model_path),
+        'accuracy': accuracy(keras_predict, X_test, y_test),
+        'latency': measure_latency(keras_predict, face),
+    }}
+    
+    # The TensorFlow Lite models and the report are saved next to the Keras model
+    base = os.path.splitext(model_path)[0]
+    for quantization in args.quantization:
+        print(f"\nConverting to {quantization} TensorFlow Lite...")
+        flatbuffer = convert(model, quantization, X_train, args.calibration_samples)
+        path = f'{base}_{quantization}.tflite'
+        with open(path, 'wb') as f:
+            f.write(flatbuffer)
+        print(f"Saved {path} ({len(flatbuffer) / 2 ** 20:.2f} MB)")
+        
+        # Run it exactly as the detectors do
+        predict = TFLiteBackend(path, num_threads=args.threads).predict
+        results[quantization] = {
+            'path': path,
+            'size_bytes': len(flatbuffer),
+            'accuracy': accuracy(predict, X_test, y_test),
+            'latency': measure_latency(predict, face),
+        }
+    
+    keras = results['keras']
+    print(f"\n{'Model':10s} {'Size (MB)':>10s} {'Accuracy':>9s} {'Delta':>8s} {'p50 (ms)':>9s} {'p95 (ms)':>9s} {'Speedup':>8s}")
+    for name, result in results.items():
+        result['accuracy_delta'] = round(result['accuracy'] - keras['accuracy'], 4)
+        result['speedup'] = round(keras['latency']['p50_ms'] / result['latency']['p50_ms'], 2)
+        print(f"{name:10s} {result['size_bytes'] / 2 ** 20:10.2f} {result['accuracy']:9.4f} "
+              f"{result['accuracy_delta']:+8.4f} {result['latency']['p50_ms']:9.3f} "
+              f"{result['latency']['p95_ms']:9.3f} {result['speedup']:7.2f}x")
+    
+    report_path = f'{base}_tflite_report.json'
+    with open(report_path, 'w') as f:
+        json.dump({'threads': args.threads, 'test_samples': len(X_test), 'models': results}, f, indent=2)
+    print(f"\nExport report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Hyperparameter Search for Facial Emotion Recognition
+
+This script:
+1. Samples configurations of batch size, learning rate and dropout rates
+2. Trains many short trials at once, one process per group of CPU cores
+   (each process pinned to its cores)
+3. Prunes weak trials with Hyperband (or plain successive halving) on the
+   validation accuracy of every epoch
+4. Keeps a leaderboard of all trials and trains the best configuration
+   to completion with train_model.py
+
+Trials keep their model and optimizer state in an HDF5 file between rungs,
+so a promoted trial continues training instead of starting over.
+"""
+
+from startup_timer import report_startup
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Define constants
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(os.path.dirname(SRC_DIR), 'models')
+SEARCH_DIR = os.path.join(MODELS_DIR, 'search')
+DEFAULT_MAX_EPOCHS = 9
+DEFAULT_ETA = 3
+SEARCH_SEED = 42
+
+# Search space: ('choice', values), ('uniform', low, high) or ('log_uniform', low, high)
+SEARCH_SPACE = {
+    'batch_size': ('choice', [32, 64, 128]),
+    'learning_rate': ('log_uniform', 1e-4, 3e-3),
+    'conv_dropout': ('uniform', 0.1, 0.4),
+    'dense_dropout': ('uniform', 0.3, 0.6),
+}
+
+# Hyperparameters that only apply to some architectures
+MODEL_HPARAMS = {
+    'custom_cnn': ('batch_size', 'learning_rate', 'conv_dropout', 'dense_dropout'),
+    'vgg16': ('batch_size', 'learning_rate', 'dense_dropout'),
+    'resnet50': ('batch_size', 'learning_rate', 'dense_dropout'),
+    'separable_cnn': ('batch_size', 'learning_rate', 'dense_dropout'),
+    'separable_cnn_small': ('batch_size', 'learning_rate', 'dense_dropout'),
+}
+
+# Data loaded once per trial process by _init_worker
+_DATA = None
+
+def sample_config(rng, model_type):
+    """
+    Draw one configuration from the search space
+    
+    Args:
+        rng (random.Random): Random number generator
+        model_type (str): Type of model the configuration is for
+        
+    Returns:
+        dict: Hyperparameters, as accepted by train_model.py --hparams
+    """
+    config = {}
+    for name in MODEL_HPARAMS[model_type]:
+        kind, *bounds = SEARCH_SPACE[name]
+        if kind == 'choice':
+            config[name] = rng.choice(bounds[0])
+        elif kind == 'log_uniform':
+            config[name] = round(math.exp(rng.uniform(math.log(bounds[0]), math.log(bounds[1]))), 6)
+        else:
+            config[name] = round(rng.uniform(*bounds), 3)
+    return config
+
+def hyperband_brackets(max_epochs, eta=DEFAULT_ETA):
+    """
+    Get the successive halving brackets of Hyperband
+    
+    The most aggressive bracket starts many trials with a single epoch,
+    the most conservative one trains a few trials for max_epochs each.
+    
+    Args:
+        max_epochs (int): Epochs of a trial that reaches the last rung
+        eta (int): Fraction of trials (1/eta) promoted at every rung
+        
+    Returns:
+        list: (num_trials, first_rung_epochs) per bracket
+    """
+    s_max = int(math.log(max_epochs, eta) + 1e-9)
+    brackets = []
+    for s in range(s_max, -1, -1):
+        num_trials = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        brackets.append((num_trials, max(1, int(round(max_epochs * eta ** -s)))))
+    return brackets
+
+def core_groups(cores_per_trial, workers=0):
+    """
+    Divide the CPU cores this process may use into one group per trial process
+    
+    Args:
+        cores_per_trial (int): Cores given to every trial
+        workers (int): Number of trial processes; 0 fits as many as there are groups
+        
+    Returns:
+        list: Lists of core ids
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    cores_per_trial = max(1, min(cores_per_trial, len(cores)))
+    groups = [cores[i:i + cores_per_trial] for i in range(0, len(cores) - cores_per_trial + 1, cores_per_trial)]
+    if workers:
+        # More processes than groups share the groups round-robin
+        groups = [groups[i % len(groups)] for i in range(workers)]
+    return groups
+
+def _init_worker(core_queue, method):
+    """
+    Pin a trial process to its cores and load the data once
+    
+    Args:
+        core_queue (multiprocessing.Queue): Core groups not taken yet
+        method (str): Preprocessing method of the data to train on
+    """
+    global _DATA
+    cores = core_queue.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    else:
+        print(f"Cannot pin to cores {cores} on this platform; the trial process is not pinned")
+    
+    # TensorFlow is imported after pinning so its thread pools match the cores
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(len(cores))
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, len(cores)))
+    
+    from train_model import load_data
+    X_train, y_train, X_val, y_val, _, _ = load_data(method=method)
+    _DATA = (X_train, y_train, X_val, y_val)
+
+def _run_trial(trial_id, model_type, hparams, start_epoch, stop_epoch, model_path, seed):
+    """
+    Train one trial from start_epoch up to stop_epoch in a pinned process
+    
+    Args:
+        trial_id (int): Trial number
+        model_type (str): Type of model to train
+        hparams (dict): Hyperparameters of the trial
+        start_epoch (int): Epochs already trained (the model is loaded from model_path)
+        stop_epoch (int): Epochs trained when this call returns
+        model_path (str): HDF5 file holding the trial's model and optimizer state
+        seed (int): Seed for the weights, the shuffling order and the augmentation
+        
+    Returns:
+        dict: Trial id, validation accuracy of every new epoch and training seconds
+    """
+    import tensorflow as tf
+    from model_building import build_model
+    from train_model import make_train_dataset, make_validation_dataset
+    
+    X_train, y_train, X_val, y_val = _DATA
+    batch_size = hparams['batch_size']
+    model_hparams = {key: value for key, value in hparams.items() if key != 'batch_size'}
+    steps_per_epoch = max(1, len(X_train) // batch_size)
+    
+    start = time.perf_counter()
+    if start_epoch == 0:
+        tf.keras.utils.set_random_seed(seed + trial_id)
+        model = build_model(model_type, hparams=model_hparams, summary=False)
+    else:
+        model = tf.keras.models.load_model(model_path)
+    
+    # The pipeline continues with the batches the trial has not seen yet
+    train_dataset = make_train_dataset(
+        X_train, y_train, batch_size=batch_size, seed=seed, start_batch=start_epoch * steps_per_epoch
+    )
+    validation_dataset = make_validation_dataset(X_val, y_val, batch_size=batch_size)
+    history = model.fit(
+        train_dataset,
+        steps_per_epoch=steps_per_epoch,
+        initial_epoch=start_epoch,
+        epochs=stop_epoch,
+        validation_data=validation_dataset,
+        verbose=0
+    )
+    model.save(model_path)
+    
+    return {
+        'trial_id': trial_id,
+        'val_accuracy': [float(value) for value in history.history['val_accuracy']],
+        'seconds': time.perf_counter() - start,
+    }
+
+class HyperbandSearch:
+    """
+    Hyperband over successive halving brackets of concurrently trained trials
+    """
+    
+    def __init__(self, executor, model_type, output_dir, max_epochs=DEFAULT_MAX_EPOCHS,
+                 eta=DEFAULT_ETA, seed=SEARCH_SEED):
+        """
+        Initialize the search
+        
+        Args:
+            executor (ProcessPoolExecutor): Pool of pinned trial processes
+            model_type (str): Type of model to tune
+            output_dir (str): Directory receiving the trial models and the leaderboard
+            max_epochs (int): Epochs of a trial that reaches the last rung
+            eta (int): Fraction of trials (1/eta) promoted at every rung
+            seed (int): Seed for sampling configurations and training the trials
+        """
+        self.executor = executor
+        self.model_type = model_type
+        self.output_dir = output_dir
+        self.max_epochs = max_epochs
+        self.eta = eta
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.trials = []
+        self.leaderboard_path = os.path.join(output_dir, 'leaderboard.json')
+        os.makedirs(os.path.join(output_dir, 'trials'), exist_ok=True)
+    
+    def new_trial(self, bracket):
+        """
+        Sample a configuration and register it as a trial
+        
+        Args:
+            bracket (int): Bracket the trial belongs to
+            
+        Returns:
+            dict: The trial record
+        """
+        trial_id = len(self.trials)
+        trial = {
+            'trial_id': trial_id,
+            'bracket': bracket,
+            'hparams': sample_config(self.rng, self.model_type),
+            'epochs': 0,
+            'val_accuracy': [],
+            'best_val_accuracy': None,
+            'seconds': 0.0,
+            'status': 'running',
+            'model_path': os.path.join(self.output_dir, 'trials', f'trial_{trial_id:03d}.h5'),
+        }
+        self.trials.append(trial)
+        return trial
+    
+    def run_rung(self, trials, epochs):
+        """
+        Train every trial up to the given number of epochs, concurrently
+        
+        Args:
+            trials (list): Trial records to train
+            epochs (int): Epochs every trial has trained when the rung ends
+        """
+        futures = [
+            self.executor.submit(
+                _run_trial, trial['trial_id'], self.model_type, trial['hparams'],
+                trial['epochs'], epochs, trial['model_path'], self.seed
+            )
+            for trial in trials if trial['epochs'] < epochs
+        ]
+        for future in futures:
+            result = future.result()
+            trial = self.trials[result['trial_id']]
+            trial['val_accuracy'].extend(result['val_accuracy'])
+            trial['epochs'] = len(trial['val_accuracy'])
+            trial['best_val_accuracy'] = max(trial['val_accuracy'])
+            trial['seconds'] += result['seconds']
+            print(f"  trial {trial['trial_id']:3d}: {trial['epochs']} epoch(s), "
+                  f"val_accuracy {trial['best_val_accuracy']:.4f} {trial['hparams']}")
+    
+    def successive_halving(self, bracket, num_trials, first_epochs):
+        """
+        Run one successive halving bracket
+        
+        Args:
+            bracket (int): Bracket number
+            num_trials (int): Trials started in the first rung
+            first_epochs (int): Epochs of the first rung
+        """
+        trials = [self.new_trial(bracket) for _ in range(num_trials)]
+        epochs = first_epochs
+        while True:
+            print(f"\nBracket {bracket}: {len(trials)} trial(s) to {epochs} epoch(s)")
+            self.run_rung(trials, epochs)
+            trials.sort(key=lambda trial: trial['best_val_accuracy'], reverse=True)
+            keep = len(trials) // self.eta
+            if epochs >= self.max_epochs or keep == 0:
+                for trial in trials:
+                    trial['status'] = 'complete'
+                self.write_leaderboard()
+                return
+            
+            for trial in trials[keep:]:
+                trial['status'] = 'pruned'
+                # A pruned trial is never resumed, so its model can go
+                if os.path.exists(trial['model_path']):
+                    os.remove(trial['model_path'])
+            trials = trials[:keep]
+            epochs = min(self.max_epochs, epochs * self.eta)
+            self.write_leaderboard()
+    
+    def run(self, scheduler='hyperband'):
+        """
+        Run the search
+        
+        Args:
+            scheduler (str): 'hyperband' for every bracket, 'sha' for only the
+                most aggressive successive halving bracket
+            
+        Returns:
+            dict: The best trial
+        """
+        brackets = hyperband_brackets(self.max_epochs, self.eta)
+        if scheduler == 'sha':
+            brackets = brackets[:1]
+        for bracket, (num_trials, first_epochs) in enumerate(brackets):
+            self.successive_halving(bracket, num_trials, first_epochs)
+        return self.ranking()[0]
+    
+    def ranking(self):
+        """
+        Sort the trials by validation accuracy, longest trained first on ties
+        
+        Returns:
+            list: Trial records, best first
+        """
+        trained = [trial for trial in self.trials if trial['val_accuracy']]
+        return sorted(trained, key=lambda trial: (trial['best_val_accuracy'], trial['epochs']), reverse=True)
+    
+    def write_leaderboard(self):
+        """Write the leaderboard atomically, so it can be read while the search runs"""
+        leaderboard = {
+            'model_type': self.model_type,
+            'max_epochs': self.max_epochs,
+            'eta': self.eta,
+            'seed': self.seed,
+            'search_space': {name: SEARCH_SPACE[name] for name in MODEL_HPARAMS[self.model_type]},
+            'trials': self.ranking(),
+        }
+        tmp_path = self.leaderboard_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(leaderboard, f, indent=2)
+        os.replace(tmp_path, self.leaderboard_path)
+
+def train_best(hparams_path, args):
+    """
+    Train the best configuration to completion with train_model.py
+    
+    Args:
+        hparams_path (str): JSON file with the best hyperparameters
+        args (argparse.Namespace): Arguments of the search
+        
+    Returns:
+        int: Exit code of train_model.py
+    """
+    command = [
+        sys.executable, os.path.join(SRC_DIR, 'train_model.py'),
+        '--hparams', hparams_path,
+        '--method', args.method,
+        '--model-type', args.model_type,
+        '--backend', 'tfdata',
+    ]
+    print(f"\nTraining the best configuration: {' '.join(command)}")
+    return subprocess.call(command)
+
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Tune the training hyperparameters with Hyperband and train the best configuration"
+    )
+    parser.add_argument(
+        '--method',
+        choices=['opencv', 'mediapipe'],
+        default='opencv',
+        help="Preprocessing method of the data to train on (default: opencv)"
+    )
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default='custom_cnn',
+        help="Model architecture to tune (default: custom_cnn)"
+    )
+    parser.add_argument(
+        '--scheduler',
+        choices=['hyperband', 'sha'],
+        default='hyperband',
+        help="Run every Hyperband bracket or only one successive halving bracket (default: hyperband)"
+    )
+    parser.add_argument(
+        '--max-epochs',
+        type=int,
+        default=DEFAULT_MAX_EPOCHS,
+        help=f"Epochs of a trial that reaches the last rung (default: {DEFAULT_MAX_EPOCHS})"
+    )
+    parser.add_argument(
+        '--eta',
+        type=int,
+        default=DEFAULT_ETA,
+        help=f"Keep the best 1/eta of the trials at every rung (default: {DEFAULT_ETA})"
+    )
+    parser.add_argument(
+        '--cores-per-trial',
+        type=int,
+        default=2,
+        help="CPU cores each trial process is pinned to (default: 2)"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help="Concurrent trial processes; 0 runs one per group of cores (default: 0)"
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=SEARCH_SEED,
+        help=f"Seed for sampling and training the trials (default: {SEARCH_SEED})"
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        help="Directory for the trial models and the leaderboard (default: models/search/<model type>)"
+    )
+    parser.add_argument(
+        '--no-final',
+        action='store_true',
+        help="Only search; do not train the best configuration afterwards"
+    )
+    args = parser.parse_args()
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+    if args.max_epochs < 1:
+        parser.error("--max-epochs must be at least 1")
+    return args
+
+def main():
+    """
+    Main function to run the search and train the best configuration
+    """
+    args = parse_args()
+    report_startup("hyperparameter_search")
+    output_dir = args.output_dir or os.path.join(SEARCH_DIR, args.model_type)
+    
+    groups = core_groups(args.cores_per_trial, args.workers)
+    print(f"Running {len(groups)} trial process(es) pinned to cores {groups}")
+    
+    # Spawned processes start without TensorFlow's threads, so pinning applies to all of them
+    context = multiprocessing.get_context('spawn')
+    core_queue = context.Queue()
+    for group in groups:
+        core_queue.put(group)
+    
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=len(groups), mp_context=context,
+        initializer=_init_worker, initargs=(core_queue, args.method)
+    ) as executor:
+        search = HyperbandSearch(
+            executor, args.model_type, output_dir,
+            max_epochs=args.max_epochs, eta=args.eta, seed=args.seed
+        )
+        best = search.run(args.scheduler)
+    
+    trial_epochs = sum(trial['epochs'] for trial in search.trials)
+    print(f"\nSearch finished in {time.perf_counter() - start:.1f} seconds: "
+          f"{len(search.trials)} trials, {trial_epochs} trial epochs")
+    print(f"Leaderboard saved to {search.leaderboard_path}")
+    print(f"Best trial {best['trial_id']}: val_accuracy {best['best_val_accuracy']:.4f} "
+          f"after {best['epochs']} epoch(s) with {best['hparams']}")
+    
+    best_path = os.path.join(output_dir, 'best_hparams.json')
+    with open(best_path, 'w') as f:
+        json.dump(best['hparams'], f, indent=2)
+    print(f"Best hyperparameters saved to {best_path}")
+    
+    if not args.no_final:
+        exit_code = train_best(best_path, args)
+        if exit_code:
+            sys.exit(f"Training the best configuration failed (exit code {exit_code})")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ Image-based Emotion Detector
 This script provides a simple GUI for emotion detection from static images.
 """
 
+from startup_timer import report_startup
 import os
 import cv2
 import numpy as np
@@ -264,6 +265,10 @@ def main():
     # Create application
     app = ImageEmotionDetector(root)
     
+    # Draw the window before reporting how long startup took
+    root.update()
+    report_startup("image_emotion_detector", "window shown")
+    
     # Start main loop
     root.mainloop()
 
@@ -0,0 +1,225 @@
+"""
+Inference Backends for the Real-Time Emotion Detectors
+
+This module:
+1. Defines the interface the detectors use to run an emotion model
+2. Implements it with Keras (.h5/.keras models), the TensorFlow Lite
+   interpreter (.tflite models, float or int8 quantized) and onnxruntime
+   (.onnx models from export_onnx.py)
+3. Selects the backend from the model file extension unless one is requested
+
+The TensorFlow Lite backend uses the standalone tflite_runtime (or
+ai_edge_litert) interpreter when it is installed, so loading a .tflite model
+never imports TensorFlow or Keras; without it, TensorFlow's own interpreter
+is used. The onnxruntime backend never imports TensorFlow.
+"""
+
+import os
+import numpy as np
+
+DEFAULT_NUM_THREADS = 1
+
+class InferenceBackend:
+    """
+    Runs an emotion model on batches of normalized faces
+    
+    Subclasses load the model in __init__ and implement predict.
+    """
+    
+    name = None
+    
+    def predict(self, faces):
+        """
+        Predict the emotion probabilities of a batch of faces
+        
+        Args:
+            faces (numpy.ndarray): Faces normalized to [0, 1], shape (n, 48, 48, 1)
+            
+        Returns:
+            numpy.ndarray: Class probabilities, shape (n, num_classes)
+        """
+        raise NotImplementedError
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({self.model_path!r})"
+
+class KerasBackend(InferenceBackend):
+    """
+    Backend calling a Keras model directly (without model.predict's per-call setup)
+    """
+    
+    name = 'keras'
+    
+    def __init__(self, model_path, num_threads=None, model=None):
+        """
+        Load the Keras model
+        
+        Args:
+            model_path (str): .h5 or .keras model file
+            num_threads (int): TensorFlow intra-op threads; None lets TensorFlow decide
+            model (tensorflow.keras.models.Model): Already loaded model to use
+                instead of loading model_path
+        """
+        import tensorflow as tf
+        if num_threads:
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            except RuntimeError:
+                print("TensorFlow is already initialized; keeping its thread settings")
+        self.model_path = model_path
+        self.model = model if model is not None else tf.keras.models.load_model(model_path)
+        self._predict = tf.function(lambda x: self.model(x, training=False))
+    
+    def predict(self, faces):
+        return self._predict(np.asarray(faces, dtype=np.float32)).numpy()
+
+def _tflite_interpreter_class():
+    """Get the TensorFlow Lite interpreter, preferring the standalone runtimes"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter
+
+class TFLiteBackend(InferenceBackend):
+    """
+    Backend running a TensorFlow Lite model in the interpreter
+    
+    The tensors are allocated once for single faces; faces are written
+    straight into the interpreter's input buffer, and quantized inputs and
+    outputs are converted with the tensors' scale and zero point.
+    """
+    
+    name = 'tflite'
+    
+    def __init__(self, model_path, num_threads=DEFAULT_NUM_THREADS):
+        """
+        Load the TensorFlow Lite model
+        
+        Args:
+            model_path (str): .tflite model file
+            num_threads (int): Interpreter threads
+        """
+        self.model_path = model_path
+        self.interpreter = _tflite_interpreter_class()(
+            model_path=model_path, num_threads=num_threads or DEFAULT_NUM_THREADS
+        )
+        self.interpreter.allocate_tensors()
+        self._input_details = self.interpreter.get_input_details()[0]
+        self._output_details = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input_details['shape'][0])
+        self._input = self.interpreter.tensor(self._input_details['index'])
+    
+    def _resize(self, batch_size):
+        """Reallocate the tensors for another batch size"""
+        shape = list(self._input_details['shape'])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self._input_details['index'], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+    
+    def predict(self, faces):
+        if len(faces) != self._batch_size:
+            self._resize(len(faces))
+        
+        details = self._input_details
+        if details['dtype'] == np.float32:
+            self._input()[...] = faces
+        else:
+            scale, zero_point = details['quantization']
+            info = np.iinfo(details['dtype'])
+            self._input()[...] = np.clip(np.round(np.asarray(faces) / scale + zero_point), info.min, info.max)
+        self.interpreter.invoke()
+        
+        details = self._output_details
+        output = self.interpreter.get_tensor(details['index'])
+        if details['dtype'] != np.float32:
+            scale, zero_point = details['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+class OnnxBackend(InferenceBackend):
+    """
+    Backend running an ONNX model in onnxruntime on the CPU
+    """
+    
+    name = 'onnx'
+    
+    def __init__(self, model_path, num_threads=DEFAULT_NUM_THREADS):
+        """
+        Load the ONNX model with all graph optimizations enabled
+        
+        Args:
+            model_path (str): .onnx model file
+            num_threads (int): Intra-op threads of the session
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime)") from None
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = num_threads or DEFAULT_NUM_THREADS
+        options.inter_op_num_threads = 1
+        
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+        self._output_names = [self.session.get_outputs()[0].name]
+    
+    def predict(self, faces):
+        return self.session.run(self._output_names, {self._input_name: np.asarray(faces, dtype=np.float32)})[0]
+
+# Backends by name, and the backend used for each model file extension
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend,
+}
+EXTENSION_BACKENDS = {
+    '.h5': 'keras',
+    '.keras': 'keras',
+    '.tflite': 'tflite',
+    '.onnx': 'onnx',
+}
+
+def backend_for_path(model_path):
+    """
+    Get the name of the backend that runs a model file
+    
+    Args:
+        model_path (str): Model file
+        
+    Returns:
+        str: Backend name
+    """
+    extension = os.path.splitext(model_path)[1].lower()
+    if extension not in EXTENSION_BACKENDS:
+        raise ValueError(
+            f"Cannot tell the backend of {model_path}; expected one of "
+            f"{', '.join(EXTENSION_BACKENDS)} or an explicit backend"
+        )
+    return EXTENSION_BACKENDS[extension]
+
+def load_backend(model_path, backend=None, num_threads=None):
+    """
+    Load a model into an inference backend
+    
+    Args:
+        model_path (str): Model file
+        backend (str): Backend name ('keras', 'tflite', 'onnx'); None chooses
+            it from the file extension
+        num_threads (int): Inference threads; None uses the backend's default
+        
+    Returns:
+        InferenceBackend: The loaded backend
+    """
+    backend = backend or backend_for_path(model_path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_path, num_threads=num_threads)
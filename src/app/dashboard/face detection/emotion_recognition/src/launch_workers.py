@@ -0,0 +1,188 @@
+"""
+Local Multi-Worker Training Launcher for Facial Emotion Recognition
+
+This script:
+1. Starts N train_model.py workers on this host, connected through TF_CONFIG
+2. Runs a single-worker baseline with the same threads per worker
+3. Reports the scaling efficiency from the chief workers' throughput metrics
+
+On a real cluster, set TF_CONFIG on every machine and run
+train_model.py --distributed --backend tfdata there instead.
+"""
+
+from startup_timer import report_startup
+import os
+import sys
+import json
+import socket
+import argparse
+import subprocess
+
+# Define constants
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(os.path.dirname(SRC_DIR), 'models')
+SCALING_DIR = os.path.join(MODELS_DIR, 'scaling')
+
+def free_ports(count):
+    """
+    Find TCP ports on localhost that are free right now
+    
+    Args:
+        count (int): Number of ports
+        
+    Returns:
+        list: Port numbers
+    """
+    sockets = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('localhost', 0))
+        sockets.append(sock)
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+def read_summary(output_dir, model_type):
+    """
+    Read the throughput summary the chief worker wrote
+    
+    Args:
+        output_dir (str): Output directory of the run
+        model_type (str): Type of model trained
+        
+    Returns:
+        dict: The summary record of training_monitor.ThroughputMonitor
+    """
+    path = os.path.join(output_dir, f'{model_type}_training_metrics.jsonl')
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    summaries = [record for record in records if record.get('summary')]
+    if not summaries:
+        raise RuntimeError(f"No throughput summary in {path}")
+    return summaries[-1]
+
+def run_workers(num_workers, train_args, output_dir, threads):
+    """
+    Train with a cluster of local workers and wait for all of them
+    
+    Args:
+        num_workers (int): Number of worker processes
+        train_args (list): Extra train_model.py arguments
+        output_dir (str): Output directory of the chief worker
+        threads (int): TensorFlow intra-op threads per worker
+        
+    Returns:
+        int: Exit code (0 when every worker succeeded)
+    """
+    cluster = {'worker': [f'localhost:{port}' for port in free_ports(num_workers)]}
+    command = [
+        sys.executable, os.path.join(SRC_DIR, 'train_model.py'),
+        '--distributed', '--backend', 'tfdata',
+        '--threads', str(threads),
+        '--output-dir', output_dir,
+    ] + train_args
+    
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': cluster, 'task': {'type': 'worker', 'index': index}})
+        # Only the chief's output is shown; the other workers log to their own directory
+        if index == 0:
+            processes.append(subprocess.Popen(command, env=env))
+        else:
+            log_dir = os.path.join(output_dir, 'workers', f'worker_{index}')
+            os.makedirs(log_dir, exist_ok=True)
+            with open(os.path.join(log_dir, 'train.log'), 'w') as log:
+                processes.append(subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT))
+    
+    exit_code = 0
+    for process in processes:
+        code = process.wait()
+        if code and not exit_code:
+            exit_code = code
+            # A lost worker blocks the collectives of the others forever
+            for other in processes:
+                if other.poll() is None:
+                    other.terminate()
+    return exit_code
+
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Arguments this script does not know are passed on to train_model.py.
+    
+    Returns:
+        tuple: (argparse.Namespace, list of train_model.py arguments)
+    """
+    parser = argparse.ArgumentParser(
+        description="Run multi-worker training on this host and report its scaling efficiency"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=2,
+        help="Number of local workers (default: 2)"
+    )
+    parser.add_argument(
+        '--threads-per-worker',
+        type=int,
+        default=0,
+        help="TensorFlow intra-op threads per worker; 0 divides the CPU cores between the workers (default: 0)"
+    )
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default='custom_cnn',
+        help="Model architecture to train (default: custom_cnn)"
+    )
+    parser.add_argument(
+        '--no-baseline',
+        action='store_true',
+        help="Skip the single-worker baseline run (no scaling efficiency is reported)"
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=SCALING_DIR,
+        help=f"Directory receiving one output directory per run (default: {SCALING_DIR})"
+    )
+    args, train_args = parser.parse_known_args()
+    return args, train_args + ['--model-type', args.model_type]
+
+def main():
+    """
+    Main function to run the local cluster and report scaling efficiency
+    """
+    args, train_args = parse_args()
+    report_startup("launch_workers")
+    
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    runs = [args.workers] if args.no_baseline else [1, args.workers]
+    
+    summaries = {}
+    for num_workers in runs:
+        output_dir = os.path.join(args.output_dir, f'workers_{num_workers}')
+        print(f"\nTraining with {num_workers} worker(s), {threads} thread(s) each -> {output_dir}")
+        exit_code = run_workers(num_workers, train_args, output_dir, threads)
+        if exit_code:
+            sys.exit(f"Training with {num_workers} worker(s) failed (exit code {exit_code})")
+        summaries[num_workers] = read_summary(output_dir, args.model_type)
+    
+    print("\nScaling report:")
+    print(f"{'Workers':>8s} {'Samples/sec':>12s} {'Speedup':>8s} {'Efficiency':>11s}")
+    baseline = summaries.get(1)
+    for num_workers, summary in summaries.items():
+        throughput = summary['samples_per_sec']
+        if baseline:
+            speedup = throughput / baseline['samples_per_sec']
+            print(f"{num_workers:8d} {throughput:12.1f} {speedup:7.2f}x {speedup / num_workers:10.0%}")
+        else:
+            print(f"{num_workers:8d} {throughput:12.1f} {'-':>8s} {'-':>11s}")
+    
+    if baseline and args.workers > 1:
+        print("\nEfficiency is the N-worker throughput over N times the single-worker throughput "
+              "with the same threads per worker.")
+
+if __name__ == "__main__":
+    main()
@@ -4,30 +4,62 @@ Model Building Script for Facial Emotion Recognition
 This script:
 1. Defines a CNN model architecture for emotion recognition
 2. Provides alternative model architectures using transfer learning
+   and compact depthwise-separable CNNs for real-time CPU inference
 3. Compiles the model with appropriate loss function and optimizer
+4. Optionally prepends augmentation layers that only run while training
+5. Writes a model card with the inference cost of every built model
 """
 
+from startup_timer import report_startup
 import os
+import argparse
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Sequential, Model
 from tensorflow.keras.layers import Dense, Dropout, Flatten, Conv2D, MaxPooling2D, BatchNormalization, Input
+from tensorflow.keras.layers import DepthwiseConv2D, GlobalAveragePooling2D, ReLU
+from tensorflow.keras.layers import RandomRotation, RandomTranslation, RandomZoom, RandomFlip
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.applications import VGG16, ResNet50
-from tensorflow.keras.utils import plot_model
+from model_card import write_model_card
 
 # Define constants
 MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
 IMAGE_SIZE = 48  # FER2013 images are 48x48 pixels
 NUM_CLASSES = 7  # 7 emotion classes
+AUGMENTATION_LAYER_NAME = 'augmentation'
+
+# Depthwise-separable stages of build_separable_cnn: (filters, strides) per block
+SEPARABLE_BLOCKS = [(32, 1), (64, 2), (64, 1), (128, 2), (128, 1), (256, 2), (256, 1)]
+
+# Width multipliers of the separable model types
+SEPARABLE_WIDTHS = {
+    'separable_cnn': 1.0,
+    'separable_cnn_small': 0.5,
+}
+
+MODEL_TYPES = ('custom_cnn', 'vgg16', 'resnet50') + tuple(SEPARABLE_WIDTHS)
+
+# In-graph augmentation matching train_model.AUGMENTATION_PARAMS (there is no shear layer)
+AUGMENTATION_LAYER_PARAMS = {
+    'rotation': 20 / 360,  # Fraction of a full turn
+    'translation': 0.2,
+    'zoom': 0.2,
+    'fill_mode': 'nearest',
+}
 
 # Ensure models directory exists
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-def build_custom_cnn():
+def build_custom_cnn(learning_rate=0.001, conv_dropout=0.25, dense_dropout=0.5):
     """
     Build a custom CNN model for emotion recognition
     
+    Args:
+        learning_rate (float): Adam learning rate
+        conv_dropout (float): Dropout rate after each convolutional block
+        dense_dropout (float): Dropout rate after each dense layer
+        
     Returns:
         tensorflow.keras.models.Sequential: The compiled model
     """
@@ -38,7 +70,7 @@ def build_custom_cnn():
         Conv2D(32, kernel_size=(3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
         
         # Second convolutional block
         Conv2D(64, kernel_size=(3, 3), activation='relu', padding='same'),
@@ -46,7 +78,7 @@ def build_custom_cnn():
         Conv2D(64, kernel_size=(3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
         
         # Third convolutional block
         Conv2D(128, kernel_size=(3, 3), activation='relu', padding='same'),
@@ -54,32 +86,36 @@ def build_custom_cnn():
         Conv2D(128, kernel_size=(3, 3), activation='relu', padding='same'),
         BatchNormalization(),
         MaxPooling2D(pool_size=(2, 2)),
-        Dropout(0.25),
+        Dropout(conv_dropout),
         
         # Flatten and dense layers
         Flatten(),
         Dense(512, activation='relu'),
         BatchNormalization(),
-        Dropout(0.5),
+        Dropout(dense_dropout),
         Dense(256, activation='relu'),
         BatchNormalization(),
-        Dropout(0.5),
+        Dropout(dense_dropout),
         Dense(NUM_CLASSES, activation='softmax')
     ])
     
     # Compile the model
     model.compile(
-        optimizer=Adam(learning_rate=0.001),
+        optimizer=Adam(learning_rate=learning_rate),
         loss='sparse_categorical_crossentropy',
         metrics=['accuracy']
     )
     
     return model
 
-def build_vgg16_transfer():
+def build_vgg16_transfer(learning_rate=0.0001, dense_dropout=0.5):
     """
     Build a transfer learning model using VGG16 as the base
     
+    Args:
+        learning_rate (float): Adam learning rate
+        dense_dropout (float): Dropout rate after each dense layer
+        
     Returns:
         tensorflow.keras.models.Model: The compiled model
     """
@@ -98,26 +134,30 @@ def build_vgg16_transfer():
     x = base_model(x)
     x = Flatten()(x)
     x = Dense(512, activation='relu')(x)
-    x = Dropout(0.5)(x)
+    x = Dropout(dense_dropout)(x)
     x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
+    x = Dropout(dense_dropout)(x)
     outputs = Dense(NUM_CLASSES, activation='softmax')(x)
     
     model = Model(inputs=inputs, outputs=outputs)
     
     # Compile the model
     model.compile(
-        optimizer=Adam(learning_rate=0.0001),  # Lower learning rate for transfer learning
+        optimizer=Adam(learning_rate=learning_rate),  # Lower learning rate for transfer learning
         loss='sparse_categorical_crossentropy',
         metrics=['accuracy']
     )
     
     return model
 
-def build_resnet50_transfer():
+def build_resnet50_transfer(learning_rate=0.0001, dense_dropout=0.5):
     """
     Build a transfer learning model using ResNet50 as the base
     
+    Args:
+        learning_rate (float): Adam learning rate
+        dense_dropout (float): Dropout rate after each dense layer
+        
     Returns:
         tensorflow.keras.models.Model: The compiled model
     """
@@ -135,64 +175,232 @@ def build_resnet50_transfer():
     x = base_model(x)
     x = Flatten()(x)
     x = Dense(512, activation='relu')(x)
-    x = Dropout(0.5)(x)
+    x = Dropout(dense_dropout)(x)
     x = Dense(256, activation='relu')(x)
-    x = Dropout(0.5)(x)
+    x = Dropout(dense_dropout)(x)
     outputs = Dense(NUM_CLASSES, activation='softmax')(x)
     
     model = Model(inputs=inputs, outputs=outputs)
     
     # Compile the model
     model.compile(
-        optimizer=Adam(learning_rate=0.0001),  # Lower learning rate for transfer learning
+        optimizer=Adam(learning_rate=learning_rate),  # Lower learning rate for transfer learning
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    
+    return model
+
+def _separable_block(x, filters, strides):
+    """Depthwise 3x3 then pointwise 1x1 convolution, each followed by batch norm and ReLU"""
+    x = DepthwiseConv2D((3, 3), strides=strides, padding='same', use_bias=False)(x)
+    x = BatchNormalization()(x)
+    x = ReLU()(x)
+    x = Conv2D(filters, (1, 1), use_bias=False)(x)
+    x = BatchNormalization()(x)
+    return ReLU()(x)
+
+def build_separable_cnn(learning_rate=0.001, dense_dropout=0.3, width=1.0):
+    """
+    Build a compact CNN of depthwise-separable convolutions for real-time CPU inference
+    
+    A separable block costs about a ninth of a full 3x3 convolution, and the
+    global-average-pooling head replaces the Flatten/Dense(512) head of the
+    custom CNN, so the model stays small enough for per-face inference at
+    webcam rates on one core.
+    
+    Measured with one TensorFlow thread pinned to one core, one face per call
+    (p50 latency, including about 1.3 ms of per-call overhead):
+        separable_cnn (width 1.0): 144,199 params, 13.3M MACs, 1.9 ms
+        separable_cnn_small (width 0.5): 39,719 params, 3.7M MACs, 1.4 ms
+        custom_cnn for comparison: 2,784,231 params, 88.3M MACs, 3.5 ms
+    
+    These are inference costs only. The test accuracy of both widths against
+    custom_cnn on FER2013 has not been measured yet; train both on the same
+    split before choosing it over custom_cnn.
+    
+    Args:
+        learning_rate (float): Adam learning rate
+        dense_dropout (float): Dropout rate before the classifier
+        width (float): Multiplier for the number of filters of every layer
+        
+    Returns:
+        tensorflow.keras.models.Model: The compiled model
+    """
+    def scaled(filters):
+        return max(8, int(filters * width))
+    
+    inputs = Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 1))
+    
+    # Full convolution stem (a depthwise convolution of one channel would learn little)
+    x = Conv2D(scaled(16), (3, 3), padding='same', use_bias=False)(inputs)
+    x = BatchNormalization()(x)
+    x = ReLU()(x)
+    
+    for filters, strides in SEPARABLE_BLOCKS:
+        x = _separable_block(x, scaled(filters), strides)
+    
+    # Global average pooling head
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(dense_dropout)(x)
+    outputs = Dense(NUM_CLASSES, activation='softmax')(x)
+    
+    model = Model(inputs=inputs, outputs=outputs, name=f'separable_cnn_{width:g}')
+    
+    # Compile the model
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
         loss='sparse_categorical_crossentropy',
         metrics=['accuracy']
     )
     
     return model
 
-def build_model(model_type='custom_cnn'):
+def build_augmentation_layers():
+    """
+    Build the random augmentation layers that run inside the model
+    
+    The layers only transform their input when called in training mode
+    (inside fit); in inference they pass the input through unchanged.
+    
+    Returns:
+        tensorflow.keras.models.Sequential: The augmentation block
+    """
+    params = AUGMENTATION_LAYER_PARAMS
+    return Sequential([
+        RandomRotation(params['rotation'], fill_mode=params['fill_mode']),
+        RandomTranslation(params['translation'], params['translation'], fill_mode=params['fill_mode']),
+        RandomZoom(params['zoom'], fill_mode=params['fill_mode']),
+        RandomFlip('horizontal'),
+    ], name=AUGMENTATION_LAYER_NAME)
+
+def add_augmentation(model):
+    """
+    Prepend the in-graph augmentation layers to a compiled model
+    
+    The returned model shares its weights with the original, which stays
+    available through strip_augmentation for saving and inference.
+    
+    Args:
+        model (tensorflow.keras.models.Model): The compiled model
+        
+    Returns:
+        tensorflow.keras.models.Model: The compiled model with augmentation
+    """
+    inputs = Input(shape=model.input_shape[1:])
+    x = build_augmentation_layers()(inputs)
+    outputs = model(x)
+    augmented = Model(inputs=inputs, outputs=outputs, name=f'{model.name}_augmented')
+    
+    # Train with the same optimizer settings, loss and metrics as the original
+    augmented.compile(
+        optimizer=model.optimizer.__class__.from_config(model.optimizer.get_config()),
+        loss=model.loss,
+        metrics=['accuracy']
+    )
+    
+    return augmented
+
+def strip_augmentation(model):
+    """
+    Get the inference model without the in-graph augmentation layers
+    
+    Args:
+        model (tensorflow.keras.models.Model): A model from build_model
+        
+    Returns:
+        tensorflow.keras.models.Model: The model without augmentation (the
+            model itself if it has none)
+    """
+    if AUGMENTATION_LAYER_NAME not in [layer.name for layer in model.layers]:
+        return model
+    return model.layers[-1]
+
+def build_model(model_type='custom_cnn', augment=False, hparams=None, summary=True, card=False, plot=False):
     """
     Build a model based on the specified type
     
     Args:
-        model_type (str): Type of model to build ('custom_cnn', 'vgg16', 'resnet50')
+        model_type (str): Type of model to build ('custom_cnn', 'vgg16', 'resnet50',
+            'separable_cnn', 'separable_cnn_small')
+        augment (bool): Whether to prepend the in-graph augmentation layers
+        hparams (dict): Optional builder arguments (learning_rate, dropout rates)
+        summary (bool): Whether to print the summary (and write the card or diagram)
+        card (bool): Whether to write the model card (params, FLOPs, weight
+            size and CPU latency) to MODELS_DIR; timing it takes a while
+        plot (bool): Whether to save the architecture diagram (needs pydot and graphviz)
         
     Returns:
         tensorflow.keras.models.Model: The compiled model
     """
+    hparams = hparams or {}
     if model_type == 'vgg16':
-        model = build_vgg16_transfer()
+        model = build_vgg16_transfer(**hparams)
     elif model_type == 'resnet50':
-        model = build_resnet50_transfer()
+        model = build_resnet50_transfer(**hparams)
+    elif model_type in SEPARABLE_WIDTHS:
+        model = build_separable_cnn(width=SEPARABLE_WIDTHS[model_type], **hparams)
     else:  # default to custom CNN
-        model = build_custom_cnn()
+        model = build_custom_cnn(**hparams)
+    
+    if augment:
+        model = add_augmentation(model)
+    
+    if not summary:
+        return model
     
     # Print model summary
     model.summary()
     
+    # The card describes the inference model, without augmentation layers
+    if card:
+        write_model_card(strip_augmentation(model), model_type, MODELS_DIR)
+    
     # Save model architecture diagram
-    plot_model(
-        model, 
-        to_file=os.path.join(MODELS_DIR, f'{model_type}_architecture.png'),
-        show_shapes=True,
-        show_layer_names=True
-    )
+    if plot:
+        # Only needed here, and it pulls in pydot and graphviz checks
+        from tensorflow.keras.utils import plot_model
+        plot_model(
+            model, 
+            to_file=os.path.join(MODELS_DIR, f'{model_type}_architecture.png'),
+            show_shapes=True,
+            show_layer_names=True
+        )
     
     return model
 
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Build the models and write their model cards")
+    parser.add_argument(
+        '--model-type',
+        nargs='+',
+        choices=MODEL_TYPES,
+        default=list(MODEL_TYPES),
+        help="Model architectures to build (default: all)"
+    )
+    parser.add_argument(
+        '--plot',
+        action='store_true',
+        help="Also save the architecture diagrams (needs pydot and graphviz)"
+    )
+    return parser.parse_args()
+
 def main():
     """
     Main function to demonstrate model building
     """
-    print("Building custom CNN model...")
-    custom_model = build_model('custom_cnn')
-    
-    print("\nBuilding VGG16 transfer learning model...")
-    vgg16_model = build_model('vgg16')
+    args = parse_args()
+    report_startup("model_building")
     
-    print("\nBuilding ResNet50 transfer learning model...")
-    resnet50_model = build_model('resnet50')
+    for model_type in args.model_type:
+        print(f"\nBuilding {model_type} model...")
+        build_model(model_type, card=True, plot=args.plot)
     
     print("\nModel building completed!")
 
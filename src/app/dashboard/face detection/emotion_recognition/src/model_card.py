@@ -0,0 +1,160 @@
+"""
+Model Cards for Facial Emotion Recognition
+
+This module:
+1. Counts the parameters and floating point operations of one inference
+2. Measures the size of the saved weight file
+3. Measures single-sample and batch-32 CPU latency (p50/p95) on this machine
+4. Writes these figures as a JSON model card next to the trained models
+"""
+
+import os
+import json
+import time
+import platform
+import tempfile
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+LATENCY_BATCH_SIZES = (1, 32)
+LATENCY_WARMUP_RUNS = 10
+LATENCY_RUNS = 100
+
+def _inference_function(model, batch_size):
+    """Trace the model's inference graph for a fixed batch size"""
+    spec = tf.TensorSpec((batch_size,) + tuple(model.input_shape[1:]), tf.float32)
+    return tf.function(lambda x: model(x, training=False)).get_concrete_function(spec)
+
+def count_flops(model):
+    """
+    Count the floating point operations of one single-sample inference
+    
+    Args:
+        model (tensorflow.keras.models.Model): The model
+        
+    Returns:
+        int: Floating point operations (a multiply-add counts as two)
+    """
+    frozen = convert_variables_to_constants_v2(_inference_function(model, 1))
+    options = tf.compat.v1.profiler.ProfileOptionBuilder.float_operation()
+    options['output'] = 'none'
+    return int(tf.compat.v1.profiler.profile(graph=frozen.graph, options=options).total_float_ops)
+
+def weight_file_size(model):
+    """
+    Get the size of the model saved for inference (HDF5, without optimizer state)
+    
+    Args:
+        model (tensorflow.keras.models.Model): The model
+        
+    Returns:
+        int: File size in bytes
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.h5')
+        model.save(path, include_optimizer=False)
+        return os.path.getsize(path)
+
+def measure_latency(model, batch_size=1, runs=LATENCY_RUNS, warmup_runs=LATENCY_WARMUP_RUNS):
+    """
+    Measure the CPU latency of the model's inference graph
+    
+    Args:
+        model (tensorflow.keras.models.Model): The model
+        batch_size (int): Number of faces per call
+        runs (int): Number of timed calls
+        warmup_runs (int): Untimed calls made first
+        
+    Returns:
+        dict: p50/p95/mean latency per call in milliseconds
+    """
+    function = _inference_function(model, batch_size)
+    x = tf.constant(np.random.default_rng(0).random(function.inputs[0].shape, dtype=np.float32))
+    
+    with tf.device('/CPU:0'):
+        for _ in range(warmup_runs):
+            function(x).numpy()
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            function(x).numpy()
+            times.append(time.perf_counter() - start)
+    
+    times = np.array(times) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(times, 50)), 3),
+        'p95_ms': round(float(np.percentile(times, 95)), 3),
+        'mean_ms': round(float(times.mean()), 3),
+    }
+
+def machine_info():
+    """
+    Describe the machine the latencies were measured on
+    
+    Returns:
+        dict: Platform, processor, core count and TensorFlow settings
+    """
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'tensorflow': tf.__version__,
+        'intra_op_threads': tf.config.threading.get_intra_op_parallelism_threads(),
+        'inter_op_threads': tf.config.threading.get_inter_op_parallelism_threads(),
+    }
+
+def build_model_card(model, model_type):
+    """
+    Collect the inference cost figures of a model
+    
+    Args:
+        model (tensorflow.keras.models.Model): The inference model
+            (without in-graph augmentation)
+        model_type (str): Type of the model
+        
+    Returns:
+        dict: The model card
+    """
+    flops = count_flops(model)
+    return {
+        'model_type': model_type,
+        'input_shape': list(model.input_shape[1:]),
+        'params': int(model.count_params()),
+        'trainable_params': int(sum(np.prod(weight.shape) for weight in model.trainable_weights)),
+        'flops_per_inference': flops,
+        'macs_per_inference': flops // 2,
+        'weight_file_bytes': weight_file_size(model),
+        'latency': {
+            f'batch_{batch_size}': measure_latency(model, batch_size)
+            for batch_size in LATENCY_BATCH_SIZES
+        },
+        'machine': machine_info(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def write_model_card(model, model_type, models_dir):
+    """
+    Build the model card and save it as <model_type>_model_card.json
+    
+    Args:
+        model (tensorflow.keras.models.Model): The inference model
+        model_type (str): Type of the model
+        models_dir (str): Directory receiving the card
+        
+    Returns:
+        dict: The model card
+    """
+    card = build_model_card(model, model_type)
+    path = os.path.join(models_dir, f'{model_type}_model_card.json')
+    with open(path, 'w') as f:
+        json.dump(card, f, indent=2)
+    
+    latency = card['latency']
+    print(f"\nModel card for {model_type}: {card['params']:,} params, "
+          f"{card['macs_per_inference'] / 1e6:.1f}M MACs, "
+          f"{card['weight_file_bytes'] / 2 ** 20:.1f} MB weights")
+    for name, figures in latency.items():
+        print(f"  {name}: p50 {figures['p50_ms']:.2f} ms, p95 {figures['p95_ms']:.2f} ms")
+    print(f"Model card saved to {path}")
+    return card
@@ -3,8 +3,14 @@ Advanced Emotion Detector with Pre-trained Model
 
 This script provides a high-accuracy emotion detection system using a pre-trained model.
 It includes a robust GUI and real-time webcam processing.
+
+The model is loaded on a background thread after the window is shown; until
+then predictions use the fallback heuristic. A .tflite or .onnx model (--model)
+runs in the TensorFlow Lite interpreter or onnxruntime instead of Keras (see
+inference_backend).
 """
 
+from startup_timer import report_startup
 import os
 import cv2
 import numpy as np
@@ -12,11 +18,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from PIL import Image, ImageTk
 import time
+import argparse
 import threading
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Dropout, Flatten, Conv2D, MaxPooling2D, BatchNormalization
-import matplotlib.pyplot as plt
+from inference_backend import BACKENDS, KerasBackend, load_backend
 
 # Define constants
 IMAGE_SIZE = (48, 48)
@@ -34,8 +38,11 @@ EMOTION_COLORS = {
 }
 
 class EmotionDetector:
-    def __init__(self, root):
+    def __init__(self, root, model_path=MODEL_PATH, backend=None, num_threads=None):
         self.root = root
+        self.model_path = model_path
+        self.backend_name = backend
+        self.num_threads = num_threads
         self.root.title("Advanced Emotion Detector")
         self.root.geometry("1000x700")
         
@@ -44,6 +51,7 @@ class EmotionDetector:
         self.cap = None
         self.face_cascade = None
         self.model = None
+        self.backend = None
         self.current_emotion = "No emotion detected"
         self.emotion_counts = {emotion: 0 for emotion in EMOTIONS}
         self.frame_count = 0
@@ -61,33 +69,51 @@ class EmotionDetector:
         except Exception as e:
             messagebox.showerror("Error", f"Error loading face cascade: {str(e)}")
         
-        # Load or create model
-        self.load_model()
-        
         # Create GUI
         self.create_gui()
         
         # Bind window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+        # Load or create the model once the window is up
+        self.root.after(0, self.load_model_in_background)
+    
+    def load_model_in_background(self):
+        """Load the model on a worker thread so the window stays responsive"""
+        self.status_label.config(text="Loading model...")
+        threading.Thread(target=self._load_model_thread, daemon=True).start()
+    
+    def _load_model_thread(self):
+        self.load_model()
+        report_startup("model_emotion_detector", "model loaded")
+        self.root.after(0, lambda: None if self.is_running else
+                        self.status_label.config(text="Model ready - Press 'Start Camera'"))
     
     def load_model(self):
-        """Load pre-trained model or create a new one if not found"""
+        """Load pre-trained model into its inference backend or create a new one if not found"""
         try:
-            if os.path.exists(MODEL_PATH):
-                self.model = tf.keras.models.load_model(MODEL_PATH)
-                print(f"Model loaded from {MODEL_PATH}")
+            if os.path.exists(self.model_path):
+                self.backend = load_backend(self.model_path, self.backend_name, self.num_threads)
+                print(f"Model loaded from {self.model_path} ({self.backend.name} backend)")
             else:
                 print("Pre-trained model not found. Creating a new model...")
                 self.create_model()
-                os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-                self.model.save(MODEL_PATH)
-                print(f"New model saved to {MODEL_PATH}")
+                if self.model_path.endswith('.h5'):
+                    os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
+                    self.model.save(self.model_path)
+                    print(f"New model saved to {self.model_path}")
+                self.backend = KerasBackend(self.model_path, self.num_threads, model=self.model)
         except Exception as e:
             print(f"Error loading/creating model: {e}")
             self.create_model()
+            self.backend = KerasBackend(self.model_path, self.num_threads, model=self.model)
     
     def create_model(self):
         """Create a CNN model for emotion detection"""
+        import tensorflow as tf
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import Dense, Dropout, Flatten, Conv2D, MaxPooling2D, BatchNormalization
+        
         model = Sequential()
         
         # First convolutional block
@@ -507,9 +533,9 @@ class EmotionDetector:
         face = np.expand_dims(face, axis=-1)
         
         # Get model predictions
-        if self.model is not None:
+        if self.backend is not None:
             try:
-                predictions = self.model.predict(face, verbose=0)[0]
+                predictions = self.backend.predict(face)[0]
                 
                 # Get the emotion with highest probability
                 max_index = np.argmax(predictions)
@@ -640,12 +666,45 @@ class EmotionDetector:
         # Destroy the window
         self.root.destroy()
 
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Detect emotions from the webcam with a trained model")
+    parser.add_argument(
+        '--model',
+        default=MODEL_PATH,
+        help="Model file: .h5/.keras (Keras), .tflite (TensorFlow Lite) or .onnx (onnxruntime) (default: models/emotion_model.h5)"
+    )
+    parser.add_argument(
+        '--backend',
+        choices=list(BACKENDS),
+        default=None,
+        help="Inference backend; by default chosen from the model file extension"
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=None,
+        help="Inference threads (default: 1 for TensorFlow Lite and onnxruntime, TensorFlow's choice for Keras)"
+    )
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    
     # Create root window
     root = tk.Tk()
     
     # Create application
-    app = EmotionDetector(root)
+    app = EmotionDetector(root, model_path=args.model, backend=args.backend, num_threads=args.threads)
+    
+    # Draw the window before reporting how long startup took
+    root.update()
+    report_startup("model_emotion_detector", "window shown")
     
     # Start main loop
     root.mainloop()
@@ -0,0 +1,170 @@
+"""
+Offline Data Augmentation for Facial Emotion Recognition
+
+This module:
+1. Pre-renders K augmented copies (epochs) of the training split
+2. Spreads the rendering over worker processes, one shard of samples at a time
+3. Stores every epoch as a uint8 .npy file that training memory-maps
+4. Reuses already rendered epochs when the data and parameters are unchanged
+"""
+
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tqdm import tqdm
+from processed_store import load_manifest, load_split, run_fingerprint, IMAGES_NAME
+
+AUGMENTED_DIR_NAME = 'augmented'
+INFO_NAME = 'augmented.json'
+DEFAULT_SHARD_SIZE = 1024  # Samples rendered per worker task
+
+# Per-process state of the rendering pool, set by _init_worker
+_worker_state = {}
+
+def _init_worker(method_dir, params):
+    """Open the training split and build the augmentation once per worker"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    X, _ = load_split(method_dir, 'train', mmap_mode='r')
+    _worker_state['X'] = X
+    _worker_state['datagen'] = ImageDataGenerator(**params)
+
+def _sample_seed(seed, epoch, index, num_samples):
+    """Seed of one augmented sample, independent of how the work is sharded"""
+    return ((seed * 7919 + epoch) * num_samples + index) % (2 ** 32)
+
+def _render_shard(path, epoch, start, stop, seed):
+    """Augment samples [start, stop) of the training split into an epoch file"""
+    X, datagen = _worker_state['X'], _worker_state['datagen']
+    batch = np.asarray(X[start:stop], dtype=np.float32)
+    
+    # The transforms are geometric, so they can run on raw 0-255 pixel values
+    for i in range(len(batch)):
+        batch[i] = datagen.random_transform(batch[i], seed=_sample_seed(seed, epoch, start + i, len(X)))
+    
+    out = np.load(path, mmap_mode='r+')
+    out[start:stop] = np.clip(np.rint(batch), 0, 255).astype(np.uint8)
+    out.flush()
+    return stop - start
+
+def augmented_dir(method_dir, params, seed):
+    """
+    Get the directory holding the augmented epochs for a configuration
+    
+    The directory is keyed on the augmentation parameters, the seed and the
+    stored training split, so a re-run of data preparation or a new split
+    never reuses stale epochs.
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        params (dict): ImageDataGenerator augmentation parameters
+        seed (int): Base random seed of the augmentation
+        
+    Returns:
+        str: Directory of the augmented epochs
+    """
+    manifest = load_manifest(method_dir)
+    if manifest is None:
+        raise ValueError("Offline augmentation needs the uint8 store; please re-run data_preparation.py")
+    
+    X, _ = load_split(method_dir, 'train', mmap_mode='r')
+    stat = os.stat(os.path.join(method_dir, IMAGES_NAME))
+    fingerprint = run_fingerprint({
+        'params': params,
+        'seed': seed,
+        'train': hashlib.sha256(np.ascontiguousarray(X.indices).tobytes()).hexdigest(),
+        'store': [stat.st_size, stat.st_mtime_ns],
+    })
+    return os.path.join(method_dir, AUGMENTED_DIR_NAME, fingerprint)
+
+def epoch_path(epochs_dir, epoch):
+    """
+    Get the file of one augmented epoch
+    
+    Args:
+        epochs_dir (str): Directory from augmented_dir
+        epoch (int): Epoch number
+        
+    Returns:
+        str: Path of the epoch's .npy file
+    """
+    return os.path.join(epochs_dir, f'epoch_{epoch:03d}.npy')
+
+def render_epochs(method_dir, params, num_epochs, workers=1, seed=0, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Pre-render augmented epochs of the training split
+    
+    Every epoch is written to a temporary file and renamed once complete,
+    so an interrupted run only re-renders the epochs it had not finished.
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        params (dict): ImageDataGenerator augmentation parameters
+        num_epochs (int): Number of augmented epochs (K)
+        workers (int): Number of worker processes (1 renders in this process)
+        seed (int): Base random seed of the augmentation
+        shard_size (int): Number of samples rendered per worker task
+        
+    Returns:
+        str: Directory of the augmented epochs
+    """
+    epochs_dir = augmented_dir(method_dir, params, seed)
+    os.makedirs(epochs_dir, exist_ok=True)
+    X, _ = load_split(method_dir, 'train', mmap_mode='r')
+    
+    with open(os.path.join(epochs_dir, INFO_NAME), 'w') as f:
+        json.dump({'params': params, 'seed': seed, 'samples': len(X), 'shape': list(X.shape)}, f, indent=2)
+    
+    todo = [epoch for epoch in range(num_epochs) if not os.path.exists(epoch_path(epochs_dir, epoch))]
+    if not todo:
+        print(f"All {num_epochs} augmented epochs already rendered in {epochs_dir}")
+        return epochs_dir
+    
+    print(f"Rendering {len(todo)} augmented epoch(s) of {len(X)} samples with {workers} worker(s)...")
+    tasks = []
+    for epoch in todo:
+        tmp_path = epoch_path(epochs_dir, epoch)[:-len('.npy')] + '.tmp.npy'
+        np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=X.shape).flush()
+        tasks.extend((tmp_path, epoch, start, min(start + shard_size, len(X)), seed)
+                     for start in range(0, len(X), shard_size))
+    
+    start_time = time.perf_counter()
+    if workers > 1:
+        # Spawned workers: TensorFlow state is not fork-safe
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(method_dir, params)
+        ) as executor:
+            futures = [executor.submit(_render_shard, *task) for task in tasks]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Rendering shards"):
+                future.result()
+    else:
+        _init_worker(method_dir, params)
+        for task in tqdm(tasks, desc="Rendering shards"):
+            _render_shard(*task)
+    elapsed = time.perf_counter() - start_time
+    
+    for epoch in todo:
+        os.replace(epoch_path(epochs_dir, epoch)[:-len('.npy')] + '.tmp.npy', epoch_path(epochs_dir, epoch))
+    
+    rendered = len(todo) * len(X)
+    print(f"Rendered {rendered} samples in {elapsed:.2f} seconds ({rendered / max(elapsed, 1e-9):.0f} samples/sec)")
+    return epochs_dir
+
+def load_epochs(epochs_dir, num_epochs):
+    """
+    Open the rendered epochs memory-mapped
+    
+    Args:
+        epochs_dir (str): Directory from render_epochs
+        num_epochs (int): Number of epochs to open
+        
+    Returns:
+        list: uint8 memory maps of shape (N, 48, 48, 1), one per epoch
+    """
+    return [np.load(epoch_path(epochs_dir, epoch), mmap_mode='r') for epoch in range(num_epochs)]
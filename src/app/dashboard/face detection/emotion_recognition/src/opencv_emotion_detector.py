@@ -5,6 +5,7 @@ This script provides an emotion detection system using OpenCV's Haar cascades
 and a simplified rule-based approach for emotion classification.
 """
 
+from startup_timer import report_startup
 import os
 import cv2
 import numpy as np
@@ -877,6 +878,10 @@ def main():
     # Create application
     app = EmotionDetector(root)
     
+    # Draw the window before reporting how long startup took
+    root.update()
+    report_startup("opencv_emotion_detector", "window shown")
+    
     # Start main loop
     root.mainloop()
 
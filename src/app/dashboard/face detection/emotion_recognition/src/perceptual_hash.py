@@ -0,0 +1,159 @@
+"""
+Perceptual Hash Index for Facial Emotion Recognition
+
+This module:
+1. Computes a 64-bit difference hash (dHash) of every image
+2. Stores the hashes in sorted block tables that answer Hamming-radius queries
+3. Groups exact and near-duplicate images into clusters
+"""
+
+import numpy as np
+import cv2
+
+HASH_SIZE = 8  # dHash compares neighbouring pixels on a HASH_SIZE x HASH_SIZE grid
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DEFAULT_RADIUS = 4  # Images whose hashes differ in at most this many bits are near-duplicates
+
+# Number of set bits in every byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def dhash(images):
+    """
+    Compute the difference hash of every image
+    
+    Each image is shrunk to (HASH_SIZE + 1) x HASH_SIZE pixels and every bit
+    records whether a pixel is brighter than its left neighbour, so the hash
+    survives rescaling, small shifts and brightness changes.
+    
+    Args:
+        images (numpy.ndarray): uint8 images of shape (N, H, W) or (N, H, W, 1)
+        
+    Returns:
+        numpy.ndarray: uint64 hashes of shape (N,)
+    """
+    bits = np.empty((len(images), HASH_SIZE, HASH_SIZE), dtype=bool)
+    for i in range(len(images)):
+        img = np.asarray(images[i], dtype=np.uint8)
+        small = cv2.resize(img.reshape(img.shape[:2]), (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+        bits[i] = small[:, 1:] > small[:, :-1]
+    
+    packed = np.packbits(bits.reshape(len(images), HASH_BITS), axis=1)
+    return packed.view('>u8').ravel().astype(np.uint64)
+
+def hamming_distance(hashes, other):
+    """
+    Count the differing bits between hashes
+    
+    Args:
+        hashes (numpy.ndarray): uint64 hashes
+        other (numpy.ndarray or int): uint64 hash(es) broadcast against hashes
+        
+    Returns:
+        numpy.ndarray: Number of differing bits for every hash
+    """
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.asarray(other, dtype=np.uint64))
+    diff = np.ascontiguousarray(diff).reshape(-1)
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class HashIndex:
+    """
+    Hamming-radius index over 64-bit perceptual hashes
+    
+    The hash bits are cut into radius + 1 blocks. Two hashes within the
+    radius must agree exactly on at least one block, so each block is kept
+    as a sorted array and candidates are found by binary search before
+    their full distance is checked.
+    """
+    
+    def __init__(self, hashes, radius=DEFAULT_RADIUS):
+        """
+        Build the index
+        
+        Args:
+            hashes (numpy.ndarray): uint64 hashes from dhash
+            radius (int): Largest query radius the index supports
+        """
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.radius = radius
+        
+        bounds = np.linspace(0, HASH_BITS, radius + 2).astype(int)
+        self.blocks = []
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            shift = np.uint64(low)
+            mask = np.uint64((1 << int(high - low)) - 1)
+            values = (self.hashes >> shift) & mask
+            order = np.argsort(values, kind='stable')
+            self.blocks.append((shift, mask, values[order], order))
+    
+    def __len__(self):
+        return len(self.hashes)
+    
+    def query(self, hash_value, radius=None):
+        """
+        Find the indexed hashes within a Hamming radius of a hash
+        
+        Args:
+            hash_value (int): uint64 hash to look up
+            radius (int): Search radius; defaults to (and may not exceed) the index radius
+            
+        Returns:
+            numpy.ndarray: Sorted indices of the matching hashes
+        """
+        radius = self.radius if radius is None else radius
+        if radius > self.radius:
+            raise ValueError(f"Query radius {radius} exceeds the index radius {self.radius}")
+        
+        hash_value = np.uint64(hash_value)
+        candidates = []
+        for shift, mask, values, order in self.blocks:
+            key = (hash_value >> shift) & mask
+            start = np.searchsorted(values, key, side='left')
+            stop = np.searchsorted(values, key, side='right')
+            candidates.append(order[start:stop])
+        
+        candidates = np.unique(np.concatenate(candidates))
+        return candidates[hamming_distance(self.hashes[candidates], hash_value) <= radius]
+    
+    def clusters(self):
+        """
+        Group the indexed hashes into near-duplicate clusters
+        
+        Hashes within the index radius of each other end up in the same
+        cluster, transitively (single linkage).
+        
+        Returns:
+            numpy.ndarray: Cluster id of every hash, numbered from 0 in order
+                of first appearance
+        """
+        # Identical hashes are merged up front so large duplicate groups stay cheap
+        unique, inverse = np.unique(self.hashes, return_inverse=True)
+        parent = np.arange(len(unique))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for shift, mask, _, _ in self.blocks:
+            values = (unique >> shift) & mask
+            order = np.argsort(values, kind='stable')
+            sorted_values = values[order]
+            run_starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+            run_stops = np.r_[run_starts[1:], len(order)]
+            
+            for start, stop in zip(run_starts, run_stops):
+                members = order[start:stop]
+                for j in range(len(members) - 1):
+                    close = members[j + 1:][hamming_distance(unique[members[j + 1:]], unique[members[j]]) <= self.radius]
+                    root = find(members[j])
+                    for other in close:
+                        parent[find(other)] = root
+        
+        roots = np.array([find(i) for i in range(len(unique))], dtype=np.int64)[inverse]
+        
+        # Number the clusters in order of their first member
+        _, first_seen, labels = np.unique(roots, return_index=True, return_inverse=True)
+        rank = np.empty(len(first_seen), dtype=np.int64)
+        rank[np.argsort(first_seen, kind='stable')] = np.arange(len(first_seen))
+        return rank[labels]
@@ -0,0 +1,253 @@
+"""
+Staged Pipeline with Per-Stage Artifact Caching
+
+This module:
+1. Describes a pipeline as named stages with dependencies and parameters
+2. Fingerprints every stage from its parameters and its upstream fingerprints
+3. Caches each stage's output arrays on disk under that fingerprint
+4. Re-runs only the stages whose fingerprint changed (or that are forced,
+   together with every stage downstream of them)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+
+STAGE_INFO_NAME = 'stage.json'
+
+class Stage:
+    """
+    A named pipeline step whose outputs are cached on disk
+    """
+    
+    def __init__(self, name, run, deps=(), params=None, version=1, is_complete=None):
+        """
+        Initialize the stage
+        
+        Args:
+            name (str): Unique stage name
+            run (callable): Called as run(inputs, params) where inputs maps each
+                dependency name to its output dict; returns a dict of numpy arrays
+            deps (tuple): Names of the stages whose outputs this stage consumes
+            params (dict): JSON-serializable parameters that affect the outputs
+            version (int): Bump to invalidate cached outputs after a code change
+            is_complete (callable): Optional check is_complete(fingerprint) for
+                stages that write their result outside the stage cache
+        """
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.params = params or {}
+        self.version = version
+        self.is_complete = is_complete
+
+class Pipeline:
+    """
+    A DAG of stages with fingerprint-keyed artifact caching
+    """
+    
+    def __init__(self, stages, cache_dir):
+        """
+        Initialize the pipeline
+        
+        Args:
+            stages (list): Stages in dependency order
+            cache_dir (str): Directory holding the cached stage outputs
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.cache_dir = cache_dir
+        self._fingerprints = {}
+        
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages or self.order.index(dep) >= self.order.index(stage.name):
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown or later stage '{dep}'")
+    
+    def fingerprint(self, name):
+        """
+        Fingerprint a stage from its parameters and upstream fingerprints
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            str: Hex digest identifying the stage's outputs
+        """
+        if name not in self._fingerprints:
+            stage = self.stages[name]
+            config = {
+                'stage': name,
+                'version': stage.version,
+                'params': stage.params,
+                'deps': {dep: self.fingerprint(dep) for dep in stage.deps},
+            }
+            digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+            self._fingerprints[name] = digest.hexdigest()[:16]
+        return self._fingerprints[name]
+    
+    def stage_dir(self, name):
+        """
+        Get the cache directory for the current fingerprint of a stage
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            str: Directory holding the stage's cached outputs
+        """
+        return os.path.join(self.cache_dir, name, self.fingerprint(name))
+    
+    def is_cached(self, name):
+        """
+        Check whether a stage's outputs for its current fingerprint exist
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            bool: True if the stage does not need to run
+        """
+        stage = self.stages[name]
+        if stage.is_complete is not None:
+            return stage.is_complete(self.fingerprint(name))
+        return os.path.exists(os.path.join(self.stage_dir(name), STAGE_INFO_NAME))
+    
+    def load(self, name):
+        """
+        Load the cached outputs of a stage (memory-mapped)
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            dict: Maps output name to numpy array
+        """
+        stage_dir = self.stage_dir(name)
+        with open(os.path.join(stage_dir, STAGE_INFO_NAME)) as f:
+            info = json.load(f)
+        return {
+            output: np.load(os.path.join(stage_dir, f'{output}.npy'), mmap_mode='r')
+            for output in info['outputs']
+        }
+    
+    def _save(self, name, outputs, elapsed):
+        """Atomically write the outputs of a stage to its cache directory"""
+        stage_dir = self.stage_dir(name)
+        tmp_dir = stage_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        
+        for output, array in outputs.items():
+            np.save(os.path.join(tmp_dir, f'{output}.npy'), array)
+        
+        info = {
+            'stage': name,
+            'fingerprint': self.fingerprint(name),
+            'params': self.stages[name].params,
+            'deps': {dep: self.fingerprint(dep) for dep in self.stages[name].deps},
+            'outputs': sorted(outputs),
+            'elapsed_seconds': round(elapsed, 3),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with open(os.path.join(tmp_dir, STAGE_INFO_NAME), 'w') as f:
+            json.dump(info, f, indent=2)
+        
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        os.replace(tmp_dir, stage_dir)
+    
+    def upstream(self, name):
+        """
+        List a stage and all stages it depends on, in pipeline order
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            list: Stage names
+        """
+        needed = {name}
+        for stage_name in reversed(self.order):
+            if stage_name in needed:
+                needed.update(self.stages[stage_name].deps)
+        return [stage_name for stage_name in self.order if stage_name in needed]
+    
+    def downstream(self, name):
+        """
+        List a stage and all stages that depend on it, in pipeline order
+        
+        Args:
+            name (str): Stage name
+            
+        Returns:
+            list: Stage names
+        """
+        affected = {name}
+        for stage_name in self.order:
+            if affected.intersection(self.stages[stage_name].deps):
+                affected.add(stage_name)
+        return [stage_name for stage_name in self.order if stage_name in affected]
+    
+    def run(self, target=None, force=()):
+        """
+        Run the stages needed for a target, reusing cached outputs
+        
+        Args:
+            target (str): Stage to produce; defaults to the last stage
+            force (iterable): Stage names to rebuild even if cached; the
+                stages downstream of them are rebuilt as well, since their
+                cached outputs were made from the old results
+            
+        Returns:
+            dict: Outputs of the target stage
+        """
+        target = target or self.order[-1]
+        needed = self.upstream(target)
+        force = {downstream for name in force for downstream in self.downstream(name)}
+        
+        # Walk back from the target to find which stages must actually run
+        to_run = set()
+        for name in reversed(needed):
+            required = name == target or name in force or any(name in self.stages[other].deps for other in to_run)
+            if required and (name in force or not self.is_cached(name)):
+                to_run.add(name)
+        
+        outputs = {}
+        for name in needed:
+            stage = self.stages[name]
+            if name not in to_run:
+                if any(name in self.stages[other].deps for other in to_run):
+                    print(f"[{name}] cached ({self.fingerprint(name)})")
+                    outputs[name] = self.load(name)
+                elif name == target:
+                    print(f"[{name}] cached ({self.fingerprint(name)})")
+                continue
+            
+            print(f"[{name}] running ({self.fingerprint(name)})...")
+            start_time = time.time()
+            result = stage.run({dep: outputs[dep] for dep in stage.deps}, stage.params) or {}
+            elapsed = time.time() - start_time
+            
+            if stage.is_complete is None:
+                self._save(name, result, elapsed)
+                outputs[name] = self.load(name)
+            else:
+                outputs[name] = result
+            print(f"[{name}] done in {elapsed:.2f} seconds")
+        
+        return outputs.get(target, {})
+    
+    def status(self):
+        """
+        Describe the cache status of every stage
+        
+        Returns:
+            list: (name, deps, fingerprint, cached) tuples in pipeline order
+        """
+        return [
+            (name, self.stages[name].deps, self.fingerprint(name), self.is_cached(name))
+            for name in self.order
+        ]
@@ -0,0 +1,477 @@
+"""
+Processed Dataset Store for Facial Emotion Recognition
+
+This module:
+1. Saves preprocessed faces as raw uint8 pixels and int8 labels in .npy files
+2. Stores the train/val/test splits as index arrays into those files
+3. Records shape, dtype and normalization in a small JSON manifest
+4. Opens the stored arrays memory-mapped so loaders only read what they use
+5. Normalizes pixel values lazily, one batch at a time
+6. Tracks completed shards of a store being filled so a run can resume
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+# Define constants
+IMAGE_SIZE = 48  # FER2013 images are 48x48 pixels
+MANIFEST_NAME = 'manifest.json'
+STORE_FORMAT = 'uint8-npy'
+STORE_VERSION = 2
+SPLITS = ('train', 'val', 'test')
+IMAGES_NAME = 'images.npy'
+LABELS_NAME = 'labels.npy'
+SPLITS_NAME = 'splits.npz'
+PROGRESS_NAME = 'progress.json'
+CLUSTERS_NAME = 'clusters.npy'
+
+# Stored pixels are divided by this value when a batch is read
+PIXEL_SCALE = 255.0
+
+def manifest_path(method_dir):
+    """
+    Get the path of the manifest for a processed dataset directory
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        
+    Returns:
+        str: Path of the JSON manifest
+    """
+    return os.path.join(method_dir, MANIFEST_NAME)
+
+def write_manifest(method_dir, manifest):
+    """
+    Atomically write the manifest of a processed dataset
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        manifest (dict): Manifest contents
+    """
+    path = manifest_path(method_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def load_manifest(method_dir):
+    """
+    Load the manifest of a processed dataset
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        
+    Returns:
+        dict: The manifest, or None if the directory uses the legacy layout
+    """
+    path = manifest_path(method_dir)
+    if not os.path.exists(path):
+        return None
+    
+    with open(path) as f:
+        manifest = json.load(f)
+    
+    if manifest.get('format') != STORE_FORMAT:
+        raise ValueError(f"Unsupported processed data format in {path}: {manifest.get('format')}")
+    if manifest.get('version') != STORE_VERSION:
+        raise ValueError(
+            f"Processed data in {method_dir} uses store version {manifest.get('version')}, "
+            f"expected {STORE_VERSION}. Please re-run data_preparation.py"
+        )
+    if manifest['normalization']['scale'] != PIXEL_SCALE:
+        raise ValueError(f"Unsupported normalization in {path}: {manifest['normalization']}")
+    
+    return manifest
+
+class SplitView:
+    """
+    Lazy view of one split of the image store
+    
+    Indexing the view fancy-indexes the memory-mapped image array with the
+    split's indices, so only the requested samples are read from disk.
+    """
+    
+    def __init__(self, images, indices):
+        """
+        Initialize the view
+        
+        Args:
+            images (numpy.ndarray): Memory-mapped image store
+            indices (numpy.ndarray): Indices of the split's samples in the store
+        """
+        self.images = images
+        self.indices = indices
+    
+    @property
+    def shape(self):
+        return (len(self.indices),) + self.images.shape[1:]
+    
+    @property
+    def dtype(self):
+        return self.images.dtype
+    
+    def __len__(self):
+        return len(self.indices)
+    
+    def __getitem__(self, key):
+        return self.images[self.indices[key]]
+    
+    def __array__(self, dtype=None):
+        array = self.images[self.indices]
+        return array if dtype is None else array.astype(dtype)
+
+def save_store(method_dir, images, labels, splits, method, split_info=None, **metadata):
+    """
+    Save preprocessed images as uint8 pixels and int8 labels with a manifest
+    
+    Args:
+        method_dir (str): Directory to write the processed dataset to
+        images (numpy.ndarray): uint8 images of shape (N, 48, 48) or (N, 48, 48, 1)
+        labels (numpy.ndarray): Emotion labels of shape (N,)
+        splits (dict): Maps split name to an array of indices into images
+        method (str): Preprocessing method used ('opencv' or 'mediapipe')
+        split_info (dict): Extra fields recorded with the splits (e.g. the seed)
+        **metadata: Extra JSON-serializable fields recorded in the manifest
+        
+    Returns:
+        dict: The written manifest
+    """
+    os.makedirs(method_dir, exist_ok=True)
+    
+    images = np.ascontiguousarray(images, dtype=np.uint8).reshape(len(images), IMAGE_SIZE, IMAGE_SIZE, 1)
+    np.save(os.path.join(method_dir, IMAGES_NAME), images)
+    np.save(os.path.join(method_dir, LABELS_NAME), np.asarray(labels).astype(np.int8))
+    
+    return finalize_store(method_dir, len(images), splits, method, split_info, **metadata)
+
+def create_store(method_dir, num_samples):
+    """
+    Preallocate memory-mapped image and label files to be filled incrementally
+    
+    Any existing manifest and progress file are removed first, so neither
+    readers nor resumed runs see state that does not match the new arrays.
+    Call finalize_store once every sample has been written.
+    
+    Args:
+        method_dir (str): Directory to write the processed dataset to
+        num_samples (int): Total number of samples in the dataset
+        
+    Returns:
+        tuple: (images, labels) writable memory maps
+    """
+    os.makedirs(method_dir, exist_ok=True)
+    for name in (MANIFEST_NAME, PROGRESS_NAME):
+        if os.path.exists(os.path.join(method_dir, name)):
+            os.remove(os.path.join(method_dir, name))
+    
+    images = np.lib.format.open_memmap(
+        os.path.join(method_dir, IMAGES_NAME),
+        mode='w+',
+        dtype=np.uint8,
+        shape=(num_samples, IMAGE_SIZE, IMAGE_SIZE, 1)
+    )
+    labels = np.lib.format.open_memmap(
+        os.path.join(method_dir, LABELS_NAME),
+        mode='w+',
+        dtype=np.int8,
+        shape=(num_samples,)
+    )
+    return images, labels
+
+def run_fingerprint(config):
+    """
+    Fingerprint the configuration of a preprocessing run
+    
+    Args:
+        config (dict): JSON-serializable settings that affect the output
+        
+    Returns:
+        str: Hex digest identifying the configuration
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+class ShardProgress:
+    """
+    Checkpoint of the shard ranges already committed to a store
+    
+    The progress file is rewritten atomically after the shard's arrays have
+    been flushed, so every range it lists is safely on disk.
+    """
+    
+    def __init__(self, method_dir, num_samples, fingerprint, completed=()):
+        """
+        Initialize the checkpoint
+        
+        Args:
+            method_dir (str): Directory holding the store being filled
+            num_samples (int): Total number of samples in the store
+            fingerprint (str): Fingerprint of the run from run_fingerprint
+            completed (iterable): Already committed (start, stop) ranges
+        """
+        self.path = os.path.join(method_dir, PROGRESS_NAME)
+        self.num_samples = int(num_samples)
+        self.fingerprint = fingerprint
+        self.completed = {tuple(shard) for shard in completed}
+    
+    def __len__(self):
+        return len(self.completed)
+    
+    def is_done(self, start, stop):
+        """
+        Check whether a shard was committed by an earlier run
+        
+        Args:
+            start (int): First sample of the shard
+            stop (int): End (exclusive) of the shard
+            
+        Returns:
+            bool: True if the shard can be skipped
+        """
+        return (int(start), int(stop)) in self.completed
+    
+    def commit(self, start, stop, *arrays):
+        """
+        Flush a finished shard to disk and record it as complete
+        
+        Args:
+            start (int): First sample of the shard
+            stop (int): End (exclusive) of the shard
+            *arrays: Memory maps written by the shard, flushed before recording
+        """
+        for array in arrays:
+            array.flush()
+        
+        self.completed.add((int(start), int(stop)))
+        progress = {
+            'fingerprint': self.fingerprint,
+            'samples': self.num_samples,
+            'completed': sorted(list(shard) for shard in self.completed),
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, self.path)
+
+def resume_store(method_dir, num_samples, fingerprint):
+    """
+    Open a partially filled store to continue, or create a new one
+    
+    The existing arrays are reused only if the progress file was written by
+    a run with the same fingerprint and sample count; otherwise the store is
+    created from scratch.
+    
+    Args:
+        method_dir (str): Directory to write the processed dataset to
+        num_samples (int): Total number of samples in the dataset
+        fingerprint (str): Fingerprint of the run from run_fingerprint
+        
+    Returns:
+        tuple: (images, labels, progress) writable memory maps and the ShardProgress
+    """
+    path = os.path.join(method_dir, PROGRESS_NAME)
+    images_path = os.path.join(method_dir, IMAGES_NAME)
+    labels_path = os.path.join(method_dir, LABELS_NAME)
+    
+    if os.path.exists(path) and os.path.exists(images_path) and os.path.exists(labels_path):
+        with open(path) as f:
+            progress = json.load(f)
+        if progress.get('fingerprint') == fingerprint and progress.get('samples') == num_samples:
+            images = np.lib.format.open_memmap(images_path, mode='r+')
+            labels = np.lib.format.open_memmap(labels_path, mode='r+')
+            return images, labels, ShardProgress(method_dir, num_samples, fingerprint, progress['completed'])
+    
+    images, labels = create_store(method_dir, num_samples)
+    return images, labels, ShardProgress(method_dir, num_samples, fingerprint)
+
+def finalize_store(method_dir, num_samples, splits, method, split_info=None, **metadata):
+    """
+    Write the manifest and splits of a store whose arrays are complete
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        num_samples (int): Total number of samples in the dataset
+        splits (dict): Maps split name to an array of indices into the store
+        method (str): Preprocessing method used ('opencv' or 'mediapipe')
+        split_info (dict): Extra fields recorded with the splits (e.g. the seed)
+        **metadata: Extra JSON-serializable fields recorded in the manifest
+        
+    Returns:
+        dict: The written manifest
+    """
+    manifest = {
+        'format': STORE_FORMAT,
+        'version': STORE_VERSION,
+        'method': method,
+        'samples': int(num_samples),
+        'images': IMAGES_NAME,
+        'labels': LABELS_NAME,
+        'image_shape': [IMAGE_SIZE, IMAGE_SIZE, 1],
+        'pixel_dtype': 'uint8',
+        'label_dtype': 'int8',
+        'normalization': {'scale': PIXEL_SCALE},
+    }
+    manifest.update(metadata)
+    
+    manifest = save_splits(method_dir, splits, manifest=manifest, **(split_info or {}))
+    
+    # The store is complete, so there is nothing left to resume
+    progress_path = os.path.join(method_dir, PROGRESS_NAME)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return manifest
+
+def save_splits(method_dir, splits, manifest=None, **split_info):
+    """
+    Save the split index arrays and record them in the manifest
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        splits (dict): Maps split name to an array of indices into the store
+        manifest (dict): Manifest to update; read from disk if not given
+        **split_info: Extra fields recorded with the splits (e.g. the seed)
+        
+    Returns:
+        dict: The written manifest
+    """
+    if manifest is None:
+        manifest = load_manifest(method_dir)
+    
+    np.savez(
+        os.path.join(method_dir, SPLITS_NAME),
+        **{name: np.asarray(indices, dtype=np.int64) for name, indices in splits.items()}
+    )
+    
+    manifest['splits'] = {
+        'file': SPLITS_NAME,
+        'samples': {name: int(len(indices)) for name, indices in splits.items()},
+    }
+    manifest['splits'].update(split_info)
+    
+    write_manifest(method_dir, manifest)
+    return manifest
+
+def save_clusters(method_dir, clusters):
+    """
+    Save the near-duplicate cluster id of every sample in the store
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        clusters (numpy.ndarray): Cluster id per sample, -1 for dropped duplicates
+        
+    Returns:
+        str: File name to record in the manifest
+    """
+    np.save(os.path.join(method_dir, CLUSTERS_NAME), np.asarray(clusters, dtype=np.int64))
+    return CLUSTERS_NAME
+
+def load_clusters(method_dir, manifest=None):
+    """
+    Load the near-duplicate cluster ids of a processed dataset
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        manifest (dict): Manifest of the dataset; read from disk if not given
+        
+    Returns:
+        numpy.ndarray: Cluster id per sample (-1 for dropped duplicates), or
+            None if the dataset was not deduplicated
+    """
+    if manifest is None:
+        manifest = load_manifest(method_dir)
+    
+    dedupe = manifest.get('dedupe')
+    if not dedupe:
+        return None
+    return np.load(os.path.join(method_dir, dedupe['file']))
+
+def open_store(method_dir, mmap_mode='r'):
+    """
+    Open the full image store of a processed dataset
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        mmap_mode (str): Memory-map mode passed to numpy.load
+        
+    Returns:
+        tuple: (images, labels, manifest)
+    """
+    manifest = load_manifest(method_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No processed data manifest found in {method_dir}")
+    
+    images = np.load(os.path.join(method_dir, manifest['images']), mmap_mode=mmap_mode)
+    labels = np.load(os.path.join(method_dir, manifest['labels']))
+    return images, labels, manifest
+
+def load_split_indices(method_dir, manifest=None):
+    """
+    Load the split index arrays of a processed dataset
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        manifest (dict): Manifest of the dataset; read from disk if not given
+        
+    Returns:
+        dict: Maps split name to an array of indices into the store
+    """
+    if manifest is None:
+        manifest = load_manifest(method_dir)
+    
+    with np.load(os.path.join(method_dir, manifest['splits']['file'])) as splits:
+        return {name: splits[name] for name in splits.files}
+
+def load_split(method_dir, split, mmap_mode='r'):
+    """
+    Open one split of a processed dataset
+    
+    Images are returned as a SplitView over the memory-mapped store and stay
+    uint8; use normalize_batch on each batch that is actually read.
+    Directories written before the manifest existed hold float arrays and
+    are loaded as-is.
+    
+    Args:
+        method_dir (str): Directory holding the processed dataset
+        split (str): Split name ('train', 'val' or 'test')
+        mmap_mode (str): Memory-map mode passed to numpy.load
+        
+    Returns:
+        tuple: (X, y)
+    """
+    if load_manifest(method_dir) is None:
+        X = np.load(os.path.join(method_dir, f'X_{split}.npy'), mmap_mode=mmap_mode)
+        y = np.load(os.path.join(method_dir, f'y_{split}.npy'))
+        return X, y
+    
+    images, labels, manifest = open_store(method_dir, mmap_mode=mmap_mode)
+    indices = load_split_indices(method_dir, manifest)[split]
+    return SplitView(images, indices), labels[indices]
+
+def normalize_batch(X):
+    """
+    Convert a batch of stored pixels to float32 values in [0, 1]
+    
+    Args:
+        X (numpy.ndarray): Batch of uint8 pixels (or legacy float pixels)
+        
+    Returns:
+        numpy.ndarray: float32 batch ready for the model
+    """
+    if X.dtype == np.uint8:
+        return X.astype(np.float32) / np.float32(PIXEL_SCALE)
+    return X.astype(np.float32)
+
+def iter_normalized_batches(X, batch_size=256):
+    """
+    Yield normalized float32 batches from a (memory-mapped) image array
+    
+    Args:
+        X (numpy.ndarray or SplitView): Stored images
+        batch_size (int): Number of images per batch
+        
+    Yields:
+        numpy.ndarray: Normalized batch of images
+    """
+    for start in range(0, len(X), batch_size):
+        yield normalize_batch(X[start:start + batch_size])
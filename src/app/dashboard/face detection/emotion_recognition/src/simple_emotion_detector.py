@@ -5,6 +5,7 @@ This script provides a simplified GUI for emotion detection with fallback option
 for when webcam access is problematic.
 """
 
+from startup_timer import report_startup
 import os
 import cv2
 import numpy as np
@@ -322,6 +323,10 @@ def main():
     # Create application
     app = SimpleEmotionDetector(root)
     
+    # Draw the window before reporting how long startup took
+    root.update()
+    report_startup("simple_emotion_detector", "window shown")
+    
     # Start main loop
     root.mainloop()
 
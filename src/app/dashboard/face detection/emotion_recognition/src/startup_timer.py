@@ -0,0 +1,47 @@
+"""
+Startup Timing for the Emotion Recognition Scripts
+
+This module:
+1. Records the time when a script starts importing (import it first)
+2. Reports how long the script took to become ready
+3. Lists which heavy libraries were already loaded at that point, so an
+   import that slipped back to module level shows up immediately
+"""
+
+import sys
+import time
+
+_START_TIME = time.perf_counter()
+
+# Libraries that take a second or more to import and should only be loaded
+# by the code paths that need them
+HEAVY_MODULES = ('tensorflow', 'mediapipe', 'matplotlib', 'seaborn', 'sklearn', 'pandas', 'kaggle')
+
+def startup_seconds():
+    """
+    Get the time since the script started importing
+    
+    Returns:
+        float: Elapsed seconds
+    """
+    return time.perf_counter() - _START_TIME
+
+def report_startup(script, stage="ready"):
+    """
+    Print how long the script took to reach a stage
+    
+    Args:
+        script (str): Name of the script
+        stage (str): What the script has just finished (e.g. "window shown")
+        
+    Returns:
+        float: Elapsed seconds
+    """
+    elapsed = startup_seconds()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(
+        f"[startup] {script} {stage} in {elapsed:.3f} seconds "
+        f"(heavy modules loaded: {', '.join(loaded) or 'none'})",
+        file=sys.stderr
+    )
+    return elapsed
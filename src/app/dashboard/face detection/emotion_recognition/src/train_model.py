@@ -2,20 +2,36 @@
 Model Training Script for Facial Emotion Recognition
 
 This script:
-1. Loads the preprocessed data
+1. Loads the preprocessed data (memory-mapped, normalized per batch)
 2. Applies data augmentation to the training set
 3. Trains the model with early stopping and learning rate reduction
-4. Saves the trained model and training history
+4. Saves the trained model, training history and throughput metrics
+
+Augmentation runs on the fly by default; with --offline-epochs K, K augmented
+copies of the training set are rendered ahead of time and cycled through.
+With --backend tfdata the input runs as a tf.data pipeline that augments in
+parallel and prefetches batches while the model trains. With --augment-in-model
+the model itself augments in its training step and is saved without those layers.
+The full training state is checkpointed every epoch; --resume continues an
+interrupted run from its latest checkpoint. With --distributed the run is one
+worker of a MultiWorkerMirroredStrategy cluster configured through TF_CONFIG
+(launch_workers.py starts such a cluster on one host).
 """
 
+from startup_timer import report_startup
 import os
 import numpy as np
-import matplotlib.pyplot as plt
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
 import time
-from model_building import build_model
+import json
+import argparse
+from model_building import build_model, strip_augmentation
+from processed_store import load_split, normalize_batch, PIXEL_SCALE
+from offline_augmentation import render_epochs, load_epochs
+from training_monitor import ThroughputMonitor
+from training_checkpoint import TrainingStateCheckpoint, load_training_state
 
 # Define constants
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
@@ -23,6 +39,18 @@ MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file
 PROCESSED_DATA_PATH = os.path.join(DATA_DIR, 'processed')
 BATCH_SIZE = 64
 EPOCHS = 50
+AUGMENTATION_SEED = 42
+
+# Augmentation applied to the training set (on the fly or rendered offline)
+AUGMENTATION_PARAMS = {
+    'rotation_range': 20,
+    'width_shift_range': 0.2,
+    'height_shift_range': 0.2,
+    'shear_range': 0.2,
+    'zoom_range': 0.2,
+    'horizontal_flip': True,
+    'fill_mode': 'nearest',
+}
 
 # Ensure directories exist
 os.makedirs(MODELS_DIR, exist_ok=True)
@@ -31,6 +59,9 @@ def load_data(method="opencv"):
     """
     Load the preprocessed data
     
+    The image arrays are memory-mapped uint8 pixels; they are only read and
+    normalized batch by batch by ProcessedDataSequence.
+    
     Args:
         method (str): Preprocessing method used ('opencv' or 'mediapipe')
         
@@ -41,12 +72,9 @@ def load_data(method="opencv"):
     
     print(f"Loading preprocessed data from {method_dir}...")
     
-    X_train = np.load(os.path.join(method_dir, 'X_train.npy'))
-    y_train = np.load(os.path.join(method_dir, 'y_train.npy'))
-    X_val = np.load(os.path.join(method_dir, 'X_val.npy'))
-    y_val = np.load(os.path.join(method_dir, 'y_val.npy'))
-    X_test = np.load(os.path.join(method_dir, 'X_test.npy'))
-    y_test = np.load(os.path.join(method_dir, 'y_test.npy'))
+    X_train, y_train = load_split(method_dir, 'train', mmap_mode='r')
+    X_val, y_val = load_split(method_dir, 'val', mmap_mode='r')
+    X_test, y_test = load_split(method_dir, 'test', mmap_mode='r')
     
     print(f"Training set: {X_train.shape[0]} samples")
     print(f"Validation set: {X_val.shape[0]} samples")
@@ -54,7 +82,163 @@ def load_data(method="opencv"):
     
     return X_train, y_train, X_val, y_val, X_test, y_test
 
-def create_data_generators(X_train, y_train, X_val, y_val):
+def _shift(shift_range, size, rng):
+    """Draw a shift in pixels the way ImageDataGenerator does"""
+    if not shift_range:
+        return 0
+    if isinstance(shift_range, float):
+        shift = rng.uniform(-shift_range, shift_range)
+    else:
+        # 1-D array-like or int: one of the given values, in either direction
+        shift = rng.choice(shift_range) * rng.choice([-1, 1])
+    return shift * size if np.max(shift_range) < 1 else shift
+
+def random_transform_params(datagen, img_shape, rng):
+    """
+    Draw the augmentation parameters of one sample from a local generator
+    
+    Mirrors ImageDataGenerator.get_random_transform, which seeds and draws
+    from the global np.random state instead.
+    
+    Args:
+        datagen (ImageDataGenerator): Generator holding the augmentation ranges
+        img_shape (tuple): Shape of the image (height, width, channels)
+        rng (numpy.random.Generator): Generator to draw from
+        
+    Returns:
+        dict: Parameters for datagen.apply_transform
+    """
+    height, width = img_shape[datagen.row_axis - 1], img_shape[datagen.col_axis - 1]
+    zoom_low, zoom_high = datagen.zoom_range
+    return {
+        'theta': rng.uniform(-datagen.rotation_range, datagen.rotation_range) if datagen.rotation_range else 0,
+        'tx': _shift(datagen.height_shift_range, height, rng),
+        'ty': _shift(datagen.width_shift_range, width, rng),
+        'shear': rng.uniform(-datagen.shear_range, datagen.shear_range) if datagen.shear_range else 0,
+        'zx': rng.uniform(zoom_low, zoom_high) if (zoom_low, zoom_high) != (1, 1) else 1,
+        'zy': rng.uniform(zoom_low, zoom_high) if (zoom_low, zoom_high) != (1, 1) else 1,
+        'flip_horizontal': bool(datagen.horizontal_flip and rng.random() < 0.5),
+        'flip_vertical': bool(datagen.vertical_flip and rng.random() < 0.5),
+        'channel_shift_intensity': (
+            rng.uniform(-datagen.channel_shift_range, datagen.channel_shift_range)
+            if datagen.channel_shift_range else None
+        ),
+        'brightness': rng.uniform(*datagen.brightness_range) if datagen.brightness_range is not None else None,
+    }
+
+class ProcessedDataSequence(tf.keras.utils.Sequence):
+    """
+    Keras Sequence that reads batches from memory-mapped processed data
+    
+    Only the samples of the requested batch are read from disk and
+    normalized, so the full float dataset never has to be held in memory.
+    """
+    
+    def __init__(self, X, y, batch_size=BATCH_SIZE, datagen=None, shuffle=False, seed=None):
+        """
+        Initialize the sequence
+        
+        Args:
+            X (numpy.ndarray): Stored (possibly memory-mapped) images
+            y (numpy.ndarray): Labels
+            batch_size (int): Number of samples per batch
+            datagen (ImageDataGenerator): Optional augmentation applied per sample
+            shuffle (bool): Whether to reshuffle the samples after every epoch
+            seed (int): Seed for the shuffling order
+        """
+        super().__init__()
+        self.X = X
+        self.y = np.asarray(y)
+        self.batch_size = batch_size
+        self.datagen = datagen
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        # Augmentation draws follow from this seed, the epoch and the sample
+        self.seed = int(self.rng.integers(2 ** 31)) if seed is None else seed
+        self.epoch = 0
+        self.indices = np.arange(len(X))
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
+    
+    def __len__(self):
+        return int(np.ceil(len(self.indices) / self.batch_size))
+    
+    def __getitem__(self, index):
+        # Sorted indices keep reads from the memory map mostly sequential
+        batch_indices = np.sort(self.indices[index * self.batch_size:(index + 1) * self.batch_size])
+        
+        batch_x = normalize_batch(self.X[batch_indices])
+        batch_y = self.y[batch_indices]
+        
+        if self.datagen is not None:
+            for i in range(len(batch_x)):
+                # A generator per sample leaves the global np.random state alone
+                sample_seed = ((self.seed * 7919 + self.epoch) * len(self.X) + batch_indices[i]) % (2 ** 32)
+                params = random_transform_params(self.datagen, batch_x[i].shape, np.random.default_rng(sample_seed))
+                batch_x[i] = self.datagen.apply_transform(batch_x[i], params)
+        
+        return batch_x, batch_y
+    
+    def on_epoch_end(self):
+        self.epoch += 1
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
+    
+    def get_state(self):
+        """
+        Get the shuffling state for a training checkpoint
+        
+        Returns:
+            tuple: (JSON-serializable state, dict of numpy arrays)
+        """
+        state = {'rng': self.rng.bit_generator.state, 'seed': self.seed, 'epoch': self.epoch}
+        return state, {'sequence_indices': self.indices.copy()}
+    
+    def set_state(self, state, arrays):
+        """
+        Restore the shuffling state saved by get_state
+        
+        Args:
+            state (dict): JSON-serializable state
+            arrays (dict): Numpy arrays of the state
+        """
+        self.rng.bit_generator.state = state['rng']
+        self.seed = state['seed']
+        self.epoch = state['epoch']
+        self.indices = np.array(arrays['sequence_indices'])
+
+class AugmentedEpochSequence(ProcessedDataSequence):
+    """
+    Sequence that cycles through pre-rendered augmented epochs
+    
+    Epoch e of training reads rendered epoch e % K, so no augmentation runs
+    while training.
+    """
+    
+    def __init__(self, epochs, y, batch_size=BATCH_SIZE, shuffle=True, seed=None):
+        """
+        Initialize the sequence
+        
+        Args:
+            epochs (list): Memory-mapped augmented copies of the training images
+            y (numpy.ndarray): Labels
+            batch_size (int): Number of samples per batch
+            shuffle (bool): Whether to reshuffle the samples after every epoch
+            seed (int): Seed for the shuffling order
+        """
+        super().__init__(epochs[0], y, batch_size=batch_size, shuffle=shuffle, seed=seed)
+        self.epochs = epochs
+    
+    def on_epoch_end(self):
+        super().on_epoch_end()
+        self.X = self.epochs[self.epoch % len(self.epochs)]
+    
+    def set_state(self, state, arrays):
+        super().set_state(state, arrays)
+        self.X = self.epochs[self.epoch % len(self.epochs)]
+
+def create_data_generators(X_train, y_train, X_val, y_val, augmented_epochs=None, augment=True,
+                           batch_size=BATCH_SIZE):
     """
     Create data generators with augmentation for training
     
@@ -63,38 +247,295 @@ def create_data_generators(X_train, y_train, X_val, y_val):
         y_train (numpy.ndarray): Training labels
         X_val (numpy.ndarray): Validation images
         y_val (numpy.ndarray): Validation labels
+        augmented_epochs (list): Optional pre-rendered augmented epochs from
+            offline_augmentation.load_epochs, used instead of on-the-fly augmentation
+        augment (bool): Whether to augment the training batches (False when the
+            model augments in-graph)
+        batch_size (int): Number of samples per batch
         
     Returns:
         tuple: (train_generator, validation_generator)
     """
-    # Data augmentation for training
-    train_datagen = ImageDataGenerator(
-        rotation_range=20,
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        shear_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        fill_mode='nearest'
+    # Create generators (no augmentation for validation)
+    if augmented_epochs:
+        train_generator = AugmentedEpochSequence(augmented_epochs, y_train, batch_size=batch_size, seed=AUGMENTATION_SEED)
+    else:
+        train_generator = ProcessedDataSequence(
+            X_train, y_train,
+            batch_size=batch_size,
+            datagen=ImageDataGenerator(**AUGMENTATION_PARAMS) if augment else None,
+            shuffle=True,
+            seed=AUGMENTATION_SEED
+        )
+    
+    validation_generator = ProcessedDataSequence(
+        X_val, y_val,
+        batch_size=batch_size
     )
     
-    # No augmentation for validation
-    val_datagen = ImageDataGenerator()
+    return train_generator, validation_generator
+
+def augment_batch(images, seed=None):
+    """
+    Apply the AUGMENTATION_PARAMS transforms to a batch inside the TensorFlow graph
+    
+    Every image gets its own random rotation, shear and zoom about the image
+    centre, shift and horizontal flip, composed into one projective transform
+    with 'nearest' edge filling like ImageDataGenerator.
     
-    # Create generators
-    train_generator = train_datagen.flow(
-        X_train, y_train,
-        batch_size=BATCH_SIZE
+    Args:
+        images (tf.Tensor): float32 batch of shape (B, H, W, C)
+        seed (tf.Tensor): Optional int64 seed of shape (2,); the same seed
+            always draws the same transforms
+        
+    Returns:
+        tf.Tensor: Augmented batch of the same shape
+    """
+    params = AUGMENTATION_PARAMS
+    batch = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+    
+    seeds = iter(tf.unstack(tf.random.experimental.stateless_split(seed, num=8))) if seed is not None else None
+    
+    def uniform(limit):
+        if seeds is None:
+            return tf.random.uniform([batch], -limit, limit)
+        return tf.random.stateless_uniform([batch], next(seeds), -limit, limit)
+    
+    # Rotation and shear ranges are in degrees, as in ImageDataGenerator
+    theta = uniform(np.deg2rad(params['rotation_range']))
+    shear = uniform(np.deg2rad(params['shear_range']))
+    zoom_x = 1.0 + uniform(params['zoom_range'])
+    zoom_y = 1.0 + uniform(params['zoom_range'])
+    shift_x = uniform(params['width_shift_range']) * width
+    shift_y = uniform(params['height_shift_range']) * height
+    flip = tf.ones([batch])
+    if params['horizontal_flip']:
+        flip = tf.where(uniform(1.0) < 0.0, -1.0, 1.0)
+    
+    # Map every output pixel to its input pixel: rotation . shear . zoom . flip about the centre
+    a0 = tf.cos(theta) * zoom_x * flip
+    a1 = -tf.sin(theta + shear) * zoom_y
+    b0 = tf.sin(theta) * zoom_x * flip
+    b1 = tf.cos(theta + shear) * zoom_y
+    center_x = (width - 1.0) / 2.0
+    center_y = (height - 1.0) / 2.0
+    a2 = center_x - a0 * center_x - a1 * center_y + shift_x
+    b2 = center_y - b0 * center_x - b1 * center_y + shift_y
+    zeros = tf.zeros([batch])
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+    
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=tf.shape(images)[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode=params['fill_mode'].upper()
     )
+
+def _normalize_tensor(images):
+    """Convert a batch of stored pixels to float32 values in [0, 1] (see normalize_batch)"""
+    if images.dtype == tf.uint8:
+        return tf.cast(images, tf.float32) / PIXEL_SCALE
+    return tf.cast(images, tf.float32)
+
+def _store_dataset(X, y, chunk_size=1024, num_shards=1, shard_index=0):
+    """
+    Stream a (memory-mapped) split into a cached tf.data.Dataset of samples
     
-    validation_generator = val_datagen.flow(
-        X_val, y_val,
-        batch_size=BATCH_SIZE
+    The stored pixels are read in chunks during the first epoch only and kept
+    in memory in their stored dtype (uint8), so later epochs never touch disk.
+    With several shards, only every num_shards-th sample starting at
+    shard_index is read and cached.
+    """
+    y = np.asarray(y, dtype=np.int32)
+    samples = np.arange(shard_index, len(X), num_shards)
+    
+    def chunks():
+        for start in range(0, len(samples), chunk_size):
+            index = samples[start:start + chunk_size]
+            yield np.asarray(X[index[0]:index[-1] + 1:num_shards]), y[index]
+    
+    dataset = tf.data.Dataset.from_generator(
+        chunks,
+        output_signature=(
+            tf.TensorSpec((None,) + tuple(X.shape[1:]), tf.as_dtype(X.dtype)),
+            tf.TensorSpec((None,), tf.int32),
+        )
     )
+    dataset = dataset.unbatch().apply(tf.data.experimental.assert_cardinality(len(samples)))
+    return dataset.cache()
+
+def make_train_dataset(X_train, y_train, batch_size=BATCH_SIZE, seed=AUGMENTATION_SEED, augment=True,
+                       start_batch=0, num_shards=1, shard_index=0):
+    """
+    Create the tf.data training pipeline
     
-    return train_generator, validation_generator
+    The pipeline reshuffles every epoch, batches, augments whole batches
+    with parallel map calls and prefetches, so the input work overlaps with
+    the model step instead of running before it. The sample order and the
+    augmentation of every batch follow from the seed, the shard and the
+    batch number, so a resumed run continues with exactly the same batches.
+    
+    Args:
+        X_train (numpy.ndarray): Training images
+        y_train (numpy.ndarray): Training labels
+        batch_size (int): Number of samples per batch
+        seed (int): Seed for the shuffling order and the augmentation
+        augment (bool): Whether to augment the batches (False when the model
+            augments in-graph)
+        start_batch (int): Number of batches already consumed (when resuming)
+        num_shards (int): Number of workers the training split is divided between
+        shard_index (int): Shard read by this worker
+        
+    Returns:
+        tf.data.Dataset: Batches of (images, labels), repeating indefinitely,
+            so pass steps_per_epoch to fit
+    """
+    def transform(index, batch):
+        x, y = batch
+        x = _normalize_tensor(x)
+        if augment:
+            x = augment_batch(x, tf.stack([tf.constant(seed, tf.int64), index * num_shards + shard_index]))
+        return x, y
+    
+    num_samples = len(range(shard_index, len(X_train), num_shards))
+    return (
+        _store_dataset(X_train, y_train, num_shards=num_shards, shard_index=shard_index)
+        .shuffle(num_samples, seed=seed, reshuffle_each_iteration=True)
+        .repeat()
+        .skip(start_batch * batch_size)
+        .batch(batch_size)
+        .enumerate(start=start_batch)
+        .map(transform, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        .prefetch(tf.data.AUTOTUNE)
+    )
 
-def train_model(model, train_generator, validation_generator, X_train, model_type='custom_cnn'):
+def make_validation_dataset(X_val, y_val, batch_size=BATCH_SIZE, num_shards=1, shard_index=0, repeat=False):
+    """
+    Create the tf.data validation pipeline (no augmentation)
+    
+    Args:
+        X_val (numpy.ndarray): Validation images
+        y_val (numpy.ndarray): Validation labels
+        batch_size (int): Number of samples per batch
+        num_shards (int): Number of workers the validation split is divided between
+        shard_index (int): Shard read by this worker
+        repeat (bool): Whether to repeat indefinitely (pass validation_steps to fit)
+        
+    Returns:
+        tf.data.Dataset: Batches of (images, labels)
+    """
+    dataset = _store_dataset(X_val, y_val, num_shards=num_shards, shard_index=shard_index)
+    if repeat:
+        dataset = dataset.repeat()
+    return (
+        dataset
+        .batch(batch_size)
+        .map(lambda x, y: (_normalize_tensor(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+def create_tf_datasets(X_train, y_train, X_val, y_val, batch_size=BATCH_SIZE, seed=AUGMENTATION_SEED, augment=True,
+                       start_batch=0):
+    """
+    Create tf.data input pipelines for training
+    
+    Args:
+        X_train (numpy.ndarray): Training images
+        y_train (numpy.ndarray): Training labels
+        X_val (numpy.ndarray): Validation images
+        y_val (numpy.ndarray): Validation labels
+        batch_size (int): Number of samples per batch
+        seed (int): Seed for the shuffling order and the augmentation
+        augment (bool): Whether to augment the training batches (False when the
+            model augments in-graph)
+        start_batch (int): Number of training batches already consumed (when resuming)
+        
+    Returns:
+        tuple: (train_dataset, validation_dataset); see make_train_dataset
+    """
+    train_dataset = make_train_dataset(
+        X_train, y_train, batch_size=batch_size, seed=seed, augment=augment, start_batch=start_batch
+    )
+    validation_dataset = make_validation_dataset(X_val, y_val, batch_size=batch_size)
+    return train_dataset, validation_dataset
+
+def create_distributed_datasets(X_train, y_train, X_val, y_val, global_batch_size, augment=True, start_batch=0):
+    """
+    Create per-worker tf.data pipelines for multi-worker training
+    
+    Every worker reads and caches only its own shard of each split and
+    batches its share of the global batch.
+    
+    Args:
+        X_train (numpy.ndarray): Training images
+        y_train (numpy.ndarray): Training labels
+        X_val (numpy.ndarray): Validation images
+        y_val (numpy.ndarray): Validation labels
+        global_batch_size (int): Samples per step summed over all workers
+        augment (bool): Whether to augment the training batches
+        start_batch (int): Number of training steps already taken (when resuming)
+        
+    Returns:
+        tuple: (train_creator, validation_creator) DatasetCreators for fit;
+            both repeat, so pass steps_per_epoch and validation_steps
+    """
+    def train_fn(input_context):
+        return make_train_dataset(
+            X_train, y_train,
+            batch_size=input_context.get_per_replica_batch_size(global_batch_size),
+            augment=augment,
+            start_batch=start_batch,
+            num_shards=input_context.num_input_pipelines,
+            shard_index=input_context.input_pipeline_id
+        )
+    
+    def validation_fn(input_context):
+        return make_validation_dataset(
+            X_val, y_val,
+            batch_size=input_context.get_per_replica_batch_size(global_batch_size),
+            num_shards=input_context.num_input_pipelines,
+            shard_index=input_context.input_pipeline_id,
+            repeat=True
+        )
+    
+    DatasetCreator = tf.keras.utils.experimental.DatasetCreator
+    return DatasetCreator(train_fn), DatasetCreator(validation_fn)
+
+def create_strategy():
+    """
+    Create the multi-worker strategy described by the TF_CONFIG environment variable
+    
+    Returns:
+        tuple: (strategy, num_workers, worker_index)
+    """
+    tf_config = json.loads(os.environ.get('TF_CONFIG', '{}'))
+    workers = tf_config.get('cluster', {}).get('worker', [])
+    if not workers:
+        raise ValueError("Distributed training needs TF_CONFIG with a 'worker' cluster; see launch_workers.py")
+    
+    # Collectives go over the network between hosts; ring all-reduce suits CPU workers
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING
+        )
+    )
+    return strategy, len(workers), tf_config['task']['index']
+
+class InferenceModelCheckpoint(ModelCheckpoint):
+    """
+    ModelCheckpoint that saves the model without its in-graph augmentation
+    """
+    
+    def set_model(self, model):
+        super().set_model(strip_augmentation(model))
+
+def train_model(model, train_generator, validation_generator, X_train, model_type='custom_cnn',
+                resume=False, checkpoint_every=1, config=None, batch_size=BATCH_SIZE, epochs=EPOCHS,
+                validation_steps=None):
     """
     Train the model with callbacks for early stopping and learning rate reduction
     
@@ -104,12 +545,19 @@ def train_model(model, train_generator, validation_generator, X_train, model_typ
         validation_generator: Validation data generator
         X_train (numpy.ndarray): Training images (for steps calculation)
         model_type (str): Type of model being trained
+        resume (bool): Whether to continue from the latest full-state checkpoint
+        checkpoint_every (int): Save the full training state every this many epochs
+        config (dict): Training settings a resumed run must match
+        batch_size (int): Samples per step (the global batch when distributed)
+        epochs (int): Number of epochs to train for
+        validation_steps (int): Validation batches per epoch; defaults to the
+            length of validation_generator
         
     Returns:
         tensorflow.keras.callbacks.History: Training history
     """
     # Define callbacks
-    model_checkpoint = ModelCheckpoint(
+    model_checkpoint = InferenceModelCheckpoint(
         os.path.join(MODELS_DIR, f'{model_type}_best.h5'),
         monitor='val_accuracy',
         save_best_only=True,
@@ -133,30 +581,108 @@ def train_model(model, train_generator, validation_generator, X_train, model_typ
     )
     
     # Calculate steps per epoch
-    steps_per_epoch = len(X_train) // BATCH_SIZE
+    steps_per_epoch = len(X_train) // batch_size
+    
+    # Save the full training state so an interrupted run can resume
+    state_checkpoint = TrainingStateCheckpoint(
+        checkpoint_dir(model_type),
+        train_input=train_generator,
+        callbacks=[model_checkpoint, early_stopping, reduce_lr],
+        config=config,
+        every=checkpoint_every
+    )
+    initial_epoch = state_checkpoint.restore(model) if resume else 0
+    
+    # Record step time, input wait and memory next to the training history plot
+    monitor = ThroughputMonitor(
+        os.path.join(MODELS_DIR, f'{model_type}_training_metrics.jsonl'), batch_size, append=initial_epoch > 0
+    )
     
     # Train the model
     print(f"\nTraining {model_type} model...")
     start_time = time.time()
     
     history = model.fit(
-        train_generator,
+        monitor.wrap(train_generator),
         steps_per_epoch=steps_per_epoch,
-        epochs=EPOCHS,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
         validation_data=validation_generator,
-        validation_steps=len(validation_generator),
-        callbacks=[model_checkpoint, early_stopping, reduce_lr]
+        validation_steps=validation_steps or len(validation_generator),
+        # The state checkpoint goes last: it restores the other callbacks after they reset
+        callbacks=[model_checkpoint, early_stopping, reduce_lr, monitor, state_checkpoint]
     )
     
     training_time = time.time() - start_time
     print(f"Training completed in {training_time:.2f} seconds")
     
-    # Save the final model
-    model.save(os.path.join(MODELS_DIR, f'{model_type}_final.h5'))
+    # Report the whole run, including the epochs before a resume
+    history.history = {key: list(values) for key, values in state_checkpoint.history.items()}
+    
+    # Save the final model (augmentation layers are training-only)
+    strip_augmentation(model).save(os.path.join(MODELS_DIR, f'{model_type}_final.h5'))
     print(f"Model saved to {os.path.join(MODELS_DIR, f'{model_type}_final.h5')}")
     
     return history
 
+def checkpoint_dir(model_type):
+    """
+    Get the directory holding the full-state training checkpoints of a model
+    
+    Args:
+        model_type (str): Type of model being trained
+        
+    Returns:
+        str: Checkpoint directory
+    """
+    return os.path.join(MODELS_DIR, 'checkpoints', model_type)
+
+def compare_input_step_times(X_train, y_train, augmented_epochs=None, num_batches=50):
+    """
+    Compare the input time per step of the training input paths
+    
+    Times on-the-fly augmentation with the Keras Sequence, the tf.data
+    pipeline and, when given, the pre-rendered epochs.
+    
+    Args:
+        X_train (numpy.ndarray): Training images
+        y_train (numpy.ndarray): Training labels
+        augmented_epochs (list): Optional pre-rendered augmented epochs
+        num_batches (int): Number of batches timed for each input path
+        
+    Returns:
+        dict: Milliseconds per batch for each input path
+    """
+    num_batches = min(num_batches, max(len(X_train) // BATCH_SIZE, 1))
+    paths = [('on-the-fly', create_data_generators(X_train, y_train, X_train[:1], y_train[:1])[0])]
+    if augmented_epochs:
+        paths.append(('offline', create_data_generators(X_train, y_train, X_train[:1], y_train[:1], augmented_epochs)[0]))
+    
+    step_ms = {}
+    for name, sequence in paths:
+        start_time = time.perf_counter()
+        for index in range(num_batches):
+            sequence[index]
+        step_ms[name] = (time.perf_counter() - start_time) / num_batches * 1000
+    
+    # The first tf.data batches build the pipeline and fill the prefetch buffer
+    batches = iter(create_tf_datasets(X_train, y_train, X_train[:1], y_train[:1])[0])
+    for _ in range(3):
+        next(batches)
+    start_time = time.perf_counter()
+    for _ in range(num_batches):
+        next(batches)
+    step_ms['tf.data'] = (time.perf_counter() - start_time) / num_batches * 1000
+    
+    labels = {'on-the-fly': 'On-the-fly augmentation', 'tf.data': 'tf.data pipeline', 'offline': 'Pre-rendered epochs'}
+    print(f"\nInput time per step (batch of {BATCH_SIZE}):")
+    for name, ms in step_ms.items():
+        line = f"  {labels[name] + ':':25s} {ms:7.2f} ms ({BATCH_SIZE / ms * 1000:.0f} samples/sec)"
+        if name != 'on-the-fly':
+            line += f", {step_ms['on-the-fly'] / max(ms, 1e-9):.1f}x faster"
+        print(line)
+    return step_ms
+
 def plot_training_history(history, model_type='custom_cnn'):
     """
     Plot and save the training history
@@ -166,6 +692,7 @@ def plot_training_history(history, model_type='custom_cnn'):
         model_type (str): Type of model trained
     """
     # Plot accuracy
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 4))
     
     plt.subplot(1, 2, 1)
@@ -201,22 +728,214 @@ def optimize_training_speed():
     print("5. Use fewer layers in the model architecture")
     print("6. Use data caching and prefetching with tf.data.Dataset")
 
+def parse_args():
+    """
+    Parse command line arguments
+    
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Train the facial emotion recognition model")
+    parser.add_argument(
+        '--method',
+        choices=['opencv', 'mediapipe'],
+        default='opencv',
+        help="Preprocessing method of the data to train on (default: opencv)"
+    )
+    parser.add_argument(
+        '--model-type',
+        choices=['custom_cnn', 'vgg16', 'resnet50', 'separable_cnn', 'separable_cnn_small'],
+        default='custom_cnn',
+        help="Model architecture to train (default: custom_cnn)"
+    )
+    parser.add_argument(
+        '--offline-epochs',
+        type=int,
+        default=0,
+        help="Pre-render this many augmented epochs and cycle through them instead of "
+             "augmenting on the fly (default: 0, on the fly)"
+    )
+    parser.add_argument(
+        '--render-workers',
+        type=int,
+        default=0,
+        help="Processes rendering the augmented epochs; 0 uses every CPU core (default: 0)"
+    )
+    parser.add_argument(
+        '--backend',
+        choices=['sequence', 'tfdata'],
+        default='sequence',
+        help="Training input pipeline: the Keras Sequence or the tf.data pipeline with "
+             "parallel augmentation and prefetching (default: sequence)"
+    )
+    parser.add_argument(
+        '--benchmark-input',
+        action='store_true',
+        help="Time every input pipeline (including pre-rendered epochs with "
+             "--offline-epochs) and exit without training"
+    )
+    parser.add_argument(
+        '--augment-in-model',
+        action='store_true',
+        help="Augment with Keras preprocessing layers inside the training step "
+             "instead of in the input pipeline"
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Continue from the latest full-state checkpoint of this model type"
+    )
+    parser.add_argument(
+        '--checkpoint-every',
+        type=int,
+        default=1,
+        help="Save the full training state every N epochs (default: 1)"
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=EPOCHS,
+        help=f"Number of epochs to train for (default: {EPOCHS})"
+    )
+    parser.add_argument(
+        '--distributed',
+        action='store_true',
+        help="Train data-parallel with MultiWorkerMirroredStrategy across the workers in "
+             "TF_CONFIG (see launch_workers.py); needs --backend tfdata"
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=0,
+        help="TensorFlow intra-op threads; 0 lets TensorFlow decide (default: 0)"
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        help="Directory for the trained models, checkpoints and metrics (default: models/)"
+    )
+    parser.add_argument(
+        '--hparams',
+        default=None,
+        help="JSON file of hyperparameters (batch_size, learning_rate, conv_dropout, "
+             "dense_dropout), e.g. the best configuration of hyperparameter_search.py"
+    )
+    args = parser.parse_args()
+    if args.backend == 'tfdata' and args.offline_epochs > 0:
+        parser.error("--offline-epochs feeds the sequence backend; it cannot be combined with --backend tfdata")
+    if args.augment_in_model and args.offline_epochs > 0:
+        parser.error("--offline-epochs already augments the data; it cannot be combined with --augment-in-model")
+    if args.distributed and args.backend != 'tfdata':
+        parser.error("--distributed shards the tf.data pipeline; add --backend tfdata")
+    return args
+
 def main():
     """
     Main function to execute the model training pipeline
     """
+    global MODELS_DIR
+    args = parse_args()
+    report_startup("train_model")
+    
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    
+    # Multi-worker training: every worker runs this script with its own TF_CONFIG
+    strategy, num_workers, worker_index = None, 1, 0
+    if args.distributed:
+        strategy, num_workers, worker_index = create_strategy()
+        print(f"Worker {worker_index} of {num_workers}")
+    
+    if args.output_dir:
+        MODELS_DIR = args.output_dir
+    if worker_index > 0:
+        # Every worker saves (the saves are collective), but only the chief's files are kept
+        MODELS_DIR = os.path.join(MODELS_DIR, 'workers', f'worker_{worker_index}')
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    
+    # Hyperparameters override the defaults; the batch size belongs to the input pipeline
+    hparams = {}
+    if args.hparams:
+        with open(args.hparams) as f:
+            hparams = json.load(f)
+        print(f"Hyperparameters from {args.hparams}: {hparams}")
+    model_hparams = {key: value for key, value in hparams.items() if key != 'batch_size'}
+    batch_size = int(hparams.get('batch_size', BATCH_SIZE))
+    
     # Load preprocessed data
-    X_train, y_train, X_val, y_val, X_test, y_test = load_data(method="opencv")
+    X_train, y_train, X_val, y_val, X_test, y_test = load_data(method=args.method)
+    
+    # Pre-render augmented epochs if requested
+    augmented_epochs = None
+    if args.offline_epochs > 0:
+        method_dir = os.path.join(PROCESSED_DATA_PATH, args.method)
+        epochs_dir = render_epochs(
+            method_dir, AUGMENTATION_PARAMS, args.offline_epochs,
+            workers=args.render_workers or os.cpu_count(), seed=AUGMENTATION_SEED
+        )
+        augmented_epochs = load_epochs(epochs_dir, args.offline_epochs)
     
-    # Create data generators
-    train_generator, validation_generator = create_data_generators(X_train, y_train, X_val, y_val)
+    if args.benchmark_input:
+        compare_input_step_times(X_train, y_train, augmented_epochs)
+        return
+    
+    # Settings a resumed run must share with the checkpoint it continues
+    config = {
+        'method': args.method,
+        'model_type': args.model_type,
+        'backend': args.backend,
+        'augment_in_model': args.augment_in_model,
+        'offline_epochs': args.offline_epochs,
+        'batch_size': batch_size,
+        'workers': num_workers,
+        'hparams': model_hparams,
+    }
+    
+    # Each worker keeps the per-worker batch, so the global batch grows with the workers
+    global_batch_size = batch_size * num_workers
+    validation_steps = None
+    
+    # Create the training input pipeline
+    if args.backend == 'tfdata':
+        # The tf.data pipeline is positioned at the first batch after the checkpoint
+        state = load_training_state(checkpoint_dir(args.model_type)) if args.resume else None
+        start_batch = state['epoch'] * (len(X_train) // global_batch_size) if state else 0
+        if strategy is not None:
+            train_generator, validation_generator = create_distributed_datasets(
+                X_train, y_train, X_val, y_val, global_batch_size,
+                augment=not args.augment_in_model, start_batch=start_batch
+            )
+            validation_steps = max(1, len(X_val) // global_batch_size)
+        else:
+            train_generator, validation_generator = create_tf_datasets(
+                X_train, y_train, X_val, y_val, batch_size=batch_size,
+                augment=not args.augment_in_model, start_batch=start_batch
+            )
+    else:
+        train_generator, validation_generator = create_data_generators(
+            X_train, y_train, X_val, y_val, augmented_epochs,
+            augment=not args.augment_in_model, batch_size=batch_size
+        )
     
     # Build and train the model
-    model_type = 'custom_cnn'  # Options: 'custom_cnn', 'vgg16', 'resnet50'
-    model = build_model(model_type)
+    model_type = args.model_type
+    if strategy is not None:
+        with strategy.scope():
+            model = build_model(model_type, augment=args.augment_in_model, hparams=model_hparams)
+        
+        # Linear scaling rule: the learning rate grows with the global batch
+        base_lr = float(tf.keras.backend.get_value(model.optimizer.learning_rate))
+        model.optimizer.learning_rate = base_lr * num_workers
+        print(f"Global batch {global_batch_size}, learning rate {base_lr:g} -> {base_lr * num_workers:g}")
+    else:
+        model = build_model(model_type, augment=args.augment_in_model, hparams=model_hparams)
     
     # Train the model
-    history = train_model(model, train_generator, validation_generator, X_train, model_type)
+    history = train_model(
+        model, train_generator, validation_generator, X_train, model_type,
+        resume=args.resume, checkpoint_every=args.checkpoint_every, config=config,
+        batch_size=global_batch_size, epochs=args.epochs, validation_steps=validation_steps
+    )
     
     # Plot training history
     plot_training_history(history, model_type)
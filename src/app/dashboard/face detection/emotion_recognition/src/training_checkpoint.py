@@ -0,0 +1,226 @@
+"""
+Resumable Training Checkpoints for Facial Emotion Recognition
+
+This module:
+1. Saves the full training state every few epochs: model weights, optimizer
+   slots and learning rate, callback state (early stopping, LR schedule),
+   random number generator state and the position of the training input
+2. Writes the checkpoints on background threads so training steps keep running
+3. Restores that state so an interrupted run continues where it stopped
+"""
+
+import os
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tensorflow as tf
+
+STATE_NAME = 'training_state.json'
+DEFAULT_MAX_TO_KEEP = 2
+
+# Callback attributes that make up the state of the Keras callbacks we use
+CALLBACK_STATE_ATTRIBUTES = ('wait', 'best', 'cooldown_counter', 'best_epoch', 'stopped_epoch')
+
+def load_training_state(checkpoint_dir):
+    """
+    Read the state saved with the latest checkpoint
+    
+    Args:
+        checkpoint_dir (str): Directory holding the checkpoints
+        
+    Returns:
+        dict: The saved training state, or None if there is no checkpoint
+    """
+    path = os.path.join(checkpoint_dir, STATE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _python_random_state():
+    version, internal, gauss = random.getstate()
+    return [version, list(internal), gauss]
+
+def _set_python_random_state(state):
+    version, internal, gauss = state
+    random.setstate((version, tuple(internal), gauss))
+
+class TrainingStateCheckpoint(tf.keras.callbacks.Callback):
+    """
+    Keras callback saving and restoring the full training state
+    
+    Model and optimizer variables go to a TensorFlow checkpoint written
+    asynchronously; the remaining state is snapshotted at the end of the
+    epoch and written by a background thread once that checkpoint is on
+    disk, so the state file always refers to a complete checkpoint.
+    
+    Dropout masks and in-graph augmentation layers draw from TensorFlow's
+    stateful random ops and are not replayed after a resume.
+    """
+    
+    def __init__(self, checkpoint_dir, train_input=None, callbacks=(), config=None,
+                 every=1, max_to_keep=DEFAULT_MAX_TO_KEEP):
+        """
+        Initialize the callback
+        
+        Args:
+            checkpoint_dir (str): Directory receiving the checkpoints
+            train_input: Training Sequence (its shuffling state is saved) or
+                tf.data pipeline (positioned from the saved epoch by the caller)
+            callbacks (iterable): Other callbacks whose state is saved
+            config (dict): Training settings a resumed run must match
+            every (int): Save every this many epochs
+            max_to_keep (int): Number of model checkpoints to keep
+        """
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.train_input = train_input
+        self.callbacks = list(callbacks)
+        self.config = config or {}
+        self.every = max(1, every)
+        self.max_to_keep = max_to_keep
+        self.history = {}
+        self._pending_callback_state = None
+        self._checkpoint = None
+        self._writer = None
+    
+    def set_model(self, model):
+        super().set_model(model)
+        if self._checkpoint is None:
+            self._checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer)
+            self._manager = tf.train.CheckpointManager(
+                self._checkpoint, self.checkpoint_dir, max_to_keep=self.max_to_keep
+            )
+    
+    def restore(self, model):
+        """
+        Restore the latest checkpoint before training resumes
+        
+        Args:
+            model (tensorflow.keras.models.Model): The freshly built model
+            
+        Returns:
+            int: Epoch to pass to fit as initial_epoch (0 without a checkpoint)
+        """
+        state = load_training_state(self.checkpoint_dir)
+        if state is None:
+            print(f"No checkpoint in {self.checkpoint_dir}; training from the start")
+            return 0
+        if state['config'] != self.config:
+            raise ValueError(
+                f"Checkpoint in {self.checkpoint_dir} was saved with {state['config']}, "
+                f"not {self.config}; train without --resume to start over"
+            )
+        
+        self.set_model(model)
+        # Optimizer slots do not exist yet; they are filled in when first created
+        self._checkpoint.restore(os.path.join(self.checkpoint_dir, state['checkpoint'])).expect_partial()
+        
+        with np.load(os.path.join(self.checkpoint_dir, state['arrays']), allow_pickle=False) as arrays:
+            arrays = dict(arrays)
+        _set_python_random_state(state['python_random'])
+        np.random.set_state((
+            'MT19937', arrays['numpy_random_keys'], *state['numpy_random_pos']
+        ))
+        
+        if state['train_input'] is not None and hasattr(self.train_input, 'set_state'):
+            self.train_input.set_state(state['train_input'], arrays)
+            # Keras reshuffles after the callbacks' epoch end, so replay that step
+            self.train_input.on_epoch_end()
+        
+        self._pending_callback_state = (state['callbacks'], arrays)
+        self.history = state['history']
+        print(f"Resuming from epoch {state['epoch']} ({state['checkpoint']})")
+        return state['epoch']
+    
+    def on_train_begin(self, logs=None):
+        # Runs after the other callbacks have reset themselves in their own on_train_begin
+        if self._pending_callback_state is not None:
+            callback_states, arrays = self._pending_callback_state
+            for callback, saved in zip(self.callbacks, callback_states):
+                for name, value in saved.items():
+                    setattr(callback, name, value)
+                prefix = f'{type(callback).__name__}_weight_'
+                weights = sorted((key for key in arrays if key.startswith(prefix)), key=lambda key: int(key[len(prefix):]))
+                if weights:
+                    callback.best_weights = [arrays[key] for key in weights]
+            self._pending_callback_state = None
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._writer = ThreadPoolExecutor(max_workers=1)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        if (epoch + 1) % self.every == 0:
+            self.save(epoch + 1)
+    
+    def save(self, epoch):
+        """
+        Checkpoint the training state after an epoch
+        
+        Args:
+            epoch (int): Number of completed epochs
+        """
+        prefix = self._manager.save(
+            checkpoint_number=epoch,
+            options=tf.train.CheckpointOptions(enable_async=True)
+        )
+        
+        # Snapshot the small state now; it is written once the checkpoint is complete
+        arrays = {}
+        keys, pos, has_gauss, cached_gaussian = np.random.get_state()[1:]
+        arrays['numpy_random_keys'] = keys.copy()
+        
+        callback_states = []
+        for callback in self.callbacks:
+            saved = {}
+            for name in CALLBACK_STATE_ATTRIBUTES:
+                value = getattr(callback, name, None)
+                if isinstance(value, (int, float, np.integer, np.floating)):
+                    saved[name] = value.item() if isinstance(value, np.generic) else value
+            for i, weight in enumerate(getattr(callback, 'best_weights', None) or []):
+                arrays[f'{type(callback).__name__}_weight_{i}'] = np.array(weight)
+            callback_states.append(saved)
+        
+        train_input_state = None
+        if hasattr(self.train_input, 'get_state'):
+            train_input_state, input_arrays = self.train_input.get_state()
+            arrays.update(input_arrays)
+        
+        state = {
+            'epoch': epoch,
+            'checkpoint': os.path.basename(prefix),
+            'arrays': f'training_state_{epoch}.npz',
+            'config': self.config,
+            'python_random': _python_random_state(),
+            'numpy_random_pos': [int(pos), int(has_gauss), float(cached_gaussian)],
+            'callbacks': callback_states,
+            'train_input': train_input_state,
+            'history': {key: list(values) for key, values in self.history.items()},
+        }
+        self._writer.submit(self._write_state, state, arrays)
+    
+    def _write_state(self, state, arrays):
+        """Write the state files atomically after the model checkpoint is on disk"""
+        self._checkpoint.sync()
+        previous = load_training_state(self.checkpoint_dir)
+        np.savez(os.path.join(self.checkpoint_dir, state['arrays']), **arrays)
+        
+        tmp_state = os.path.join(self.checkpoint_dir, STATE_NAME + '.tmp')
+        with open(tmp_state, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_state, os.path.join(self.checkpoint_dir, STATE_NAME))
+        
+        # The state file now names the new arrays, so the previous ones can go
+        if previous is not None and previous['arrays'] != state['arrays']:
+            try:
+                os.remove(os.path.join(self.checkpoint_dir, previous['arrays']))
+            except OSError:
+                pass
+    
+    def on_train_end(self, logs=None):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        self._checkpoint.sync()
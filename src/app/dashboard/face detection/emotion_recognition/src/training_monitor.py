@@ -0,0 +1,250 @@
+"""
+Training Throughput Monitor for Facial Emotion Recognition
+
+This module:
+1. Times every training step and how long it waited for its input batch
+2. Records samples/sec and resident/peak memory for every epoch
+3. Writes one JSON line per epoch next to the training history plot
+4. Ends with a summary stating whether the input or the model step
+   bottlenecked the run
+"""
+
+import os
+import sys
+import json
+import time
+from collections import deque
+import numpy as np
+import tensorflow as tf
+
+# A run counts as input-bound when its steps spend at least this fraction
+# of their time waiting for the next batch
+INPUT_BOUND_FRACTION = 0.2
+
+def memory_usage_mb():
+    """
+    Get the resident and peak resident memory of this process
+    
+    Returns:
+        tuple: (rss_mb, peak_rss_mb); either is None where the platform
+            does not report it
+    """
+    rss = peak = None
+    try:
+        import psutil  # Optional; the only source of these values on Windows
+        info = psutil.Process().memory_info()
+        rss = info.rss / 2 ** 20
+        peak = getattr(info, 'peak_wset', None)
+        peak = peak / 2 ** 20 if peak is not None else None
+    except ImportError:
+        pass
+    
+    if rss is None:
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+        except (OSError, ValueError, AttributeError):
+            pass
+    
+    if peak is None:
+        try:
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+            peak = max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+        except ImportError:
+            pass
+    
+    return rss, peak
+
+class TimedSequence(tf.keras.utils.Sequence):
+    """
+    Sequence wrapper that tells the monitor when every batch is ready
+    """
+    
+    def __init__(self, sequence, monitor):
+        """
+        Initialize the wrapper
+        
+        Args:
+            sequence (tf.keras.utils.Sequence): The training sequence
+            monitor (ThroughputMonitor): Monitor receiving the ready times
+        """
+        super().__init__()
+        self.sequence = sequence
+        self.monitor = monitor
+        self.generation = 0
+    
+    def __len__(self):
+        return len(self.sequence)
+    
+    def __getitem__(self, index):
+        generation = self.generation
+        batch = self.sequence[index]
+        # Batches still in flight from the previous epoch's iterator are dropped by Keras
+        if generation == self.generation:
+            self.monitor.batch_ready()
+        return batch
+    
+    def on_epoch_end(self):
+        self.generation += 1
+        self.monitor.reset_ready()
+        self.sequence.on_epoch_end()
+
+class ThroughputMonitor(tf.keras.callbacks.Callback):
+    """
+    Keras callback recording step time, input wait, throughput and memory
+    
+    The training input must be passed through wrap() so the monitor learns
+    when each batch became available. A step's input wait is the time from
+    the start of the step until its batch was ready (zero when the batch
+    was already prefetched). The very first step also traces and builds the
+    training function, so it is reported as warm-up and left out of the
+    step statistics.
+    """
+    
+    def __init__(self, path, batch_size, append=False):
+        """
+        Initialize the monitor
+        
+        Args:
+            path (str): JSON-lines file receiving one record per epoch
+            batch_size (int): Number of samples per training batch
+            append (bool): Keep the records already in the file (resumed runs)
+        """
+        super().__init__()
+        self.path = path
+        self.batch_size = batch_size
+        self.append = append
+        self.records = []
+        self._ready = deque()
+    
+    def wrap(self, train_input):
+        """
+        Wrap the training input so batch ready times reach the monitor
+        
+        Args:
+            train_input: tf.keras.utils.Sequence, tf.data.Dataset of batches or
+                DatasetCreator (multi-worker training)
+            
+        Returns:
+            The wrapped input, to pass to fit instead of train_input
+        """
+        DatasetCreator = tf.keras.utils.experimental.DatasetCreator
+        if isinstance(train_input, DatasetCreator):
+            dataset_fn = train_input.dataset_fn
+            return DatasetCreator(lambda context: self.wrap(dataset_fn(context)), train_input.input_options)
+        if isinstance(train_input, tf.data.Dataset):
+            def stamp(*batch):
+                ready = tf.py_function(self._dataset_batch_ready, [], tf.int32)
+                with tf.control_dependencies([ready]):
+                    return tuple(tf.identity(tensor) for tensor in batch)
+            
+            # Not prefetched again, so the stamp runs when the training step pulls the batch
+            return train_input.map(stamp)
+        return TimedSequence(train_input, self)
+    
+    def batch_ready(self):
+        """Record that the next training batch is available"""
+        self._ready.append(time.perf_counter())
+    
+    def _dataset_batch_ready(self):
+        self.batch_ready()
+        return np.int32(0)
+    
+    def reset_ready(self):
+        """Forget ready times of batches that will never be consumed"""
+        self._ready.clear()
+    
+    def on_train_begin(self, logs=None):
+        self.records = []
+        self._warmup = None
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if not self.append:
+            open(self.path, 'w').close()
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._step_times = []
+        self._waits = []
+        self._epoch_warmup = 0.0
+    
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        ready = self._ready.popleft() if self._ready else self._step_start
+        if self._warmup is None:
+            self._warmup = self._epoch_warmup = now - self._step_start
+            return
+        self._step_times.append(now - self._step_start)
+        self._waits.append(min(max(ready - self._step_start, 0.0), now - self._step_start))
+    
+    def on_epoch_end(self, epoch, logs=None):
+        wall = time.perf_counter() - self._epoch_start
+        step_times = np.array(self._step_times) if self._step_times else np.zeros(1)
+        train_seconds = float(step_times.sum())
+        input_wait = float(np.sum(self._waits))
+        rss, peak = memory_usage_mb()
+        
+        record = {
+            'epoch': epoch + 1,
+            'steps': len(self._step_times),
+            'epoch_seconds': round(wall, 3),
+            'warmup_seconds': round(self._epoch_warmup, 3),
+            'train_seconds': round(train_seconds, 3),
+            'step_ms_mean': round(float(step_times.mean()) * 1000, 3),
+            'step_ms_p50': round(float(np.percentile(step_times, 50)) * 1000, 3),
+            'step_ms_p95': round(float(np.percentile(step_times, 95)) * 1000, 3),
+            'input_wait_seconds': round(input_wait, 3),
+            'input_wait_fraction': round(input_wait / max(train_seconds, 1e-9), 4),
+            'samples_per_sec': round(len(self._step_times) * self.batch_size / max(train_seconds, 1e-9), 1),
+            'rss_mb': round(rss, 1) if rss is not None else None,
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        }
+        self.records.append(record)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    
+    def summary(self):
+        """
+        Summarize the recorded epochs and name the bottleneck
+        
+        Returns:
+            dict: Totals over all epochs and the bottleneck ('input' or 'compute')
+        """
+        train_seconds = sum(record['train_seconds'] for record in self.records)
+        input_wait = sum(record['input_wait_seconds'] for record in self.records)
+        steps = sum(record['steps'] for record in self.records)
+        wait_fraction = input_wait / max(train_seconds, 1e-9)
+        peaks = [record['peak_rss_mb'] for record in self.records if record['peak_rss_mb'] is not None]
+        return {
+            'summary': True,
+            'epochs': len(self.records),
+            'steps': steps,
+            'warmup_seconds': round(self._warmup or 0.0, 3),
+            'train_seconds': round(train_seconds, 3),
+            'input_wait_seconds': round(input_wait, 3),
+            'input_wait_fraction': round(wait_fraction, 4),
+            'samples_per_sec': round(steps * self.batch_size / max(train_seconds, 1e-9), 1),
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'bottleneck': 'input' if wait_fraction >= INPUT_BOUND_FRACTION else 'compute',
+        }
+    
+    def on_train_end(self, logs=None):
+        if not self.records:
+            return
+        summary = self.summary()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+        
+        print(f"\nThroughput: {summary['samples_per_sec']:.0f} samples/sec over {summary['steps']} steps; "
+              f"peak memory {summary['peak_rss_mb'] or 0:.0f} MB")
+        if summary['bottleneck'] == 'input':
+            print(f"Bottleneck: input pipeline - steps waited {summary['input_wait_fraction']:.0%} "
+                  f"of their time for the next batch")
+        else:
+            print(f"Bottleneck: model compute - steps waited only {summary['input_wait_fraction']:.0%} "
+                  f"of their time for input")
+        print(f"Throughput metrics saved to {self.path}")
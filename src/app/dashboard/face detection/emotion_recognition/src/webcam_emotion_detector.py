@@ -5,6 +5,7 @@ This script provides a robust GUI for real-time emotion detection using your web
 It includes improved face detection and expression recognition.
 """
 
+from startup_timer import report_startup
 import os
 import cv2
 import numpy as np
@@ -539,6 +540,10 @@ def main():
     # Create application
     app = WebcamEmotionDetector(root)
     
+    # Draw the window before reporting how long startup took
+    root.update()
+    report_startup("webcam_emotion_detector", "window shown")
+    
     # Start main loop
     root.mainloop()
 
@@ -0,0 +1,8 @@
+"""
+Shared test setup: the scripts in src/ import each other as flat modules
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,59 @@
+"""
+Tests for the data preparation pipeline on a small synthetic FER2013 CSV
+"""
+
+import os
+import numpy as np
+import pytest
+import data_preparation
+from processed_store import load_manifest, load_clusters
+
+NUM_UNIQUE = 120
+NUM_COPIES = 10  # Exact copies of the first rows, then as many brightened ones
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """Point the data preparation paths at a synthetic CSV in a temporary directory"""
+    import pandas as pd
+    monkeypatch.setattr(data_preparation, 'FER_DATASET_PATH', str(tmp_path / 'fer2013.csv'))
+    monkeypatch.setattr(data_preparation, 'PROCESSED_DATA_PATH', str(tmp_path / 'processed'))
+    monkeypatch.setattr(data_preparation, 'PIPELINE_CACHE_DIR', str(tmp_path / 'stages'))
+    monkeypatch.setattr(data_preparation, 'DETECTION_CACHE_DIR', str(tmp_path / 'detections'))
+    
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 255, (NUM_UNIQUE, 48 * 48))
+    images = np.concatenate([images, images[:NUM_COPIES], images[NUM_COPIES:2 * NUM_COPIES] + 1])
+    pd.DataFrame({
+        'emotion': np.arange(len(images)) % 7,
+        'pixels': [' '.join(map(str, image)) for image in images],
+    }).to_csv(data_preparation.FER_DATASET_PATH, index=False)
+    return os.path.join(data_preparation.PROCESSED_DATA_PATH, 'opencv')
+
+def test_resplit_invalidates_saved_store(dataset):
+    data_preparation.build_pipeline(seed=42, alignment='prealigned').run('save')
+    data_preparation.resplit_processed_data(seed=7)
+    assert load_manifest(dataset)['splits']['seed'] == 7
+    
+    # A normal run at the original seed has to write its own splits again
+    pipeline = data_preparation.build_pipeline(seed=42, alignment='prealigned')
+    assert not pipeline.is_cached('save')
+    pipeline.run('save')
+    assert load_manifest(dataset)['splits']['seed'] == 42
+    assert pipeline.is_cached('save')
+
+def test_stream_dedupes_like_pipeline(dataset, monkeypatch):
+    data_preparation.build_pipeline(alignment='prealigned').run('save')
+    pipeline_clusters = load_clusters(dataset)
+    
+    detected = []
+    detect_boxes = data_preparation.detect_boxes
+    monkeypatch.setattr(data_preparation, 'detect_boxes',
+                        lambda images, *args, **kwargs: detected.append(len(images)) or detect_boxes(images, *args, **kwargs))
+    data_preparation.stream_preprocess(chunk_size=32, csv_path=data_preparation.FER_DATASET_PATH, use_cache=False)
+    stream_clusters = load_clusters(dataset)
+    
+    # Exact copies never reach face detection; brightened ones share a cluster
+    assert sum(detected) == NUM_UNIQUE + NUM_COPIES
+    assert np.count_nonzero(stream_clusters < 0) == NUM_COPIES
+    np.testing.assert_array_equal(stream_clusters[stream_clusters >= 0], pipeline_clusters)
+    assert len(np.unique(pipeline_clusters)) == NUM_UNIQUE
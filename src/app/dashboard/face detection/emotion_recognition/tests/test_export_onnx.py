@@ -0,0 +1,26 @@
+"""
+Parity test of the ONNX export against Keras
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tf2onnx')
+pytest.importorskip('onnxruntime')
+
+from export_onnx import export_onnx, check_parity, PARITY_ATOL
+from inference_backend import KerasBackend, OnnxBackend
+from model_building import build_model
+
+def test_onnx_matches_keras(tmp_path):
+    model = build_model('separable_cnn_small', summary=False)
+    onnx_path = export_onnx(model, str(tmp_path / 'model.onnx'))
+    
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 256, (64, 48, 48, 1), dtype=np.uint8)
+    y = rng.integers(0, 7, 64)
+    parity = check_parity(KerasBackend(None, model=model), OnnxBackend(onnx_path), X, y)
+    
+    assert parity['max_abs_diff'] <= PARITY_ATOL
+    assert parity['argmax_agreement'] == 1.0
+    assert parity['passed']